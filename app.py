@@ -1,10 +1,14 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, session, flash
+from flask import Flask, render_template, request, redirect, url_for, jsonify, session, flash, Response, stream_with_context
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from dotenv import load_dotenv
 import os
-from models import User, Admin, IngredientAnalysis as Analysis
+from models import User, Admin, IngredientAnalysis as Analysis, IngredientKnowledge, GlobalStats, counters_to_ingredient_stats, ensure_indexes, normalize_analysis, admin_analysis_row
 from services.ocr_service import OCRService
-from services.ingredient_service import IngredientService
+from services.ingredient_service import IngredientService, process_ingredients
+from services.jobs import JobQueue
+from services.llm_schema import response_parser
+from services.token_budget import token_meter
+from services.config import Config
 from pymongo import MongoClient
 from bson import ObjectId
 import base64
@@ -13,7 +17,8 @@ import logging
 from functools import wraps
 import pytesseract
 import traceback
-import re
+import json
+import time
 
 # Load environment variables
 load_dotenv()
@@ -30,6 +35,19 @@ db = client.ingredient_analyzer
 user_model = User(db)
 admin_model = Admin(db)
 analysis_model = Analysis(db)
+stats_model = GlobalStats(db)
+
+# Indexes the model queries rely on
+try:
+    ensure_indexes(db)
+except Exception as e:
+    print(f"Error creating indexes: {str(e)}")
+
+# Counters written before the first rebuild only hold the changes since deploy
+try:
+    stats_model.rebuild_if_needed()
+except Exception as e:
+    print(f"Error rebuilding statistics: {str(e)}")
 
 # Initialize services
 try:
@@ -38,8 +56,12 @@ try:
     print("OCR service initialized successfully")
     
     print("\nInitializing Ingredient service...")
-    ingredient_service = IngredientService()
+    ingredient_service = IngredientService(knowledge=IngredientKnowledge(db))
     print("Ingredient service initialized successfully")
+    
+    # Bounded pool that runs OCR and LLM work off the request threads
+    job_queue = JobQueue(Config.JOB_DB_PATH, workers=Config.JOB_WORKERS, max_attempts=Config.JOB_MAX_ATTEMPTS,
+                         retention_seconds=Config.JOB_RETENTION)
     print("Services initialization complete")
     
 except Exception as e:
@@ -66,6 +88,25 @@ def home():
         return redirect(url_for('dashboard'))
     return redirect(url_for('login'))
 
+@app.route('/health')
+def health():
+    """Report whether the model server is reachable.
+
+    Returns 200 either way: history and dashboards keep working while the
+    model is down, only new analyses are degraded.
+    """
+    llm_status = ingredient_service.llm.status()
+    return jsonify({
+        'status': llm_status['status'],
+        'llm': llm_status,
+        'parser': response_parser.stats(),
+        'tokens': token_meter.stats(),
+        'coalescing': {
+            'ocr': ocr_service.flight.stats(),
+            'analysis': ingredient_service.flight.stats()
+        }
+    })
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -134,34 +175,18 @@ def dashboard():
     is_admin = session.get('is_admin', False)
     
     try:
-        # Get user analyses
+        # Get user analyses as compact listing records, newest first
         if is_admin:
-            # For admin, get all analyses
-            analyses = []
-            users = list(user_model.collection.find())
-            for user in users:
-                user_analyses = analysis_model.get_user_analyses(str(user['_id']))
-                for analysis in user_analyses:
-                    if analysis:
-                        serialized = serialize_analysis(analysis)
-                        if serialized:
-                            serialized['username'] = user.get('username', 'Unknown')
-                            analyses.append(serialized)
+            # For admin, the most recent analyses of all users with their usernames
+            page = max(request.args.get('page', 1, type=int), 1)
+            per_page = Config.DASHBOARD_ANALYSES_PER_PAGE
+            analyses = analysis_model.list_recent_analyses(skip=(page - 1) * per_page, limit=per_page)
         else:
             # For regular users, get only their analyses
-            user_analyses = analysis_model.get_user_analyses(user_id)
-            analyses = []
-            for analysis in user_analyses:
-                if analysis:
-                    serialized = serialize_analysis(analysis)
-                    if serialized:
-                        analyses.append(serialized)
-        
-        # Sort analyses by creation date
-        analyses.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+            analyses, _ = analysis_model.list_user_analyses(user_id)
         
         # Store in session for use in compare view
-        session['analysis_history'] = analyses
+        session['analysis_history'] = [analysis.to_dict() for analysis in analyses]
         
         return render_template('dashboard.html', 
                              analyses=analyses,
@@ -194,6 +219,94 @@ def analyze():
             print("Missing required fields")
             return jsonify({'success': False, 'error': 'Missing type or content field'})
         
+        if data.get('type') not in ('text', 'image'):
+            print(f"Invalid content type: {data.get('type')}")
+            return jsonify({'success': False, 'error': 'Invalid content type'})
+        
+        # OCR and the LLM run on the job workers; the client polls or streams the result
+        user_id = session.get('user_id')
+        job_id = job_queue.submit({'data': data, 'user_id': user_id}, owner=user_id)
+        print(f"Queued analysis job {job_id}")
+        
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': url_for('analysis_job_status', job_id=job_id),
+            'events_url': url_for('analysis_job_events', job_id=job_id)
+        }), 202
+
+    except Exception as e:
+        print(f"General error: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            'success': False, 
+            'error': 'An unexpected error occurred',
+            'details': str(e),
+            'traceback': traceback.format_exc()
+        })
+
+def job_view(job):
+    """Public part of a job for the status endpoint and event stream"""
+    return {
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'stage': job['stage'],
+        'detail': job['detail'],
+        'result': job['result'],
+        'error': job['error']
+    }
+
+def get_own_job(job_id):
+    """Return the job if it belongs to the logged in user"""
+    job = job_queue.get(job_id)
+    if not job or job['owner'] != session.get('user_id'):
+        return None
+    return job
+
+@app.route('/analyze/jobs/<job_id>')
+@login_required
+def analysis_job_status(job_id):
+    job = get_own_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify(job_view(job))
+
+@app.route('/analyze/jobs/<job_id>/events')
+@login_required
+def analysis_job_events(job_id):
+    job = get_own_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    def stream():
+        last = None
+        deadline = time.time() + Config.JOB_STREAM_TIMEOUT
+        while time.time() < deadline:
+            current = job_queue.get(job_id)
+            view = job_view(current)
+            if view != last:
+                event = 'done' if current['status'] in ('done', 'failed') else 'progress'
+                yield f"event: {event}\ndata: {json.dumps(view)}\n\n"
+                if event == 'done':
+                    return
+                last = view
+            # Woken early when a worker in this process updates a job
+            job_queue.wait_for_change(1.0)
+        yield "event: timeout\ndata: {}\n\n"
+    
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@job_queue.handler
+def run_analysis_job(job_id, payload, progress):
+    """Job worker entry point for queued /analyze requests"""
+    print(f"Running analysis job {job_id}")
+    return run_analysis(payload['data'], payload['user_id'], progress)
+
+def run_analysis(data, user_id, progress):
+    """OCR (for images), analyse and save one product. Returns the response body."""
+    try:
         content_type = data.get('type')
         content = data.get('content')
         product_name = data.get('product_name', '').strip()
@@ -205,6 +318,7 @@ def analyze():
             product_name = 'Unnamed Product'
 
         # Extract text based on content type
+        ocr_result = None
         if content_type == 'text':
             print("Processing text input...")
             extracted_text = content.strip()
@@ -217,50 +331,54 @@ def analyze():
                     content = content.split('base64,')[1]
                 
                 print("Calling OCR service...")
-                extracted_text = ocr_service.extract_text_from_base64(content)
+                progress('ocr')
+                ocr_result = ocr_service.extract_result_from_base64(content)
+                extracted_text = ocr_result['text']
                 print(f"OCR Result: {extracted_text[:100]}...")
                 
             except Exception as e:
                 print(f"Image processing error: {str(e)}")
                 import traceback
                 traceback.print_exc()
-                return jsonify({
+                return {
                     'success': False, 
                     'error': f'Image processing failed: {str(e)}',
                     'traceback': traceback.format_exc()
-                })
+                }
         else:
             print(f"Invalid content type: {content_type}")
-            return jsonify({'success': False, 'error': 'Invalid content type'})
+            return {'success': False, 'error': 'Invalid content type'}
 
         if not extracted_text or len(extracted_text.strip()) < 3:
             print("No text extracted")
-            return jsonify({'success': False, 'error': 'No text could be extracted from the input'})
+            return {'success': False, 'error': 'No text could be extracted from the input'}
 
         # Analyze ingredients
         try:
             print("Analyzing ingredients...")
+            progress('analyzing')
             print(f"Input text: {extracted_text[:100]}...")
             
-            # Process ingredients
-            ingredients = process_ingredients(extracted_text)
-            if not ingredients:
-                print("No ingredients found")
-                return jsonify({'success': False, 'error': 'No ingredients could be identified'})
+            # A near-duplicate of an already analysed image reuses that analysis
+            analysis_result = reuse_image_analysis(ocr_result)
             
-            print(f"Found ingredients: {ingredients[:5]}...")
+            if analysis_result is None:
+                # Process ingredients
+                ingredients = process_ingredients(extracted_text)
+                if not ingredients:
+                    print("No ingredients found")
+                    return {'success': False, 'error': 'No ingredients could be identified'}
+                
+                print(f"Found ingredients: {ingredients[:5]}...")
+                
+                # Analyze with OpenAI
+                analysis_result = analyze_with_ai(ingredients, progress)
             
-            # Analyze with OpenAI
-            analysis_result = analyze_with_ai(ingredients)
             if not analysis_result:
+                # analyze_with_ai has already logged the cause
                 error_msg = "Failed to analyze ingredients"
-                if "quota exceeded" in str(e).lower() or "insufficient_quota" in str(e).lower():
-                    error_msg = (
-                        "The AI service is currently unavailable due to API quota limits. "
-                        "Please try again later or contact support for assistance."
-                    )
                 print("AI analysis failed:", error_msg)
-                return jsonify({'success': False, 'error': error_msg})
+                return {'success': False, 'error': error_msg}
             
             print("Analysis successful")
             print(f"Health score: {analysis_result.get('health_score')}")
@@ -272,7 +390,7 @@ def analyze():
             # Save to database
             try:
                 print("Saving to database...")
-                user_id = session.get('user_id')
+                progress('saving')
                 
                 # Ensure health score is in 0-10 range
                 if analysis_result['health_score'] > 10:
@@ -282,43 +400,47 @@ def analyze():
                 
                 if not analysis_id:
                     print("Failed to save to database")
-                    return jsonify({'success': False, 'error': 'Failed to save analysis'})
+                    return {'success': False, 'error': 'Failed to save analysis'}
                     
                 print("Successfully saved to database")
                 
+                # Let later re-shoots of this label reuse the analysis
+                if ocr_result and ocr_result.get('phash') is not None and ocr_service.image_index is not None:
+                    ocr_service.image_index.attach_analysis(ocr_result['phash'], analysis_id)
+                
             except Exception as e:
                 print(f"Database error: {str(e)}")
-                return jsonify({'success': False, 'error': 'Failed to save analysis'})
+                return {'success': False, 'error': 'Failed to save analysis'}
 
-            return jsonify({
+            return {
                 'success': True,
                 'product_name': product_name,
                 'health_score': analysis_result['health_score'],
                 'ingredients': analysis_result['ingredients'],
                 'ingredient_percentages': analysis_result['ingredient_percentages']
-            })
+            }
 
         except Exception as e:
             print(f"Analysis error: {str(e)}")
             import traceback
             traceback.print_exc()
-            return jsonify({
+            return {
                 'success': False, 
                 'error': 'Failed to analyze ingredients',
                 'details': str(e),
                 'traceback': traceback.format_exc()
-            })
+            }
 
     except Exception as e:
         print(f"General error: {str(e)}")
         import traceback
         traceback.print_exc()
-        return jsonify({
+        return {
             'success': False, 
             'error': 'An unexpected error occurred',
             'details': str(e),
             'traceback': traceback.format_exc()
-        })
+        }
 
 @app.route('/analyze_with_ai', methods=['POST'])
 @login_required
@@ -333,9 +455,8 @@ def analyze_with_ai():
             return jsonify({'error': 'Empty ingredients text'}), 400
             
         # Here we'll add OpenAI integration later
-        # For now, just use our basic analyzer
-        analyzer = IngredientService()
-        result = analyzer.analyze_ingredients(ingredients_text)
+        # For now, just use our basic analyzer (shared, so its cache is reused)
+        result = ingredient_service.analyze_ingredients(ingredients_text)
         
         if not result.get('success', False):
             return jsonify({'error': f'Analysis failed: {result.get("error", "Unknown error")}'})
@@ -362,61 +483,21 @@ def analyze_with_ai():
 def history():
     try:
         user_id = session.get('user_id')
-        page = request.args.get('page', 1, type=int)
         per_page = 10
-        skip = (page - 1) * per_page
         
-        # Get analyses from database
-        analyses = analysis_model.get_user_analyses(user_id, skip=skip, limit=per_page)
-        
-        # Process analyses for display
-        processed_analyses = []
-        for analysis in analyses:
-            # Format created_at date
-            if 'created_at' in analysis:
-                created_at = analysis['created_at']
-                if isinstance(created_at, str):
-                    try:
-                        created_at = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S')
-                    except:
-                        try:
-                            created_at = datetime.strptime(created_at, '%Y-%m-%dT%H:%M:%S')
-                        except:
-                            created_at = datetime.now()
-                analysis['created_at'] = created_at.strftime('%B %d, %Y %I:%M %p')
-            
-            # Ensure we have ingredient percentages
-            if 'ingredient_percentages' not in analysis:
-                analysis['ingredient_percentages'] = {
-                    'Natural': 0,
-                    'Additives': 0,
-                    'Preservatives': 0,
-                    'Artificial Colors': 0,
-                    'Highly Processed': 0
-                }
-            
-            if 'health_score' not in analysis:
-                analysis['health_score'] = 0
-                
-            if 'product_name' not in analysis:
-                analysis['product_name'] = 'Unnamed Product'
-                
-            if 'ingredients_text' not in analysis:
-                analysis['ingredients_text'] = 'No ingredients listed'
-                
-            processed_analyses.append(analysis)
-        
-        # Sort by created_at date
-        processed_analyses.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-        
-        # Check if there are more pages
-        total_analyses = len(processed_analyses)
-        has_next = total_analyses == per_page
+        # Get analyses from database, continuing after the previous page if given
+        try:
+            analyses, next_cursor = analysis_model.list_user_analyses(
+                user_id, limit=per_page, cursor=request.args.get('cursor')
+            )
+        except ValueError:
+            flash("That page of your history is no longer available", 'error')
+            return redirect(url_for('history'))
         
         return render_template('history_new.html', 
-                             analyses=processed_analyses,
-                             page=page,
-                             has_next=has_next)
+                             analyses=analyses,
+                             next_cursor=next_cursor,
+                             has_next=next_cursor is not None)
                              
     except Exception as e:
         logger.error(f"Error loading history: {str(e)}")
@@ -428,54 +509,35 @@ def history():
 def compare_page():
     try:
         user_id = session.get('user_id')
-        analyses = analysis_model.get_user_analyses(user_id, skip=0, limit=100)
-        
-        # Process analyses for display
-        processed_analyses = []
-        for analysis in analyses:
-            # Format created_at date
-            if 'created_at' in analysis:
-                created_at = analysis['created_at']
-                if isinstance(created_at, str):
-                    try:
-                        created_at = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S')
-                    except:
-                        try:
-                            created_at = datetime.strptime(created_at, '%Y-%m-%dT%H:%M:%S')
-                        except:
-                            created_at = datetime.now()
-                analysis['date'] = created_at.strftime('%Y-%m-%d %H:%M')
-            else:
-                analysis['date'] = datetime.now().strftime('%Y-%m-%d %H:%M')
-            
-            # Ensure we have ingredient percentages
-            if 'ingredient_percentages' not in analysis:
-                analysis['ingredient_percentages'] = {
-                    'Natural': 0,
-                    'Additives': 0,
-                    'Preservatives': 0,
-                    'Artificial Colors': 0,
-                    'Highly Processed': 0
-                }
-                
-            if 'health_score' not in analysis:
-                analysis['health_score'] = 0
-                
-            if 'product_name' not in analysis:
-                analysis['product_name'] = 'Unnamed Product'
-                
-            if 'ingredients_text' not in analysis:
-                analysis['ingredients_text'] = 'No ingredients listed'
-                
-            processed_analyses.append(analysis)
+        # The pickers load further pages on demand from /api/analyses
+        analyses, next_cursor = analysis_model.list_user_analyses(user_id, limit=Config.COMPARE_PAGE_SIZE)
         
-        return render_template('compare.html', analyses=processed_analyses)
+        return render_template('compare.html', analyses=analyses, next_cursor=next_cursor)
         
     except Exception as e:
         logger.error(f"Error in compare page: {str(e)}")
         flash(f"Error loading comparison page: {str(e)}", 'error')
         return redirect(url_for('dashboard'))
 
+@app.route('/api/analyses')
+@login_required
+def api_analyses():
+    """Next page of the current user's analyses for the compare pickers"""
+    try:
+        analyses, next_cursor = analysis_model.list_user_analyses(
+            session.get('user_id'),
+            limit=Config.COMPARE_PAGE_SIZE,
+            cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'analyses': [analysis.to_dict() for analysis in analyses],
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    })
+
 @app.route('/compare_analyses', methods=['POST'])
 @login_required
 def compare_analyses():
@@ -492,37 +554,21 @@ def compare_analyses():
         analyses = []
         for analysis_id in analysis_ids:
             try:
-                analysis = analysis_model.collection.find_one({'_id': ObjectId(analysis_id)})
+                # The full document is only fetched here, on drill-down
+                analysis = analysis_model.get_analysis_by_id(analysis_id)
                 if analysis:
-                    # Convert ObjectId to string for JSON serialization
+                    normalize_analysis(analysis)
+                    
+                    # Convert ObjectId and datetime for JSON serialization
                     analysis['_id'] = str(analysis['_id'])
                     if 'user_id' in analysis:
                         analysis['user_id'] = str(analysis['user_id'])
-                    if 'created_at' in analysis:
+                    if analysis['created_at']:
                         analysis['created_at'] = analysis['created_at'].strftime('%Y-%m-%d %H:%M:%S')
                     
-                    # Ensure we have ingredient percentages
-                    if 'ingredient_percentages' not in analysis:
-                        analysis['ingredient_percentages'] = {
-                            'Natural': 0,
-                            'Additives': 0,
-                            'Preservatives': 0,
-                            'Artificial Colors': 0,
-                            'Highly Processed': 0
-                        }
-                    
                     # For backward compatibility with UI
                     analysis['ingredient_categories'] = analysis['ingredient_percentages']
                     
-                    if 'health_score' not in analysis:
-                        analysis['health_score'] = 0
-                        
-                    if 'product_name' not in analysis:
-                        analysis['product_name'] = 'Unnamed Product'
-                        
-                    if 'ingredients_text' not in analysis:
-                        analysis['ingredients_text'] = 'No ingredients listed'
-                    
                     analyses.append(analysis)
             except Exception as e:
                 print(f"Error processing analysis {analysis_id}: {str(e)}")
@@ -552,132 +598,30 @@ def admin():
         return redirect(url_for('dashboard'))
     
     try:
-        # Get all users with their analyses
-        users = list(user_model.collection.find())
-        total_users = len(users)
-        total_analyses = 0
-        
-        # Initialize ingredient statistics
-        ingredient_stats = {
-            'total_ingredients': 0,
-            'natural_ingredients': 0,
-            'additives': 0,
-            'preservatives': 0,
-            'artificial_colors': 0,
-            'highly_processed': 0,
-            'harmful_ingredients': 0,
-            'total_products': 0,
-            'avg_health_score': 0.0,
-            'health_score_distribution': {
-                'excellent': 0,  # 8-10
-                'good': 0,      # 6-7.9
-                'fair': 0,      # 5-5.9
-                'poor': 0       # 0-4.9
-            }
-        }
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = Config.ADMIN_USERS_PER_PAGE
+        
+        # One page of users with their statistics and recent analyses from a single
+        # aggregation; the global statistics are read from the stats collection
+        users = user_model.get_users_overview(
+            skip=(page - 1) * per_page,
+            limit=per_page,
+            analyses_per_user=Config.ADMIN_ANALYSES_PER_USER
+        )
+        counters = stats_model.get()
+        ingredient_stats = counters_to_ingredient_stats(counters)
+        total_users = counters.get('total_users', 0)
+        total_analyses = ingredient_stats['total_products']
         
-        # Get analyses for each user
         user_data = []
-        all_health_scores = []
-        
         for user in users:
-            user_id = str(user['_id'])
-            
-            # Get user's analyses
-            analyses = list(analysis_model.collection.find({"user_id": user_id}).sort("created_at", -1))
-            total_analyses += len(analyses)
-            
-            # Process each analysis for ingredient statistics
-            user_ingredients = {
-                'total': 0,
-                'natural': 0,
-                'additives': 0,
-                'preservatives': 0,
-                'artificial_colors': 0,
-                'highly_processed': 0,
-                'harmful': 0
-            }
-            
-            user_health_scores = []
-            
-            for analysis in analyses:
-                # Update product count
-                ingredient_stats['total_products'] += 1
-                
-                # Get health score
-                health_score = analysis.get('health_score', 0)
-                user_health_scores.append(health_score)
-                all_health_scores.append(health_score)
-                
-                # Update health score distribution
-                if health_score >= 8:
-                    ingredient_stats['health_score_distribution']['excellent'] += 1
-                elif health_score >= 6:
-                    ingredient_stats['health_score_distribution']['good'] += 1
-                elif health_score >= 5:
-                    ingredient_stats['health_score_distribution']['fair'] += 1
-                else:
-                    ingredient_stats['health_score_distribution']['poor'] += 1
-                
-                # Process ingredients
-                ingredients = analysis.get('ingredients', [])
-                for ingredient in ingredients:
-                    category = ingredient.get('category', 'Unknown')
-                    is_harmful = ingredient.get('is_harmful', False)
-                    
-                    # Update global stats
-                    ingredient_stats['total_ingredients'] += 1
-                    if category == 'Natural':
-                        ingredient_stats['natural_ingredients'] += 1
-                    elif category == 'Additives':
-                        ingredient_stats['additives'] += 1
-                    elif category == 'Preservatives':
-                        ingredient_stats['preservatives'] += 1
-                    elif category == 'Artificial Colors':
-                        ingredient_stats['artificial_colors'] += 1
-                    elif category == 'Highly Processed':
-                        ingredient_stats['highly_processed'] += 1
-                    
-                    if is_harmful:
-                        ingredient_stats['harmful_ingredients'] += 1
-                    
-                    # Update user stats
-                    user_ingredients['total'] += 1
-                    if category == 'Natural':
-                        user_ingredients['natural'] += 1
-                    elif category == 'Additives':
-                        user_ingredients['additives'] += 1
-                    elif category == 'Preservatives':
-                        user_ingredients['preservatives'] += 1
-                    elif category == 'Artificial Colors':
-                        user_ingredients['artificial_colors'] += 1
-                    elif category == 'Highly Processed':
-                        user_ingredients['highly_processed'] += 1
-                    
-                    if is_harmful:
-                        user_ingredients['harmful'] += 1
-            
-            # Calculate user's average health score
-            avg_health_score = sum(user_health_scores) / len(user_health_scores) if user_health_scores else 0
-            
-            # Format user data
-            user_info = {
-                'id': user_id,
+            user_data.append({
+                'id': str(user['_id']),
                 'username': user['username'],
                 'email': user['email'],
                 'created_at': user['created_at'],
                 'is_active': user.get('is_active', True),
-                'analyses': [],
-                'stats': {
-                    'total_analyses': len(analyses),
-                    'avg_health_score': avg_health_score,
-                    'ingredients': user_ingredients
-                }
-            }
-            
-            # Format analyses
-            for analysis in analyses:
-                formatted_analysis = {
+                'analyses': [{
                     'id': str(analysis['_id']),
                     'created_at': analysis['created_at'],
                     'product_name': analysis.get('product_name', 'Unnamed Product'),
@@ -686,32 +630,20 @@ def admin():
                     'ingredients': analysis.get('ingredients', []),
                     'ingredient_percentages': analysis.get('ingredient_percentages', {}),
                     'warnings': analysis.get('warnings', [])
-                }
-                user_info['analyses'].append(formatted_analysis)
-            
-            user_data.append(user_info)
-        
-        # Calculate overall average health score
-        ingredient_stats['avg_health_score'] = sum(all_health_scores) / len(all_health_scores) if all_health_scores else 0
-        
-        # Calculate percentages for ingredient distribution
-        total_ingredients = ingredient_stats['total_ingredients']
-        if total_ingredients > 0:
-            ingredient_stats['natural_percentage'] = (ingredient_stats['natural_ingredients'] / total_ingredients) * 100
-            ingredient_stats['additives_percentage'] = (ingredient_stats['additives'] / total_ingredients) * 100
-            ingredient_stats['preservatives_percentage'] = (ingredient_stats['preservatives'] / total_ingredients) * 100
-            ingredient_stats['artificial_colors_percentage'] = (ingredient_stats['artificial_colors'] / total_ingredients) * 100
-            ingredient_stats['highly_processed_percentage'] = (ingredient_stats['highly_processed'] / total_ingredients) * 100
-            ingredient_stats['harmful_percentage'] = (ingredient_stats['harmful_ingredients'] / total_ingredients) * 100
+                } for analysis in user['analyses']],
+                'stats': user['stats']
+            })
         
         return render_template(
             'admin.html',
             users=user_data,
+            page=page,
+            has_next=page * per_page < total_users,
             stats={
                 'total_users': total_users,
                 'total_analyses': total_analyses,
                 'avg_analyses_per_user': total_analyses / total_users if total_users > 0 else 0,
-                'active_users': len([u for u in users if u.get('is_active', True)]),
+                'active_users': counters.get('active_users', 0),
                 'ingredients': ingredient_stats
             }
         )
@@ -719,7 +651,7 @@ def admin():
     except Exception as e:
         print(f"Admin page error: {str(e)}")
         flash("Error loading admin data", "error")
-        return render_template('admin.html', users=[], stats={})
+        return render_template('admin.html', users=[], stats={}, page=1, has_next=False)
 
 @app.route('/admin/user/<user_id>/analyses')
 @login_required
@@ -728,16 +660,22 @@ def admin_user_analyses(user_id):
         return jsonify({'error': 'Unauthorized'}), 403
         
     try:
-        analyses = list(analysis_model.collection.find({"user_id": user_id}).sort("created_at", -1))
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        try:
+            analyses, next_cursor = analysis_model.get_user_analyses(
+                user_id, limit=limit, cursor=request.args.get('cursor'),
+                projection={
+                    'created_at': 1, 'product_name': 1, 'health_score': 1,
+                    'ingredients.is_harmful': 1
+                }
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         return jsonify({
-            'analyses': [{
-                'id': str(a['_id']),
-                'created_at': a['created_at'].isoformat(),
-                'product_name': a.get('product_name', 'Unnamed Product'),
-                'health_score': a.get('health_score', 0),
-                'ingredients_count': len(a.get('ingredients', [])),
-                'harmful_ingredients': len([i for i in a.get('ingredients', []) if i.get('is_harmful', False)])
-            } for a in analyses]
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
+            # Older analyses may hold created_at as a string or not at all
+            'analyses': [admin_analysis_row(a) for a in analyses]
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -749,33 +687,17 @@ def admin_stats():
         return jsonify({'error': 'Unauthorized'}), 403
         
     try:
-        # Get overall statistics
-        total_users = user_model.collection.count_documents({})
-        total_analyses = analysis_model.collection.count_documents({})
-        active_users = user_model.collection.count_documents({'is_active': True})
-        
-        # Get analysis trends (last 7 days)
-        now = datetime.datetime.utcnow()
-        week_ago = now - datetime.timedelta(days=7)
-        daily_analyses = list(analysis_model.collection.aggregate([
-            {
-                '$match': {
-                    'created_at': {'$gte': week_ago}
-                }
-            },
-            {
-                '$group': {
-                    '_id': {
-                        '$dateToString': {
-                            'format': '%Y-%m-%d',
-                            'date': '$created_at'
-                        }
-                    },
-                    'count': {'$sum': 1}
-                }
-            },
-            {'$sort': {'_id': 1}}
-        ]))
+        # Maintained incrementally in the stats collection
+        counters = stats_model.get()
+        total_users = counters.get('total_users', 0)
+        total_analyses = counters.get('total_products', 0)
+        active_users = counters.get('active_users', 0)
+        
+        # Analysis trends (last 7 days)
+        daily_analyses = [
+            {'_id': day['date'], 'count': day['analyses']}
+            for day in stats_model.get_daily(days=7)
+        ]
         
         return jsonify({
             'total_users': total_users,
@@ -793,13 +715,14 @@ def api_admin_stats():
     if not session.get('is_admin', False):
         return jsonify({'error': 'Unauthorized'}), 401
     
-    # Get stats from database
+    # Get stats from the stats collection
     try:
-        # Placeholder data - replace with actual database queries
+        counters = stats_model.get()
+        today = stats_model.get_daily(days=1)[0]
         stats = {
-            'totalUsers': 10,
-            'totalAnalyses': 50,
-            'activeToday': 5
+            'totalUsers': counters.get('total_users', 0),
+            'totalAnalyses': counters.get('total_products', 0),
+            'activeToday': today['active_users']
         }
         return jsonify(stats)
     except Exception as e:
@@ -879,7 +802,7 @@ def test_ocr():
             
             print("Testing OCR service...")
             print("Tesseract path:", pytesseract.pytesseract.tesseract_cmd)
-            print("Tesseract exists:", os.path.exists(pytesseract.pytesseract.tesseract_cmd))
+            print("OCR backend:", ocr_service.backend.name)
             
             extracted_text = ocr_service.extract_text_from_base64(content)
             print("Extracted text:", extracted_text[:100] if extracted_text else "No text extracted")
@@ -888,7 +811,7 @@ def test_ocr():
                 'success': True,
                 'text': extracted_text,
                 'tesseract_path': pytesseract.pytesseract.tesseract_cmd,
-                'tesseract_exists': os.path.exists(pytesseract.pytesseract.tesseract_cmd)
+                'tesseract_exists': ocr_service.engine_available()
             })
             
         except Exception as e:
@@ -900,7 +823,7 @@ def test_ocr():
                 'error': str(e),
                 'traceback': traceback.format_exc(),
                 'tesseract_path': pytesseract.pytesseract.tesseract_cmd,
-                'tesseract_exists': os.path.exists(pytesseract.pytesseract.tesseract_cmd)
+                'tesseract_exists': ocr_service.engine_available()
             })
             
     except Exception as e:
@@ -909,45 +832,19 @@ def test_ocr():
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e), 'traceback': traceback.format_exc()})
 
-def process_ingredients(text):
-    """Process and clean ingredients text."""
-    if not text:
-        return []
-        
-    # Remove common prefixes
-    text = re.sub(r'^ingredients:?\s*', '', text.lower(), flags=re.IGNORECASE)
+def analyze_with_ai(ingredients, progress=None):
+    """Analyze ingredients using the ingredient service.
     
-    # Split ingredients by common delimiters
-    ingredients = re.split(r'[,;.]', text)
-    
-    # Clean and filter ingredients
-    cleaned_ingredients = []
-    for ingredient in ingredients:
-        # Clean the ingredient
-        ingredient = ingredient.strip()
-        ingredient = re.sub(r'\([^)]*\)', '', ingredient)  # Remove parentheses and their contents
-        ingredient = re.sub(r'\s+', ' ', ingredient)  # Normalize whitespace
-        
-        # Skip if too short or empty
-        if len(ingredient) < 2:
-            continue
-            
-        # Skip if it's just numbers or symbols
-        if re.match(r'^[\d\W]+$', ingredient):
-            continue
-            
-        cleaned_ingredients.append(ingredient)
-    
-    return cleaned_ingredients
-
-def analyze_with_ai(ingredients):
-    """Analyze ingredients using the ingredient service."""
+    When a job progress callback is given the model output is streamed and
+    partial progress is forwarded to the client.
+    """
     try:
         # Join ingredients into a text string
         ingredients_text = ', '.join(ingredients)
         
         # Use the ingredient service to analyze
-        result = ingredient_service.analyze_ingredients(ingredients_text)
+        on_progress = (lambda detail: progress('analyzing', detail)) if progress else None
+        result = ingredient_service.analyze_ingredients(ingredients_text, on_progress=on_progress)
         
         if not result:
             print("No result from ingredient service")
@@ -959,6 +856,27 @@ def analyze_with_ai(ingredients):
         print(f"Error in analyze_with_ai: {str(e)}")
         return None
 
+def reuse_image_analysis(ocr_result):
+    """Return the stored analysis of a near-duplicate image, or None."""
+    if not ocr_result or not ocr_result.get('analysis_id'):
+        return None
+    
+    try:
+        previous = analysis_model.get_analysis_by_id(ocr_result['analysis_id'])
+        if not previous:
+            return None
+        
+        print(f"Reusing analysis {ocr_result['analysis_id']} of a near-duplicate image")
+        return {
+            'health_score': previous.get('health_score', 0),
+            'ingredients': previous.get('ingredients', []),
+            'ingredient_percentages': previous.get('ingredient_percentages', {})
+        }
+        
+    except Exception as e:
+        print(f"Error reusing analysis: {str(e)}")
+        return None
+
 def serialize_mongo_doc(doc):
     """Convert MongoDB document to JSON-serializable format"""
     if isinstance(doc, dict):
@@ -972,51 +890,9 @@ def serialize_mongo_doc(doc):
     else:
         return doc
 
-def serialize_analysis(analysis):
-    if not analysis:
-        return None
-    
-    try:
-        # Convert ObjectId to string
-        analysis['_id'] = str(analysis['_id'])
-        analysis['user_id'] = str(analysis['user_id'])
-        
-        # Convert datetime to string
-        if 'created_at' in analysis:
-            analysis['created_at'] = analysis['created_at'].strftime('%Y-%m-%d %H:%M:%S')
-            
-        # Ensure we have product name
-        if 'product_name' not in analysis:
-            analysis['product_name'] = 'Unnamed Product'
-            
-        # Handle undefined values in analysis_result
-        if 'analysis_result' in analysis:
-            result = analysis['analysis_result']
-            if isinstance(result, dict):
-                if 'ingredients' in result:
-                    result['ingredients'] = [i for i in result['ingredients'] if i is not None]
-                if 'health_score' not in result:
-                    result['health_score'] = 0
-                    
-        return analysis
-    except Exception as e:
-        print(f"Error serializing analysis: {str(e)}")
-        return None
-
 def calculate_health_score(percentages):
     """Calculate health score based on ingredient percentages"""
-    weights = {
-        'Natural': 1.0,
-        'Additives': -0.3,
-        'Preservatives': -0.3,
-        'Artificial Colors': -0.2,
-        'Highly Processed': -0.4
-    }
-    
-    score = sum(percentages[cat] * weights[cat] for cat in percentages)
-    # Normalize to 0-10 range
-    normalized_score = min(max(5 + score/20, 0), 10)
-    return round(normalized_score, 1)
+    return ingredient_service.calculate_health_score(percentages)
 
 if __name__ == '__main__':
     # Check MongoDB connection and list users
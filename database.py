@@ -1,7 +1,7 @@
 from datetime import datetime
 import bcrypt
 from pymongo import MongoClient
-from pymongo.errors import DuplicateKeyError
+from models import ensure_indexes
 
 class Database:
     def __init__(self, db_name="ingredient_analyzer"):
@@ -12,11 +12,8 @@ class Database:
             self.users = self.db.users
             self.admins = self.db.admins
             
-            # Create unique indexes
-            self.users.create_index("username", unique=True)
-            self.users.create_index("email", unique=True)
-            self.admins.create_index("username", unique=True)
-            self.admins.create_index("email", unique=True)
+            # Create the indexes declared by the models
+            ensure_indexes(self.db)
             
             print("Successfully connected to MongoDB")
         except Exception as e:
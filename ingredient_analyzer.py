@@ -5,8 +5,15 @@ from dotenv import load_dotenv
 import numpy as np
 import cv2
 from PIL import Image
-import pytesseract
-import re
+from services.preprocessing import open_image, to_gray, normalize_resolution
+from services.ocr_service import OCRService, get_ocr_backend
+from services.streaming import read_json_stream
+from services.llm_client import get_llm_client, LLMUnavailableError
+from services.llm_schema import DETAILED_ANALYSIS_SCHEMA, AnalysisParseError, response_parser
+from services.prompts import get_prompt
+from services.token_budget import token_budget, token_meter
+from services.ingredient_service import split_ingredients, align_labels
+from services.scoring import score_ingredients, category_percentages, classification_summary, ingredient_health_score
 
 # Load environment variables
 load_dotenv()
@@ -21,40 +28,17 @@ else:
 class IngredientAnalyzer:
     def __init__(self):
         self.categories = ["Natural", "Additives", "Preservatives", "Artificial Colors", "Highly Processed"]
-        self.ollama_url = "http://localhost:11434/api/generate"
-        
-        # Set up the system instruction
-        self.system_instruction = """Return a JSON object analyzing the ingredients. Format:
-{
-  "ingredients": [{"name": "string", "category": "string", "processing_score": 1-5, "health_impact_score": 1-5, "nutrient_density_score": 1-5}],
-  "classification_summary": {"Natural": [], "Additives": [], "Preservatives": [], "Artificial Colors": [], "Highly Processed": []},
-  "ingredient_percentages": {"category": 0-100},
-  "health_score": 0-10
-}
-
-Categories: Natural (whole foods), Additives (flavor/texture), Preservatives, Artificial Colors, Highly Processed
-Scores: Processing (1=least), Health (1=best), Nutrient (1=least), Overall (0-10, higher=better)
-
-Return ONLY valid JSON."""
+        self.llm = get_llm_client()
+        self.model = "deepseek-r1:8b"
+        self.prompt = get_prompt('detailed_analysis')
     
     def preprocess_image_for_ocr(self, image):
         """Apply preprocessing steps to improve OCR accuracy"""
-        # Convert PIL image to numpy array
-        img_array = np.array(image)
-        
-        # Convert to grayscale if needed
-        if len(img_array.shape) == 3:
-            gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-        else:
-            gray = img_array
+        # Convert to grayscale
+        gray = to_gray(image)
         
-        # Resize image to have a minimum width while maintaining aspect ratio
-        min_width = 2000
-        if gray.shape[1] < min_width:
-            scale = min_width / gray.shape[1]
-            width = int(gray.shape[1] * scale)
-            height = int(gray.shape[0] * scale)
-            gray = cv2.resize(gray, (width, height), interpolation=cv2.INTER_CUBIC)
+        # Scale so the text is at the size Tesseract reads best
+        gray = normalize_resolution(gray)
         
         # Apply bilateral filter to reduce noise while preserving edges
         denoised = cv2.bilateralFilter(gray, 11, 85, 85)
@@ -118,7 +102,7 @@ Return ONLY valid JSON."""
         """Extract text from image using improved OCR"""
         try:
             # Load and preprocess image
-            image = Image.open(image_path)
+            image = open_image(image_path)
             processed_binary, processed_otsu = self.preprocess_image_for_ocr(image)
             
             # Save processed versions for debugging
@@ -130,19 +114,12 @@ Return ONLY valid JSON."""
             # Configure Tesseract parameters
             custom_config = r'''--oem 3 --psm 6 
                 -c tessedit_char_whitelist="ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789(),.% "
-                -c tessedit_write_images=true
                 -c page_separator=""'''
             
-            # Try OCR on both versions
-            text1 = pytesseract.image_to_string(
-                processed_binary,
-                config=custom_config
-            )
-            
-            text2 = pytesseract.image_to_string(
-                processed_otsu,
-                config=custom_config
-            )
+            # Try OCR on both versions using the shared, warm OCR engines
+            backend = get_ocr_backend()
+            text1 = OCRService.text_from_data(backend.image_to_data(processed_binary, custom_config))
+            text2 = OCRService.text_from_data(backend.image_to_data(processed_otsu, custom_config))
             
             # Use the longer text (usually better quality)
             text = text1 if len(text1) > len(text2) else text2
@@ -171,7 +148,7 @@ Return ONLY valid JSON."""
                 'error': str(e)
             }
 
-    def analyze_ingredients(self, ingredients_text):
+    def analyze_ingredients(self, ingredients_text, on_progress=None):
         """Analyze ingredients using Ollama"""
         try:
             # Clean up ingredients text
@@ -184,77 +161,47 @@ Return ONLY valid JSON."""
                 }
             
             # Create the Ollama API request
+            prompt = self.prompt.render(ingredients=ingredients_text)
             payload = {
-                "model": "deepseek-r1:8b",
-                "prompt": f"{self.system_instruction}\n\nIngredients to analyze:\n{ingredients_text}\n\nResponse (JSON only):",
-                "stream": False
+                "model": self.model,
+                "prompt": prompt,
+                "format": DETAILED_ANALYSIS_SCHEMA,
+                "stream": True
             }
+            payload.update(token_budget.request_fields(self.prompt, prompt, len(split_ingredients(ingredients_text))))
             
-            response = requests.post(self.ollama_url, json=payload)
-            
-            if response.status_code != 200:
-                return {
-                    'success': False,
-                    'result': None,
-                    'error': f"Ollama API error: {response.status_code}"
-                }
-            
-            result = response.json()
-            if 'response' not in result:
+            try:
+                response = self.llm.generate(payload)
+            except LLMUnavailableError as e:
                 return {
                     'success': False,
                     'result': None,
-                    'error': "Invalid response from Ollama"
+                    'error': f"Ollama unavailable: {str(e)}"
                 }
-            
-            # Try to extract JSON from the response
-            json_str = result['response']
-            json_str = json_str.strip()
-            
-            # Remove any text before the first { and after the last }
-            start_idx = json_str.find('{')
-            end_idx = json_str.rfind('}')
-            
-            if start_idx == -1 or end_idx == -1:
+            except requests.exceptions.HTTPError as e:
                 return {
                     'success': False,
                     'result': None,
-                    'error': "No JSON object found in response"
+                    'error': f"Ollama API error: {e.response.status_code}"
                 }
             
-            json_str = json_str[start_idx:end_idx + 1]
-            
-            # Remove any markdown code block markers
-            json_str = json_str.replace('```json', '').replace('```', '')
-            
-            # Remove any line comments
-            json_str = '\n'.join(line for line in json_str.split('\n') if not line.strip().startswith('//'))
-            
-            # Remove any trailing commas before closing braces
-            json_str = re.sub(r',(\s*[}\]])', r'\1', json_str)
+            # Read the stream until the JSON object is complete, then stop generation
+            stream_stats = {}
+            json_str = read_json_stream(response, on_progress, stats=stream_stats)
+            token_meter.record(self.prompt.key, stream_stats)
             
             try:
-                analysis = json.loads(json_str)
-                
-                # Validate required fields
-                required_fields = ["ingredients", "classification_summary", "ingredient_percentages", "health_score"]
-                missing_fields = [field for field in required_fields if field not in analysis]
-                
-                if missing_fields:
-                    return {
-                        'success': False,
-                        'result': None,
-                        'error': f"Missing required fields: {', '.join(missing_fields)}"
-                    }
+                labels = response_parser.parse(json_str, DETAILED_ANALYSIS_SCHEMA)
                 
-                # Format percentages to 2 decimal places
-                for category, percentage in analysis["ingredient_percentages"].items():
-                    analysis["ingredient_percentages"][category] = round(percentage, 2)
-                
-                # Ensure health score is between 0-10
-                if "health_score" in analysis:
-                    analysis["health_score"] = min(10, max(0, analysis["health_score"] / 10))
-                    analysis["health_score"] = round(analysis["health_score"], 1)
+                # The model only labels ingredients; proportions, the summary and
+                # the health score are computed from the label order
+                ingredients = score_ingredients(align_labels(split_ingredients(ingredients_text), {}, labels["ingredients"]))
+                analysis = {
+                    "ingredients": ingredients,
+                    "classification_summary": classification_summary(ingredients),
+                    "ingredient_percentages": category_percentages(ingredients),
+                }
+                analysis["health_score"] = self.calculate_health_score(analysis)
                 
                 # Add summary statistics
                 analysis["summary"] = {
@@ -271,7 +218,7 @@ Return ONLY valid JSON."""
                     'error': None
                 }
                 
-            except json.JSONDecodeError as e:
+            except AnalysisParseError as e:
                 return {
                     'success': False,
                     'result': None,
@@ -286,27 +233,8 @@ Return ONLY valid JSON."""
             }
 
     def calculate_health_score(self, ingredients_data):
-        weights = {
-            "processing": 0.5,
-            "health_impact": 0.3,
-            "nutrient_density": 0.2
-        }
-        
-        total_scores = {"processing": 0, "health_impact": 0, "nutrient_density": 0}
-        total_percentage = 0
-
-        for ingredient in ingredients_data["ingredients"]:
-            total_scores["processing"] += ingredient["processing_score"] * ingredient["percentage"] / 100
-            total_scores["health_impact"] += ingredient["health_impact_score"] * ingredient["percentage"] / 100
-            total_scores["nutrient_density"] += ingredient["nutrient_density_score"] * ingredient["percentage"] / 100
-            total_percentage += ingredient["percentage"]
-
-        final_score = (
-            total_scores["processing"] * weights["processing"] +
-            total_scores["health_impact"] * weights["health_impact"] +
-            total_scores["nutrient_density"] * weights["nutrient_density"]
-        )
-        return round(final_score, 2)
+        """Health score (0-10) from per-ingredient scores weighted by percentage"""
+        return ingredient_health_score(ingredients_data["ingredients"])
 
 def main():
     analyzer = IngredientAnalyzer()
@@ -1,10 +1,292 @@
+import json
+import base64
 import datetime
 import bcrypt
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne, IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError, OperationFailure, DuplicateKeyError
+
+# Keys used for each ingredient category in the admin statistics
+CATEGORY_KEYS = {
+    "Natural": "natural",
+    "Additives": "additives",
+    "Preservatives": "preservatives",
+    "Artificial Colors": "artificial_colors",
+    "Highly Processed": "highly_processed"
+}
+
+# Per-category ingredient counts, as {"_id": category, "count", "harmful"}
+INGREDIENT_COUNTS_PIPELINE = [
+    {"$unwind": "$ingredients"},
+    {"$group": {
+        "_id": "$ingredients.category",
+        "count": {"$sum": 1},
+        "harmful": {"$sum": {"$cond": [{"$eq": ["$ingredients.is_harmful", True]}, 1, 0]}}
+    }}
+]
+
+def ingredient_counts(groups):
+    """Fold the output of INGREDIENT_COUNTS_PIPELINE into total, per-category and harmful counts"""
+    counts = {"total": 0, "harmful": 0}
+    counts.update({key: 0 for key in CATEGORY_KEYS.values()})
+    for group in groups:
+        counts["total"] += group["count"]
+        counts["harmful"] += group["harmful"]
+        if group["_id"] in CATEGORY_KEYS:
+            counts[CATEGORY_KEYS[group["_id"]]] += group["count"]
+    return counts
+
+def encode_cursor(analysis):
+    """
+    Opaque continuation token for the position just after an analysis
+    
+    Older analyses may store created_at as a string or not at all; their
+    token keeps the raw string, or only the _id, so it still resolves to
+    the same place in the (created_at, _id) order.
+    """
+    created_at = analysis.get("created_at")
+    payload = {"id": str(analysis["_id"])}
+    if isinstance(created_at, datetime.datetime):
+        payload["t"] = created_at.isoformat()
+    elif isinstance(created_at, str):
+        payload["s"] = created_at
+    token = json.dumps(payload)
+    return base64.urlsafe_b64encode(token.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(token):
+    """
+    (created_at, _id) from a continuation token; raises ValueError if it is malformed
+    
+    created_at is a datetime, the raw string of an older analysis, or None
+    when the analysis had no created_at.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if "t" in payload:
+            created_at = datetime.datetime.fromisoformat(payload["t"])
+        elif isinstance(payload.get("s"), str):
+            created_at = payload["s"]
+        else:
+            created_at = None
+        return created_at, ObjectId(payload["id"])
+    except (ValueError, KeyError, TypeError, AttributeError, InvalidId):
+        raise ValueError("Invalid pagination cursor")
+
+def cursor_filter(created_at, last_id):
+    """
+    Query for the analyses after a decoded cursor in (created_at desc, _id desc) order
+    
+    MongoDB sorts dates before strings before null/missing when descending,
+    and a range on a date or string only matches values of that type, so
+    each cursor also lets through everything of the types that come later.
+    """
+    if isinstance(created_at, datetime.datetime):
+        return {"$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": last_id}},
+            {"created_at": {"$not": {"$type": "date"}}}
+        ]}
+    if isinstance(created_at, str):
+        return {"$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": last_id}},
+            {"created_at": {"$not": {"$type": ["date", "string"]}}}
+        ]}
+    # Analyses without a created_at all sort equal, so _id alone orders them
+    return {"created_at": {"$not": {"$type": ["date", "string"]}}, "_id": {"$lt": last_id}}
+
+# Defaults for fields that older analyses may not have
+ANALYSIS_DEFAULTS = {
+    "product_name": "Unnamed Product",
+    "health_score": 0,
+    "ingredients_text": "No ingredients listed"
+}
+
+def parse_created_at(value):
+    """created_at as a datetime; older analyses may store it as a string. None if unknown"""
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, str):
+        for date_format in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S"):
+            try:
+                return datetime.datetime.strptime(value, date_format)
+            except ValueError:
+                continue
+    return None
+
+def normalize_analysis(analysis):
+    """
+    Fill in defaults for the fields the views rely on, in place
+    
+    Parameters:
+    - analysis: An analysis document, full or projected
+    """
+    for field, default in ANALYSIS_DEFAULTS.items():
+        if analysis.get(field) in (None, ""):
+            analysis[field] = default
+    if not analysis.get("ingredient_percentages"):
+        analysis["ingredient_percentages"] = {category: 0 for category in CATEGORY_KEYS}
+    analysis["created_at"] = parse_created_at(analysis.get("created_at"))
+    return analysis
+
+def admin_analysis_row(analysis):
+    """
+    JSON-serializable row for the admin listing of a user's analyses
+    
+    Parameters:
+    - analysis: An analysis document with created_at, product_name, health_score
+      and ingredients.is_harmful; created_at may be a legacy string or missing
+    """
+    normalize_analysis(analysis)
+    ingredients = analysis.get("ingredients") or []
+    return {
+        "id": str(analysis["_id"]),
+        "created_at": analysis["created_at"].isoformat() if analysis["created_at"] else None,
+        "product_name": analysis["product_name"],
+        "health_score": analysis["health_score"],
+        "ingredients_count": len(ingredients),
+        "harmful_ingredients": len([i for i in ingredients if i.get("is_harmful", False)])
+    }
+
+class AnalysisSummary:
+    """
+    Compact record of an analysis for the history, compare and dashboard listings
+    
+    Built from a LISTING_PROJECTION query, so the ingredients array and the
+    full ingredients text stay in the database; the full document is only
+    fetched on drill-down (get_analysis_by_id).
+    """
+    
+    __slots__ = (
+        "id", "user_id", "product_name", "health_score",
+        "ingredient_percentages", "ingredients_preview", "created_at", "username"
+    )
+    
+    PREVIEW_LENGTH = 200
+    
+    def __init__(self, id, user_id, product_name, health_score, ingredient_percentages,
+                 ingredients_preview, created_at, username=None):
+        self.id = id
+        self.user_id = user_id
+        self.product_name = product_name
+        self.health_score = health_score
+        self.ingredient_percentages = ingredient_percentages
+        self.ingredients_preview = ingredients_preview
+        self.created_at = created_at
+        self.username = username
+    
+    @classmethod
+    def from_document(cls, doc):
+        """Summary of a document fetched with LISTING_PROJECTION"""
+        doc = normalize_analysis(dict(doc, ingredients_text=doc.get("ingredients_preview")))
+        preview = doc["ingredients_text"]
+        if len(preview) > cls.PREVIEW_LENGTH:
+            preview = preview[:cls.PREVIEW_LENGTH] + "..."
+        return cls(
+            id=str(doc["_id"]),
+            user_id=str(doc["user_id"]) if doc.get("user_id") is not None else None,
+            product_name=doc["product_name"],
+            health_score=doc["health_score"],
+            ingredient_percentages=doc["ingredient_percentages"],
+            ingredients_preview=preview,
+            created_at=doc["created_at"],
+            username=doc.get("username")
+        )
+    
+    @property
+    def date(self):
+        """Short creation date for pickers, e.g. 2024-12-25 10:30"""
+        return self.created_at.strftime("%Y-%m-%d %H:%M") if self.created_at else ""
+    
+    @property
+    def created_label(self):
+        """Long creation date for history cards, e.g. December 25, 2024 10:30 AM"""
+        return self.created_at.strftime("%B %d, %Y %I:%M %p") if self.created_at else ""
+    
+    def to_dict(self):
+        """JSON-serializable form, for API responses and the session"""
+        return {
+            "_id": self.id,
+            "user_id": self.user_id,
+            "product_name": self.product_name,
+            "health_score": self.health_score,
+            "ingredient_percentages": self.ingredient_percentages,
+            "ingredients_preview": self.ingredients_preview,
+            "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S") if self.created_at else None,
+            "date": self.date,
+            "username": self.username
+        }
+
+# Only the fields listed in history, compare and dashboard, with the start of the ingredients text
+LISTING_PROJECTION = {
+    "user_id": 1,
+    "product_name": 1,
+    "health_score": 1,
+    "ingredient_percentages": 1,
+    "created_at": 1,
+    "ingredients_preview": {
+        "$substrCP": [{"$ifNull": ["$ingredients_text", ""]}, 0, AnalysisSummary.PREVIEW_LENGTH + 1]
+    }
+}
+
+def score_bucket(health_score):
+    """Health score distribution bucket: excellent (8-10), good (6-7.9), fair (5-5.9) or poor (0-4.9)"""
+    if health_score >= 8:
+        return "excellent"
+    if health_score >= 6:
+        return "good"
+    if health_score >= 5:
+        return "fair"
+    return "poor"
+
+def counters_to_ingredient_stats(counters):
+    """
+    Admin ingredient statistics from the raw counters kept in the stats collection
+    
+    Parameters:
+    - counters: Dict with total_products, health_score_sum, distribution and ingredients
+    """
+    counts = counters.get("ingredients", {})
+    total = counts.get("total", 0)
+    products = counters.get("total_products", 0)
+    distribution = counters.get("distribution", {})
+    
+    stats = {
+        "total_ingredients": total,
+        "natural_ingredients": counts.get("natural", 0),
+        "additives": counts.get("additives", 0),
+        "preservatives": counts.get("preservatives", 0),
+        "artificial_colors": counts.get("artificial_colors", 0),
+        "highly_processed": counts.get("highly_processed", 0),
+        "harmful_ingredients": counts.get("harmful", 0),
+        "total_products": products,
+        "avg_health_score": counters.get("health_score_sum", 0) / products if products else 0,
+        "health_score_distribution": {
+            bucket: distribution.get(bucket, 0) for bucket in ("excellent", "good", "fair", "poor")
+        }
+    }
+    
+    # Percentages for the ingredient distribution
+    if total > 0:
+        for key in CATEGORY_KEYS.values():
+            stats[f"{key}_percentage"] = (counts.get(key, 0) / total) * 100
+        stats["harmful_percentage"] = (counts.get("harmful", 0) / total) * 100
+    
+    return stats
+
+# Unique logins
+ACCOUNT_INDEXES = [
+    IndexModel([("username", ASCENDING)], name="username_1", unique=True),
+    IndexModel([("email", ASCENDING)], name="email_1", unique=True)
+]
 
 class User:
+    INDEXES = ACCOUNT_INDEXES
+
     def __init__(self, db):
         self.collection = db.users
+        self.stats = GlobalStats(db)
 
     def create_user(self, username, email, password):
         # Check if user already exists
@@ -24,6 +306,7 @@ class User:
         }
         
         result = self.collection.insert_one(user_doc)
+        self.stats.record_user(user_doc)
         return str(result.inserted_id)
 
     def verify_user(self, username, password):
@@ -32,7 +315,64 @@ class User:
             return user
         return None
 
+    def get_users_overview(self, skip=0, limit=20, analyses_per_user=5):
+        """
+        Get one page of users with their analysis statistics, without a query per user
+        
+        Parameters:
+        - skip: Number of users to skip (for pagination)
+        - limit: Maximum number of users to return
+        - analyses_per_user: Number of most recent analyses returned per user
+        
+        Each user carries stats (total_analyses, avg_health_score,
+        ingredients) and its most recent analyses. Totals over all users are
+        kept in the stats collection (see GlobalStats).
+        """
+        pipeline = [
+            {"$sort": {"_id": 1}},
+            {"$skip": skip},
+            {"$limit": limit},
+            {"$project": {"password": 0}},
+            {"$lookup": {
+                "from": "ingredient_analyses",
+                "let": {"user_id": "$_id"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$user_id", "$$user_id"]}}},
+                    {"$facet": {
+                        "summary": [{"$group": {
+                            "_id": None,
+                            "total_analyses": {"$sum": 1},
+                            "avg_health_score": {"$avg": {"$ifNull": ["$health_score", 0]}}
+                        }}],
+                        "ingredients": INGREDIENT_COUNTS_PIPELINE,
+                        "recent": [
+                            {"$sort": {"created_at": -1}},
+                            {"$limit": analyses_per_user},
+                            {"$project": {"user_id": 0}}
+                        ]
+                    }}
+                ],
+                "as": "analysis_stats"
+            }}
+        ]
+        
+        users = []
+        for user in self.collection.aggregate(pipeline):
+            analysis_stats = user.pop("analysis_stats")[0]
+            summary = analysis_stats["summary"][0] if analysis_stats["summary"] else {}
+            user["stats"] = {
+                "total_analyses": summary.get("total_analyses", 0),
+                "avg_health_score": summary.get("avg_health_score") or 0,
+                "ingredients": ingredient_counts(analysis_stats["ingredients"])
+            }
+            user["analyses"] = analysis_stats["recent"]
+            users.append(user)
+        
+        return users
+
 class Admin:
+    INDEXES = ACCOUNT_INDEXES
+
     def __init__(self, db):
         self.collection = db.admins
 
@@ -63,8 +403,23 @@ class Admin:
         return None
 
 class IngredientAnalysis:
+    # No partial indexes: the listings page over every analysis, including
+    # legacy ones without a date (see cursor_filter), nothing filters on a
+    # subset such as scored or image-backed analyses, and the $ne query of
+    # scripts/rescore_analyses.py can't use a partial filter
+    INDEXES = [
+        # A user's history, newest first (get_user_analyses and the per-user lookups)
+        IndexModel(
+            [("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="user_id_1_created_at_-1__id_-1"
+        ),
+        # Recent analyses of all users (list_recent_analyses)
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_at_-1__id_-1")
+    ]
+
     def __init__(self, db):
         self.collection = db.ingredient_analyses
+        self.stats = GlobalStats(db)
 
     def save_analysis(self, user_id, ingredients_text, analysis_result):
         """
@@ -82,27 +437,133 @@ class IngredientAnalysis:
             "ingredient_percentages": analysis_result.get("ingredient_percentages", {}),
             "health_score": analysis_result.get("health_score", 0),
             "product_name": analysis_result.get("product_name", "Unnamed Product"),
+            "scoring_version": analysis_result.get("scoring_version"),
             "created_at": datetime.datetime.utcnow()
         }
         
         result = self.collection.insert_one(analysis_doc)
+        self.stats.record_analysis(analysis_doc)
         return str(result.inserted_id)
 
-    def get_user_analyses(self, user_id, skip=0, limit=10):
+    def get_user_analyses(self, user_id, limit=10, cursor=None, projection=None):
         """
-        Get all analyses for a specific user, with pagination
+        Get one page of a user's analyses, newest first
+        
+        Pages are keyed on (created_at, _id), so every page costs the same
+        however deep it is.
         
         Parameters:
         - user_id: ObjectId or str of the user
-        - skip: Number of results to skip (for pagination)
         - limit: Maximum number of results to return
+        - cursor: Continuation token from the previous page, None for the first page
+        - projection: Fields to return, all if None
+        
+        Returns (analyses, next_cursor), where next_cursor is None on the last page.
+        Raises ValueError for a malformed cursor.
         """
         user_id_obj = ObjectId(user_id) if isinstance(user_id, str) else user_id
-        cursor = self.collection.find(
-            {"user_id": user_id_obj}
-        ).sort("created_at", -1).skip(skip).limit(limit)
+        query = {"user_id": user_id_obj}
+        if cursor:
+            query.update(cursor_filter(*decode_cursor(cursor)))
+        
+        # One extra result tells whether there is another page
+        analyses = list(self.collection.find(query, projection).sort(
+            [("created_at", DESCENDING), ("_id", DESCENDING)]
+        ).limit(limit + 1))
+        
+        next_cursor = encode_cursor(analyses[limit - 1]) if len(analyses) > limit else None
+        return analyses[:limit], next_cursor
+
+    def list_user_analyses(self, user_id, limit=10, cursor=None):
+        """
+        Get one page of a user's analyses as AnalysisSummary records, newest first
         
-        return list(cursor)
+        Parameters:
+        - user_id: ObjectId or str of the user
+        - limit: Maximum number of results to return
+        - cursor: Continuation token from the previous page, None for the first page
+        
+        Returns (summaries, next_cursor); see get_user_analyses.
+        """
+        analyses, next_cursor = self.get_user_analyses(user_id, limit, cursor, projection=LISTING_PROJECTION)
+        return [AnalysisSummary.from_document(analysis) for analysis in analyses], next_cursor
+
+    def list_recent_analyses(self, skip=0, limit=10):
+        """
+        Get the most recent analyses of all users as AnalysisSummary records with usernames
+        
+        Parameters:
+        - skip: Number of results to skip (for pagination)
+        - limit: Maximum number of results to return
+        """
+        pipeline = [
+            {"$sort": {"created_at": -1}},
+            {"$skip": skip},
+            {"$limit": limit},
+            {"$project": LISTING_PROJECTION},
+            {"$lookup": {
+                "from": "users",
+                "localField": "user_id",
+                "foreignField": "_id",
+                "as": "user"
+            }},
+            {"$addFields": {"username": {"$ifNull": [{"$arrayElemAt": ["$user.username", 0]}, "Unknown"]}}},
+            {"$project": {"user": 0}}
+        ]
+        return [AnalysisSummary.from_document(analysis) for analysis in self.collection.aggregate(pipeline)]
+
+    def compute_stats(self):
+        """
+        Compute the stats collection counters over all analyses from scratch
+        
+        Returns the global counters (see GlobalStats) and the daily analysis
+        counts with the users active on each day.
+        """
+        pipeline = [
+            {"$project": {
+                "user_id": 1,
+                "created_at": 1,
+                "health_score": {"$ifNull": ["$health_score", 0]},
+                "ingredients": 1
+            }},
+            {"$facet": {
+                "scores": [{"$group": {
+                    "_id": None,
+                    "total_products": {"$sum": 1},
+                    "health_score_sum": {"$sum": "$health_score"},
+                    "excellent": {"$sum": {"$cond": [{"$gte": ["$health_score", 8]}, 1, 0]}},
+                    "good": {"$sum": {"$cond": [
+                        {"$and": [{"$gte": ["$health_score", 6]}, {"$lt": ["$health_score", 8]}]}, 1, 0
+                    ]}},
+                    "fair": {"$sum": {"$cond": [
+                        {"$and": [{"$gte": ["$health_score", 5]}, {"$lt": ["$health_score", 6]}]}, 1, 0
+                    ]}},
+                    "poor": {"$sum": {"$cond": [{"$lt": ["$health_score", 5]}, 1, 0]}}
+                }}],
+                "ingredients": INGREDIENT_COUNTS_PIPELINE,
+                "daily": [
+                    {"$match": {"created_at": {"$type": "date"}}},
+                    {"$group": {
+                        "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+                        "analyses": {"$sum": 1},
+                        "users": {"$addToSet": "$user_id"}
+                    }}
+                ]
+            }}
+        ]
+        
+        result = list(self.collection.aggregate(pipeline))[0]
+        scores = result["scores"][0] if result["scores"] else {}
+        counters = {
+            "total_products": scores.get("total_products", 0),
+            "health_score_sum": scores.get("health_score_sum", 0),
+            "distribution": {
+                bucket: scores.get(bucket, 0) for bucket in ("excellent", "good", "fair", "poor")
+            },
+            "ingredients": ingredient_counts(result["ingredients"])
+        }
+        daily = {day["_id"]: {"analyses": day["analyses"], "users": day["users"]} for day in result["daily"]}
+        return counters, daily
 
     def get_analysis_by_id(self, analysis_id):
         """
@@ -168,5 +629,283 @@ class IngredientAnalysis:
         - analysis_id: ObjectId or str of the analysis to delete
         """
         analysis_id_obj = ObjectId(analysis_id) if isinstance(analysis_id, str) else analysis_id
-        result = self.collection.delete_one({"_id": analysis_id_obj})
-        return result.deleted_count > 0
\ No newline at end of file
+        deleted = self.collection.find_one_and_delete(
+            {"_id": analysis_id_obj},
+            projection={"health_score": 1, "ingredients.category": 1, "ingredients.is_harmful": 1, "created_at": 1}
+        )
+        if deleted is None:
+            return False
+        self.stats.record_analysis(deleted, sign=-1)
+        return True
+
+class GlobalStats:
+    """
+    Materialized admin statistics, kept in the stats collection
+    
+    The "global" document holds running counters (products, health score
+    sum and distribution, ingredient counts per category, users) that are
+    updated with $inc on every save and delete, so reading them costs one
+    lookup however large the collections grow. Analyses per day and the
+    users active that day are kept in one "daily:<date>" document per day.
+    The counters only count what happened after they were first written, so
+    they are rebuilt once (rebuild_if_needed at startup) before being
+    trusted; writes that bypass the models leave them off until the next
+    rebuild() (see scripts/reconcile_stats.py), which reports the drift.
+    """
+    
+    GLOBAL_ID = "global"
+    LOCK_ID = "lock:rebuild"
+    # A rebuild lock older than this is assumed to belong to a crashed process
+    REBUILD_LOCK_SECONDS = 600
+    
+    def __init__(self, db):
+        self.db = db
+        self.collection = db.stats
+    
+    @staticmethod
+    def analysis_counters(analysis):
+        """$inc fields for one analysis document"""
+        health_score = analysis.get("health_score", 0) or 0
+        counters = {
+            "total_products": 1,
+            "health_score_sum": health_score,
+            f"distribution.{score_bucket(health_score)}": 1
+        }
+        for ingredient in analysis.get("ingredients", []):
+            counters["ingredients.total"] = counters.get("ingredients.total", 0) + 1
+            key = CATEGORY_KEYS.get(ingredient.get("category"))
+            if key:
+                counters[f"ingredients.{key}"] = counters.get(f"ingredients.{key}", 0) + 1
+            if ingredient.get("is_harmful", False):
+                counters["ingredients.harmful"] = counters.get("ingredients.harmful", 0) + 1
+        return counters
+    
+    def record_analysis(self, analysis, sign=1):
+        """
+        Count a saved analysis, or uncount a deleted one
+        
+        Parameters:
+        - analysis: The analysis document
+        - sign: 1 for a saved analysis, -1 for a deleted one
+        """
+        counters = {field: value * sign for field, value in self.analysis_counters(analysis).items()}
+        try:
+            self.collection.update_one({"_id": self.GLOBAL_ID}, {"$inc": counters}, upsert=True)
+            
+            created_at = analysis.get("created_at")
+            if isinstance(created_at, datetime.datetime):
+                day = created_at.strftime("%Y-%m-%d")
+                update = {"$inc": {"analyses": sign}, "$set": {"date": day}}
+                # Activity that happened stays counted when an analysis is deleted
+                if sign > 0 and analysis.get("user_id") is not None:
+                    update["$addToSet"] = {"users": analysis["user_id"]}
+                self.collection.update_one({"_id": f"daily:{day}"}, update, upsert=True)
+        except PyMongoError as e:
+            # The analysis itself is stored; the next rebuild corrects the counters
+            print(f"Error updating statistics: {str(e)}")
+    
+    def record_user(self, user):
+        """Count a newly created user"""
+        counters = {"total_users": 1}
+        if user.get("is_active", True):
+            counters["active_users"] = 1
+        try:
+            self.collection.update_one({"_id": self.GLOBAL_ID}, {"$inc": counters}, upsert=True)
+        except PyMongoError as e:
+            print(f"Error updating statistics: {str(e)}")
+    
+    def get(self):
+        """The global counters, rebuilt first if they have never been computed from the collections"""
+        counters = self.collection.find_one({"_id": self.GLOBAL_ID})
+        if counters is None or "rebuilt_at" not in counters:
+            self.rebuild()
+            counters = self.collection.find_one({"_id": self.GLOBAL_ID}) or {}
+        return counters
+    
+    def rebuild_if_needed(self):
+        """
+        Rebuild the counters unless they have been rebuilt before, safe to run on every startup
+        
+        On a database that had analyses before the stats collection existed,
+        the first save or new user creates counters holding only that one
+        change; this replaces them with the real totals.
+        """
+        counters = self.collection.find_one({"_id": self.GLOBAL_ID}, {"rebuilt_at": 1})
+        if counters is not None and "rebuilt_at" in counters:
+            return None
+        print("Statistics have never been rebuilt, rebuilding them now")
+        return self.rebuild()
+    
+    def get_daily(self, days=7):
+        """
+        Analyses and active users per day, oldest first
+        
+        Parameters:
+        - days: Number of days up to and including today
+        """
+        today = datetime.datetime.utcnow().date()
+        dates = [(today - datetime.timedelta(days=offset)).strftime("%Y-%m-%d") for offset in range(days - 1, -1, -1)]
+        docs = {doc["date"]: doc for doc in self.collection.find({"_id": {"$in": [f"daily:{date}" for date in dates]}})}
+        return [{
+            "date": date,
+            "analyses": docs.get(date, {}).get("analyses", 0),
+            "active_users": len(docs.get(date, {}).get("users", []))
+        } for date in dates]
+    
+    def acquire_rebuild_lock(self):
+        """Take the rebuild lock; False if another process is rebuilding"""
+        now = datetime.datetime.utcnow()
+        self.collection.delete_one({"_id": self.LOCK_ID, "expires_at": {"$lt": now}})
+        try:
+            self.collection.insert_one({
+                "_id": self.LOCK_ID,
+                "expires_at": now + datetime.timedelta(seconds=self.REBUILD_LOCK_SECONDS)
+            })
+            return True
+        except DuplicateKeyError:
+            return False
+    
+    def release_rebuild_lock(self):
+        self.collection.delete_one({"_id": self.LOCK_ID})
+    
+    def rebuild(self):
+        """
+        Recompute every counter from the analyses and users collections
+        
+        The difference between the stored and the recomputed counters is
+        applied with $inc rather than by replacing the documents, so saves
+        and deletes recorded while the collections are being scanned are
+        kept. Only one process rebuilds at a time.
+        
+        Returns the drift as a dict of counter name -> (stored, actual) for
+        every counter that was off, or None if another rebuild is running.
+        """
+        if not self.acquire_rebuild_lock():
+            print("Another process is rebuilding the statistics, skipping")
+            return None
+        try:
+            return self._rebuild()
+        finally:
+            self.release_rebuild_lock()
+    
+    def _rebuild(self):
+        analyses = IngredientAnalysis(self.db)
+        counters, daily = analyses.compute_stats()
+        counters["total_users"] = self.db.users.count_documents({})
+        counters["active_users"] = self.db.users.count_documents({"is_active": {"$ne": False}})
+        
+        # Read after the scan, so changes recorded during it are in both sides of the difference
+        stored = flatten_counters(self.collection.find_one({"_id": self.GLOBAL_ID}) or {})
+        drift = {}
+        for name, actual in flatten_counters(counters).items():
+            current = stored.get(name, 0)
+            if round(current, 6) != round(actual, 6):
+                drift[name] = (current, actual)
+        
+        stored_daily = {
+            doc["date"]: doc.get("analyses", 0)
+            for doc in self.collection.find({"_id": {"$regex": "^daily:"}}, {"date": 1, "analyses": 1})
+        }
+        operations = []
+        for day in set(stored_daily) | set(daily):
+            current = stored_daily.get(day, 0)
+            actual = daily.get(day, {}).get("analyses", 0)
+            update = {"$set": {"date": day}, "$addToSet": {"users": {"$each": daily.get(day, {}).get("users", [])}}}
+            if current != actual:
+                drift[f"daily.{day}"] = (current, actual)
+                update["$inc"] = {"analyses": actual - current}
+            operations.append(UpdateOne({"_id": f"daily:{day}"}, update, upsert=True))
+        
+        global_update = {"$set": {"rebuilt_at": datetime.datetime.utcnow()}}
+        increments = {name: actual - current for name, (current, actual) in drift.items() if not name.startswith("daily.")}
+        if increments:
+            global_update["$inc"] = increments
+        operations.append(UpdateOne({"_id": self.GLOBAL_ID}, global_update, upsert=True))
+        self.collection.bulk_write(operations, ordered=False)
+        return drift
+
+def flatten_counters(counters, prefix=""):
+    """Nested counters as a flat dict of dotted name -> number"""
+    flat = {}
+    for name, value in counters.items():
+        if isinstance(value, dict):
+            flat.update(flatten_counters(value, f"{prefix}{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{name}"] = value
+    return flat
+
+class IngredientKnowledge:
+    def __init__(self, db):
+        self.collection = db.ingredient_knowledge
+
+    def lookup(self, names):
+        """
+        Get the known classifications for a list of canonical ingredient names
+        
+        Parameters:
+        - names: List of canonical ingredient names
+        
+        Returns a dict of name -> {"category"}
+        """
+        cursor = self.collection.find({"_id": {"$in": list(set(names))}}, {"seen": 0, "updated_at": 0})
+        return {doc.pop("_id"): doc for doc in cursor}
+
+    def learn(self, entries):
+        """
+        Store classifications learned from a model response
+        
+        Parameters:
+        - entries: Dict of canonical name -> {"category"}
+        """
+        now = datetime.datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"_id": name},
+                {"$set": dict(entry, updated_at=now), "$inc": {"seen": 1}},
+                upsert=True
+            )
+            for name, entry in entries.items()
+        ]
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+
+def index_matches(existing, index):
+    """Whether an index from index_information() has the keys and options of an IndexModel"""
+    spec = index.document
+    keys = [(field, int(direction)) for field, direction in spec["key"].items()]
+    if [(field, int(direction)) for field, direction in existing["key"]] != keys:
+        return False
+    return all(
+        existing.get(option) == spec.get(option)
+        for option in ("unique", "partialFilterExpression")
+    )
+
+def ensure_indexes(db):
+    """
+    Create the indexes declared by the models, safe to run on every startup
+    
+    Only creates missing indexes. An existing index whose definition differs
+    from the declared one is reported and left in place; changing it is a
+    migration (scripts/migrate_indexes.py), not something every worker
+    should race to do at import.
+    
+    Parameters:
+    - db: The application database
+    """
+    for model in (User, Admin, IngredientAnalysis):
+        collection = model(db).collection
+        existing = collection.index_information()
+        
+        for index in model.INDEXES:
+            name = index.document["name"]
+            if name in existing:
+                if not index_matches(existing[name], index):
+                    print(f"Index {collection.name}.{name} differs from its declared definition; "
+                          f"run scripts/migrate_indexes.py to rebuild it")
+                continue
+            
+            try:
+                collection.create_indexes([index])
+                print(f"Created index {collection.name}.{name}")
+            except OperationFailure as e:
+                print(f"Error creating index {collection.name}.{name}: {str(e)}")
@@ -0,0 +1,68 @@
+import sys
+import os
+
+# Add parent directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+from pymongo.errors import PyMongoError
+from db_config import DatabaseConfig
+from models import User, Admin, IngredientAnalysis, index_matches, ensure_indexes
+
+def changed_indexes(db):
+    """(collection, declared index) for every existing index whose definition differs from the models"""
+    changed = []
+    for model in (User, Admin, IngredientAnalysis):
+        collection = model(db).collection
+        existing = collection.index_information()
+        for index in model.INDEXES:
+            name = index.document["name"]
+            if name in existing and not index_matches(existing[name], index):
+                changed.append((collection, index))
+    return changed
+
+def migrate(db, dry_run=False):
+    """Rebuild changed indexes, then create any missing ones; returns whether every rebuild succeeded"""
+    changed = changed_indexes(db)
+    if not changed:
+        print("Every existing index matches its declared definition")
+
+    ok = True
+    for collection, index in changed:
+        name = index.document["name"]
+        print(f"{collection.name}.{name}: {collection.index_information()[name]} -> {index.document}")
+        if dry_run:
+            continue
+
+        collection.drop_index(name)
+        try:
+            collection.create_indexes([index])
+            print(f"Rebuilt index {collection.name}.{name}")
+        except PyMongoError as e:
+            # The old index is gone; say so loudly rather than leave it to a log line
+            print(f"FAILED to rebuild {collection.name}.{name}, the collection has no {name} index now: {str(e)}")
+            ok = False
+
+    if not dry_run:
+        ensure_indexes(db)
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Drop and rebuild indexes whose definition changed in the models. '
+                    'Run once, with the app stopped, after deploying an index change.'
+    )
+    parser.add_argument('--dry-run', action='store_true', help='List the changed indexes without touching them')
+    args = parser.parse_args()
+
+    db_config = DatabaseConfig()
+    db = db_config.get_db()
+    try:
+        ok = migrate(db, dry_run=args.dry_run)
+    finally:
+        db_config.close()
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import sys
+import os
+
+# Add parent directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+from db_config import DatabaseConfig
+from models import GlobalStats
+
+def main():
+    # Initialize database connection
+    db_config = DatabaseConfig()
+    db = db_config.get_db()
+    
+    try:
+        started = time.time()
+        print("Rebuilding statistics from ingredient_analyses and users...")
+        drift = GlobalStats(db).rebuild()
+        
+        if drift is None:
+            print("Another process is rebuilding the statistics; try again when it has finished")
+            return
+        if not drift:
+            print("No drift: the stored counters matched the collections")
+        else:
+            print(f"\n{len(drift)} counters had drifted (stored -> actual):")
+            for name, (stored, actual) in sorted(drift.items()):
+                print(f"  {name}: {stored} -> {actual}")
+        
+        print(f"\nStatistics rebuilt in {time.time() - started:.1f}s")
+    finally:
+        db_config.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import sys
+import os
+
+# Add parent directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import time
+import numpy as np
+from pymongo import UpdateOne
+from db_config import DatabaseConfig
+from models import GlobalStats
+from services.llm_schema import CATEGORIES
+from services.scoring import category_health_scores, SCORING_VERSION
+
+CHECKPOINT_ID = 'rescore_analyses'
+CATEGORY_INDEX = {category: i for i, category in enumerate(CATEGORIES)}
+
+# Only the fields the score is computed from, plus the current score
+PROJECTION = {
+    'health_score': 1,
+    'ingredients.category': 1,
+    'ingredients.percentage': 1,
+    'ingredient_percentages': 1
+}
+
+def category_matrix(docs):
+    """(len(docs), len(CATEGORIES)) array of category percentages.
+
+    Per-ingredient percentages are summed per category with a single
+    np.add.at; documents without them (older analyses) use their stored
+    ingredient_percentages instead.
+    """
+    matrix = np.zeros((len(docs), len(CATEGORIES)))
+    rows, columns, values = [], [], []
+    for row, doc in enumerate(docs):
+        ingredients = [
+            ingredient for ingredient in doc.get('ingredients') or []
+            if isinstance(ingredient, dict) and isinstance(ingredient.get('percentage'), (int, float))
+        ]
+        if ingredients:
+            for ingredient in ingredients:
+                if ingredient.get('category') in CATEGORY_INDEX:
+                    rows.append(row)
+                    columns.append(CATEGORY_INDEX[ingredient['category']])
+                    values.append(ingredient['percentage'])
+        else:
+            for category, value in (doc.get('ingredient_percentages') or {}).items():
+                if category in CATEGORY_INDEX and isinstance(value, (int, float)):
+                    matrix[row, CATEGORY_INDEX[category]] = value
+
+    if rows:
+        np.add.at(matrix, (np.array(rows), np.array(columns)), np.array(values, dtype=float))
+    return matrix
+
+def load_checkpoint(db, restart):
+    """_id to resume after, or None to start from the beginning"""
+    if restart:
+        db.maintenance_checkpoints.delete_one({'_id': CHECKPOINT_ID})
+        return None
+    checkpoint = db.maintenance_checkpoints.find_one({'_id': CHECKPOINT_ID})
+    # A checkpoint from an earlier scoring version is no use for this one
+    if checkpoint and checkpoint.get('version') == SCORING_VERSION:
+        print(f"Resuming after {checkpoint['last_id']}")
+        return checkpoint['last_id']
+    return None
+
+def save_checkpoint(db, last_id):
+    db.maintenance_checkpoints.update_one(
+        {'_id': CHECKPOINT_ID},
+        {'$set': {'version': SCORING_VERSION, 'last_id': last_id}},
+        upsert=True
+    )
+
+def rescore(db, batch_size, dry_run=False, restart=False):
+    collection = db.ingredient_analyses
+    last_id = load_checkpoint(db, restart)
+
+    query = {'scoring_version': {'$ne': SCORING_VERSION}}
+    if last_id is not None:
+        query['_id'] = {'$gt': last_id}
+    cursor = collection.find(query, PROJECTION).sort('_id', 1).batch_size(batch_size)
+
+    processed = 0
+    changed = 0
+    started = time.time()
+    docs = []
+    for doc in cursor:
+        docs.append(doc)
+        if len(docs) == batch_size:
+            changed += rescore_batch(db, docs, dry_run)
+            processed += len(docs)
+            docs = []
+            rate = processed / max(time.time() - started, 1e-6)
+            print(f"Rescored {processed} analyses ({rate:.0f}/s)")
+    if docs:
+        changed += rescore_batch(db, docs, dry_run)
+        processed += len(docs)
+
+    if not dry_run:
+        db.maintenance_checkpoints.delete_one({'_id': CHECKPOINT_ID})
+    print(f"\nDone: {processed} analyses rescored to version {SCORING_VERSION}, "
+          f"{changed} with a new health score, in {time.time() - started:.1f}s")
+    
+    # The health score sum and distribution in the stats collection are now off
+    if changed and not dry_run:
+        print("Rebuilding statistics...")
+        GlobalStats(db).rebuild()
+
+def rescore_batch(db, docs, dry_run):
+    """Score one batch of documents and write it back; returns how many scores changed"""
+    matrix = category_matrix(docs)
+    current = np.array([
+        doc['health_score'] if isinstance(doc.get('health_score'), (int, float)) else np.nan
+        for doc in docs
+    ], dtype=float)
+    # Analyses without any category data keep the score they have
+    scores = np.where(matrix.any(axis=1), category_health_scores(matrix), current)
+    changed = int(np.count_nonzero(~np.isclose(scores, current, equal_nan=True)))
+    if dry_run:
+        return changed
+
+    updates = []
+    for doc, score in zip(docs, scores):
+        fields = {'scoring_version': SCORING_VERSION}
+        if not np.isnan(score):
+            fields['health_score'] = float(score)
+        updates.append(UpdateOne({'_id': doc['_id']}, {'$set': fields}))
+    db.ingredient_analyses.bulk_write(updates, ordered=False)
+    save_checkpoint(db, docs[-1]['_id'])
+    return changed
+
+def main():
+    parser = argparse.ArgumentParser(description='Recompute stored health scores with the current scoring weights')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Documents per cursor batch and bulk write')
+    parser.add_argument('--dry-run', action='store_true', help='Score without writing anything')
+    parser.add_argument('--restart', action='store_true', help='Ignore a saved checkpoint')
+    args = parser.parse_args()
+
+    db_config = DatabaseConfig()
+    db = db_config.get_db()
+    try:
+        rescore(db, args.batch_size, dry_run=args.dry_run, restart=args.restart)
+    finally:
+        db_config.close()
+
+if __name__ == "__main__":
+    main()
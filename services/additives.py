@@ -0,0 +1,288 @@
+import re
+
+# Bump when the table or class names change; part of the analysis cache key
+TABLE_VERSION = '3'
+
+# INS / E numbers of common food additives: code -> (name, category).
+# Categories are the ones used throughout the app.
+ADDITIVES = {
+    # Colours
+    '100': ('Curcumin', 'Natural'),
+    '101': ('Riboflavin', 'Natural'),
+    '102': ('Tartrazine', 'Artificial Colors'),
+    '104': ('Quinoline Yellow', 'Artificial Colors'),
+    '110': ('Sunset Yellow FCF', 'Artificial Colors'),
+    '120': ('Carmine', 'Natural'),
+    '122': ('Carmoisine', 'Artificial Colors'),
+    '123': ('Amaranth', 'Artificial Colors'),
+    '124': ('Ponceau 4R', 'Artificial Colors'),
+    '127': ('Erythrosine', 'Artificial Colors'),
+    '129': ('Allura Red AC', 'Artificial Colors'),
+    '132': ('Indigo Carmine', 'Artificial Colors'),
+    '133': ('Brilliant Blue FCF', 'Artificial Colors'),
+    '140': ('Chlorophyll', 'Natural'),
+    '141': ('Copper Chlorophyll', 'Additives'),
+    '143': ('Fast Green FCF', 'Artificial Colors'),
+    '150a': ('Plain Caramel', 'Additives'),
+    '150b': ('Caustic Sulphite Caramel', 'Artificial Colors'),
+    '150c': ('Ammonia Caramel', 'Artificial Colors'),
+    '150d': ('Sulphite Ammonia Caramel', 'Artificial Colors'),
+    '160a': ('Beta-Carotene', 'Natural'),
+    '160b': ('Annatto', 'Natural'),
+    '160c': ('Paprika Extract', 'Natural'),
+    '162': ('Beetroot Red', 'Natural'),
+    '163': ('Anthocyanins', 'Natural'),
+    '171': ('Titanium Dioxide', 'Artificial Colors'),
+    # Preservatives
+    '200': ('Sorbic Acid', 'Preservatives'),
+    '202': ('Potassium Sorbate', 'Preservatives'),
+    '210': ('Benzoic Acid', 'Preservatives'),
+    '211': ('Sodium Benzoate', 'Preservatives'),
+    '220': ('Sulphur Dioxide', 'Preservatives'),
+    '223': ('Sodium Metabisulphite', 'Preservatives'),
+    '224': ('Potassium Metabisulphite', 'Preservatives'),
+    '234': ('Nisin', 'Preservatives'),
+    '250': ('Sodium Nitrite', 'Preservatives'),
+    '251': ('Sodium Nitrate', 'Preservatives'),
+    '260': ('Acetic Acid', 'Additives'),
+    '270': ('Lactic Acid', 'Additives'),
+    '280': ('Propionic Acid', 'Preservatives'),
+    '282': ('Calcium Propionate', 'Preservatives'),
+    '296': ('Malic Acid', 'Additives'),
+    # Antioxidants and acidity regulators
+    '300': ('Ascorbic Acid', 'Additives'),
+    '301': ('Sodium Ascorbate', 'Additives'),
+    '306': ('Mixed Tocopherols', 'Preservatives'),
+    '307': ('Alpha-Tocopherol', 'Preservatives'),
+    '319': ('TBHQ', 'Preservatives'),
+    '320': ('BHA', 'Preservatives'),
+    '321': ('BHT', 'Preservatives'),
+    '322': ('Lecithin', 'Additives'),
+    '325': ('Sodium Lactate', 'Additives'),
+    '327': ('Calcium Lactate', 'Additives'),
+    '330': ('Citric Acid', 'Additives'),
+    '331': ('Sodium Citrate', 'Additives'),
+    '332': ('Potassium Citrate', 'Additives'),
+    '334': ('Tartaric Acid', 'Additives'),
+    '338': ('Phosphoric Acid', 'Additives'),
+    '339': ('Sodium Phosphate', 'Additives'),
+    '340': ('Potassium Phosphate', 'Additives'),
+    '341': ('Calcium Phosphate', 'Additives'),
+    '350': ('Sodium Malate', 'Additives'),
+    # Thickeners, stabilisers and emulsifiers
+    '400': ('Alginic Acid', 'Additives'),
+    '401': ('Sodium Alginate', 'Additives'),
+    '406': ('Agar', 'Natural'),
+    '407': ('Carrageenan', 'Additives'),
+    '410': ('Locust Bean Gum', 'Additives'),
+    '412': ('Guar Gum', 'Additives'),
+    '414': ('Gum Arabic', 'Additives'),
+    '415': ('Xanthan Gum', 'Additives'),
+    '418': ('Gellan Gum', 'Additives'),
+    '420': ('Sorbitol', 'Additives'),
+    '422': ('Glycerol', 'Additives'),
+    '440': ('Pectin', 'Additives'),
+    '450': ('Diphosphates', 'Additives'),
+    '451': ('Triphosphates', 'Additives'),
+    '452': ('Polyphosphates', 'Additives'),
+    '460': ('Cellulose', 'Additives'),
+    '466': ('Carboxymethyl Cellulose', 'Highly Processed'),
+    '471': ('Mono- and Diglycerides of Fatty Acids', 'Highly Processed'),
+    '472e': ('DATEM', 'Highly Processed'),
+    '476': ('Polyglycerol Polyricinoleate', 'Highly Processed'),
+    '481': ('Sodium Stearoyl Lactylate', 'Highly Processed'),
+    '482': ('Calcium Stearoyl Lactylate', 'Highly Processed'),
+    '491': ('Sorbitan Monostearate', 'Highly Processed'),
+    # Raising agents, anticaking agents and minerals
+    '500': ('Sodium Carbonates', 'Additives'),
+    '500ii': ('Sodium Bicarbonate', 'Additives'),
+    '501': ('Potassium Carbonates', 'Additives'),
+    '503': ('Ammonium Carbonates', 'Additives'),
+    '503ii': ('Ammonium Bicarbonate', 'Additives'),
+    '504': ('Magnesium Carbonates', 'Additives'),
+    '508': ('Potassium Chloride', 'Additives'),
+    '509': ('Calcium Chloride', 'Additives'),
+    '516': ('Calcium Sulphate', 'Additives'),
+    '524': ('Sodium Hydroxide', 'Additives'),
+    '551': ('Silicon Dioxide', 'Additives'),
+    '170': ('Calcium Carbonate', 'Additives'),
+    # Flavour enhancers
+    '620': ('Glutamic Acid', 'Additives'),
+    '621': ('Monosodium Glutamate', 'Additives'),
+    '627': ('Disodium Guanylate', 'Additives'),
+    '631': ('Disodium Inosinate', 'Additives'),
+    '635': ('Disodium 5\'-Ribonucleotides', 'Additives'),
+    # Glazing agents and sweeteners
+    '901': ('Beeswax', 'Natural'),
+    '903': ('Carnauba Wax', 'Additives'),
+    '904': ('Shellac', 'Additives'),
+    '950': ('Acesulfame Potassium', 'Highly Processed'),
+    '951': ('Aspartame', 'Highly Processed'),
+    '952': ('Cyclamate', 'Highly Processed'),
+    '954': ('Saccharin', 'Highly Processed'),
+    '955': ('Sucralose', 'Highly Processed'),
+    '960': ('Steviol Glycosides', 'Additives'),
+    '965': ('Maltitol', 'Additives'),
+    '967': ('Xylitol', 'Additives'),
+    # Modified starches and other processing agents
+    '1100': ('Amylase', 'Additives'),
+    '1400': ('Dextrin', 'Highly Processed'),
+    '1412': ('Distarch Phosphate', 'Highly Processed'),
+    '1422': ('Acetylated Distarch Adipate', 'Highly Processed'),
+    '1442': ('Hydroxypropyl Distarch Phosphate', 'Highly Processed'),
+    '1450': ('Starch Sodium Octenyl Succinate', 'Highly Processed'),
+    '1520': ('Propylene Glycol', 'Highly Processed'),
+}
+
+# Functional class names printed on labels, most specific first
+CLASS_NAMES = [
+    ('natural colou?rs?', 'Natural'),
+    ('nature identical flavou?r(?:ing)?s?(?: substances?)?', 'Additives'),
+    ('artificial flavou?r(?:ing)?s?(?: substances?)?', 'Highly Processed'),
+    ('(?:synthetic |artificial |permitted )?(?:food )?colou?rs?', 'Artificial Colors'),
+    ('preservatives?', 'Preservatives'),
+    ('antioxidants?', 'Preservatives'),
+    ('class ii preservatives?', 'Preservatives'),
+    ('acidity regulators?', 'Additives'),
+    ('acidulants?', 'Additives'),
+    ('raising agents?', 'Additives'),
+    ('leavening agents?', 'Additives'),
+    ('emulsif(?:ier|iers|ying agents?)', 'Additives'),
+    ('stabili[sz]ers?', 'Additives'),
+    ('thickeners?', 'Additives'),
+    ('gelling agents?', 'Additives'),
+    ('anti-?caking agents?', 'Additives'),
+    ('humectants?', 'Additives'),
+    ('glazing agents?', 'Additives'),
+    ('firming agents?', 'Additives'),
+    ('flour treatment agents?', 'Additives'),
+    ('(?:dough |bread )?improvers?', 'Additives'),
+    ('flavou?r enhancers?', 'Additives'),
+    ('(?:artificial )?sweeteners?', 'Highly Processed'),
+    ('modified (?:food )?starch(?:es)?', 'Highly Processed'),
+]
+
+# Broad INS ranges for codes missing from the table
+CODE_RANGES = [
+    (100, 199, 'Artificial Colors'),
+    (200, 299, 'Preservatives'),
+    (310, 321, 'Preservatives'),
+    (950, 969, 'Highly Processed'),
+    (1400, 1450, 'Highly Processed'),
+]
+
+# INS numbers run from 100 to 1521; an unprefixed number outside that is a year, weight, etc.
+INS_MIN, INS_MAX = 100, 1521
+
+# How processed a category is, used when one item carries several codes
+SEVERITY = ['Natural', 'Additives', 'Preservatives', 'Highly Processed', 'Artificial Colors']
+
+CODE = r'\d{3,4}[a-z]?(?:\s*\(?(?:iv|v?i{1,3}|v)\)?(?![a-z]))?'
+PREFIXED_CODE_PATTERN = re.compile(r'\b(?:ins|e)\s*-?\s*(' + CODE + r')', re.IGNORECASE)
+# A parenthesised group or a whole item that holds nothing but codes, e.g. "(322, 471)"
+BARE_CODES_PATTERN = re.compile(r'^\s*(?:(?:ins|e)\s*-?\s*)?' + CODE + r'(?:\s*[,&/]\s*(?:(?:ins|e)\s*-?\s*)?' + CODE + r')*\s*$', re.IGNORECASE)
+SINGLE_CODE_PATTERN = re.compile(CODE, re.IGNORECASE)
+PAREN_PATTERN = re.compile(r'\(([^()]*)\)')
+PERCENT_GROUP_PATTERN = re.compile(r'^\s*\d+(?:\.\d+)?\s*%\s*$')
+SUB_LIST_PATTERN = re.compile(r'\([^)]*[,;]')
+SUB_INDEX_PATTERN = re.compile(r'(?<=[\da-z])\s*\((iv|v?i{1,3}|v)\)', re.IGNORECASE)
+CLASS_PATTERN = re.compile(
+    r'^\s*(?:' + '|'.join(f'(?P<c{i}>{pattern})' for i, (pattern, _) in enumerate(CLASS_NAMES)) + r')\b',
+    re.IGNORECASE
+)
+
+def normalize_code(code):
+    """'150 d' -> '150d', '500(ii)' -> '500ii'"""
+    return re.sub(r'[\s()]', '', code.lower())
+
+def flatten_sub_indices(text):
+    """'500(ii)' -> '500ii', so code lists hold no nested parentheses"""
+    return SUB_INDEX_PATTERN.sub(r'\1', text)
+
+def plausible_code(code):
+    """Whether an unprefixed number can be an INS code: '330' is, the '2020' of 'Corn (2020)' is not"""
+    if code in ADDITIVES:
+        return True
+    match = re.match(r'(\d+)([a-z]?)', code)
+    # Suffixes run a-f in practice; '500g' is a weight
+    return INS_MIN <= int(match.group(1)) <= INS_MAX and match.group(2) in 'abcdef'
+
+def bare_codes(group):
+    """Codes of a group made of nothing but codes, [] if it is anything else"""
+    if not BARE_CODES_PATTERN.match(group):
+        return []
+    codes = [normalize_code(match) for match in SINGLE_CODE_PATTERN.findall(group)]
+    return codes if all(plausible_code(code) for code in codes) else []
+
+def contains_codes(text):
+    """True if a parenthesised group's content is made of additive codes"""
+    return bool(bare_codes(text) or PREFIXED_CODE_PATTERN.search(text))
+
+def is_compound(ingredient):
+    """True if an item lists its own ingredients, e.g. 'seasoning (sugar, salt, flavour enhancer (627))'
+
+    Groups holding only codes or a percentage are part of the item's name,
+    and a single description such as 'preservative (sodium benzoate)' is not
+    a list; what is left is compound if a group separates several entries.
+    """
+    text = PAREN_PATTERN.sub(
+        lambda match: '' if bare_codes(match.group(1)) or PERCENT_GROUP_PATTERN.match(match.group(1)) else match.group(0),
+        flatten_sub_indices(ingredient.replace('[', '(').replace(']', ')'))
+    )
+    return bool(SUB_LIST_PATTERN.search(text))
+
+def find_codes(ingredient):
+    """Additive codes mentioned in one ingredient item"""
+    # Flatten sub-indices so "(500(ii), 503(ii))" reads as one group of codes; "[322]" reads as "(322)"
+    ingredient = flatten_sub_indices(ingredient.replace('[', '(').replace(']', ')'))
+    codes = [normalize_code(match) for match in PREFIXED_CODE_PATTERN.findall(ingredient)]
+
+    groups = [ingredient] + PAREN_PATTERN.findall(ingredient)
+    for group in groups:
+        codes.extend(bare_codes(group))
+
+    unique = []
+    for code in codes:
+        if code not in unique:
+            unique.append(code)
+    return unique
+
+def code_category(code):
+    """Category of one code from the table, its base code or its INS range.
+
+    Every INS code is an additive, so unlisted codes default to Additives.
+    """
+    if code in ADDITIVES:
+        return ADDITIVES[code][1]
+    base = re.match(r'\d+[a-z]?', code).group(0)
+    if base in ADDITIVES:
+        return ADDITIVES[base][1]
+    number = int(re.match(r'\d+', code).group(0))
+    for low, high, category in CODE_RANGES:
+        if low <= number <= high:
+            return category
+    return 'Additives'
+
+def classify_additive(ingredient):
+    """Classify a coded or class-named additive without the model.
+
+    Returns the category, or None when the item is neither. Known codes win
+    over the class name ("Colour (160a)" is beta-carotene, so Natural); an
+    item with several codes takes the most processed of their categories.
+    Compound items are left to the model, since a code in their sub-list
+    says nothing about the rest of it (see is_compound).
+    """
+    if is_compound(ingredient):
+        return None
+
+    categories = [code_category(code) for code in find_codes(ingredient)]
+    if categories:
+        return max(categories, key=SEVERITY.index)
+
+    match = CLASS_PATTERN.match(ingredient)
+    if match:
+        for i, (_, category) in enumerate(CLASS_NAMES):
+            if match.group(f'c{i}'):
+                return category
+
+    return None
@@ -0,0 +1,161 @@
+import os
+import re
+import copy
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+def normalize_ingredient(name):
+    """Normalize one ingredient for cache keys.
+
+    Lowercases, folds OCR noise (stray bars, quotes, bullets, repeated
+    punctuation) into spaces and collapses whitespace.
+    """
+    name = name.lower()
+    name = re.sub(r'[^a-z0-9%()&\-\s]', ' ', name)
+    name = re.sub(r'\s+', ' ', name)
+    return name.strip(' -')
+
+class AnalysisCache:
+    """Cache of ingredient analyses keyed by the normalized ingredient list.
+
+    The key covers the canonical ingredient list (order kept, since order
+    drives percentages) plus the model/prompt version, so a prompt or model
+    change never serves stale results. There is an in-process LRU tier and a
+    SQLite tier shared by every worker on the machine; both expire entries
+    after ttl seconds and hold at most a fixed number of entries.
+
+    Reads always return a deep copy, so callers may modify the result freely
+    without corrupting what later requests get.
+    """
+
+    def __init__(self, version, ttl=3600, memory_size=512, disk_path=None, max_entries=10000):
+        self.version = str(version)
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.disk_path = disk_path
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if self.disk_path:
+            self._init_disk()
+
+    def key(self, ingredient_names):
+        """Cache key for a list of ingredient names"""
+        normalized = [normalize_ingredient(name) for name in ingredient_names]
+        normalized = [name for name in normalized if name]
+        raw = self.version + '\n' + '|'.join(normalized)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.disk_path, timeout=10, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _init_disk(self):
+        directory = os.path.dirname(self.disk_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with closing(self._connect()) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS analyses (
+                    key TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_accessed ON analyses (accessed_at)")
+
+    def get(self, key):
+        """Return a copy of the cached analysis, or None"""
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                expires_at, result = entry
+                if expires_at > now:
+                    self.memory.move_to_end(key)
+                    self.hits += 1
+                    return copy.deepcopy(result)
+                del self.memory[key]
+
+        entry = self._disk_get(key, now) if self.disk_path else None
+
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._memory_put(key, entry)
+            return copy.deepcopy(entry[1])
+
+    def put(self, key, result):
+        """Store a copy of an analysis"""
+        expires_at = time.time() + self.ttl
+        result = copy.deepcopy(result)
+
+        with self.lock:
+            self._memory_put(key, (expires_at, result))
+
+        if self.disk_path:
+            self._disk_put(key, result, expires_at)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'version': self.version,
+                'memory_entries': len(self.memory),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def _memory_put(self, key, entry):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def _disk_get(self, key, now):
+        try:
+            with closing(self._connect()) as conn:
+                row = conn.execute(
+                    "SELECT result, expires_at FROM analyses WHERE key = ? AND expires_at > ?",
+                    (key, now)
+                ).fetchone()
+                if row is None:
+                    return None
+                conn.execute("UPDATE analyses SET accessed_at = ? WHERE key = ?", (now, key))
+                return row[1], json.loads(row[0])
+        except sqlite3.Error as e:
+            logger.error(f"Analysis cache read failed: {str(e)}")
+            return None
+
+    def _disk_put(self, key, result, expires_at):
+        now = time.time()
+        try:
+            with closing(self._connect()) as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO analyses (key, result, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(result), expires_at, now)
+                )
+                # Drop expired rows, then the least recently used beyond max_entries
+                conn.execute("DELETE FROM analyses WHERE expires_at <= ?", (now,))
+                conn.execute(
+                    "DELETE FROM analyses WHERE key IN ("
+                    "SELECT key FROM analyses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Analysis cache write failed: {str(e)}")
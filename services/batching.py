@@ -0,0 +1,68 @@
+import time
+import queue
+import threading
+import logging
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """Groups concurrent requests into batches for a single model call.
+
+    Callers submit an item and block on the returned future. A collector
+    thread waits for the first item, then keeps collecting for up to
+    max_wait seconds or until max_size items are pending, and hands the
+    batch to run_batch. run_batch(items) must return one entry per item,
+    either a result or an Exception; exceptions are raised to that caller
+    only, so one bad item does not fail the rest of the batch. Items left
+    without an entry get an error rather than waiting forever.
+    """
+
+    def __init__(self, run_batch, max_wait=0.2, max_size=4):
+        self.run_batch = run_batch
+        self.max_wait = max_wait
+        self.max_size = max_size
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name='llm-batcher', daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        """Queue an item and return a Future for its result"""
+        future = Future()
+        self.pending.put((item, future))
+        return future
+
+    def _collect(self):
+        batch = [self.pending.get()]
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            logger.debug(f"Running batch of {len(items)}")
+
+            try:
+                results = self.run_batch(items)
+            except Exception as e:
+                results = [e] * len(batch)
+
+            if len(results) != len(batch):
+                logger.error(f"Batch returned {len(results)} results for {len(batch)} items")
+                missing = RuntimeError("No result was returned for this item")
+                results = list(results[:len(batch)]) + [missing] * (len(batch) - len(results))
+
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
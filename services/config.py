@@ -1,4 +1,5 @@
 import os
+import shutil
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -11,7 +12,8 @@ class Config:
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
     
     # Tesseract Configuration
-    TESSERACT_PATH = os.getenv('TESSERACT_PATH', r'C:\Program Files\Tesseract-OCR\tesseract.exe')
+    # The binary on PATH, else the default Windows install location
+    TESSERACT_PATH = os.getenv('TESSERACT_PATH') or shutil.which('tesseract') or r'C:\Program Files\Tesseract-OCR\tesseract.exe'
     
     # MongoDB Configuration
     MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
@@ -25,9 +27,85 @@ class Config:
     MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10MB
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
     
+    # OCR Configuration
+    OCR_BACKEND = os.getenv('OCR_BACKEND', 'auto')  # auto, tesserocr or pytesseract
+    TESSDATA_PATH = os.getenv('TESSDATA_PREFIX')  # traineddata directory for tesserocr
+    OCR_CONFIGS = [
+        '--oem 3 --psm 6',  # Assume uniform block of text
+        '--oem 3 --psm 4',  # Assume single column of text
+        '--oem 3 --psm 3',  # Fully automatic page segmentation
+    ]
+    OCR_MAX_WORKERS = int(os.getenv('OCR_MAX_WORKERS', min(3, os.cpu_count() or 1)))
+    OCR_CONFIDENCE_CUTOFF = float(os.getenv('OCR_CONFIDENCE_CUTOFF', 85))  # Stop once a pass reaches this
+    OCR_RANKING_HISTORY = 500  # Winning configs remembered for re-ranking
+    OCR_TARGET_TEXT_HEIGHT = int(os.getenv('OCR_TARGET_TEXT_HEIGHT', 32))  # Character height in pixels
+    OCR_TARGET_WIDTH = int(os.getenv('OCR_TARGET_WIDTH', 2000))  # Used when text height can't be estimated
+    # Downscaling never goes below this; a close-up label photo keeps enough detail for its smallest print
+    OCR_MIN_WIDTH = int(os.getenv('OCR_MIN_WIDTH', 2000))
+    # JPEGs are decoded at the smallest 1/2, 1/4 or 1/8 scale still this wide (a 4032px photo at 2016px)
+    OCR_MAX_DECODE_WIDTH = int(os.getenv('OCR_MAX_DECODE_WIDTH', OCR_MIN_WIDTH))
+    OCR_MAX_UPSCALE = 2.0
+    OCR_REGIONS_ENABLED = os.getenv('OCR_REGIONS_ENABLED', 'True').lower() == 'true'  # OCR text blocks only
+    OCR_MAX_REGIONS = 8
+    
+    # OCR Cache Configuration
+    OCR_PIPELINE_VERSION = '3'  # Bump when preprocessing changes to invalidate cached results
+    OCR_CACHE_SIZE = int(os.getenv('OCR_CACHE_SIZE', 256))  # In-process entries
+    OCR_CACHE_PATH = os.getenv('OCR_CACHE_PATH')  # SQLite file for the shared tier, disabled if unset
+    OCR_CACHE_MAX_BYTES = int(os.getenv('OCR_CACHE_MAX_BYTES', 50 * 1024 * 1024))
+    
+    # Near-duplicate Image Index Configuration
+    IMAGE_INDEX_ENABLED = os.getenv('IMAGE_INDEX_ENABLED', 'True').lower() == 'true'
+    # Hamming bits out of 64. Re-encodes of one photo land a few bits apart, different products 17+
+    IMAGE_INDEX_MAX_DISTANCE = int(os.getenv('IMAGE_INDEX_MAX_DISTANCE', 6))
+    IMAGE_INDEX_PATH = os.getenv('IMAGE_INDEX_PATH')  # SQLite file, in-memory only if unset
+    
+    # Debug Artifact Configuration
+    DEBUG_ARTIFACTS = os.getenv('DEBUG_ARTIFACTS', 'False').lower() == 'true'
+    DEBUG_ARTIFACTS_DIR = os.getenv('DEBUG_ARTIFACTS_DIR', 'debug_artifacts')
+    DEBUG_ARTIFACTS_SAMPLE_RATE = int(os.getenv('DEBUG_ARTIFACTS_SAMPLE_RATE', 10))  # Capture 1 in N requests
+    DEBUG_ARTIFACTS_MAX_FILES = int(os.getenv('DEBUG_ARTIFACTS_MAX_FILES', 200))
+    
+    # Request Coalescing Configuration
+    SINGLE_FLIGHT_LOCK_DIR = os.getenv('SINGLE_FLIGHT_LOCK_DIR', os.path.join('instance', 'locks'))  # Shared by workers
+    SINGLE_FLIGHT_TIMEOUT = int(os.getenv('SINGLE_FLIGHT_TIMEOUT', 120))  # Seconds to wait on another worker
+    
+    # Admin Console Configuration
+    ADMIN_USERS_PER_PAGE = int(os.getenv('ADMIN_USERS_PER_PAGE', 20))
+    ADMIN_ANALYSES_PER_USER = int(os.getenv('ADMIN_ANALYSES_PER_USER', 5))  # Most recent, shown per user
+    DASHBOARD_ANALYSES_PER_PAGE = int(os.getenv('DASHBOARD_ANALYSES_PER_PAGE', 10))
+    COMPARE_PAGE_SIZE = int(os.getenv('COMPARE_PAGE_SIZE', 20))  # Products loaded into the pickers at a time
+    
+    # Analysis Job Configuration
+    JOB_DB_PATH = os.getenv('JOB_DB_PATH', os.path.join('instance', 'jobs.db'))
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))  # Concurrent analyses per process
+    # Seconds an event stream holds a web worker before the client falls back to polling
+    JOB_STREAM_TIMEOUT = int(os.getenv('JOB_STREAM_TIMEOUT', 30))
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))  # Runs before an abandoned job is marked failed
+    JOB_RETENTION = int(os.getenv('JOB_RETENTION', 86400))  # Seconds finished jobs are kept for status polls
+    
+    # LLM Client Configuration
+    OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434')
+    LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', 3.05))
+    LLM_READ_TIMEOUT = float(os.getenv('LLM_READ_TIMEOUT', 120))  # Max silence between streamed chunks
+    LLM_RETRY_BACKOFF = 0.5  # Base seconds for jittered exponential backoff
+    LLM_POOL_SIZE = int(os.getenv('LLM_POOL_SIZE', 10))  # Keep-alive connections
+    LLM_BREAKER_THRESHOLD = 5  # Consecutive failed calls before failing fast
+    LLM_BREAKER_RESET = 30  # Seconds before a trial call is let through
+    LLM_REASONING = os.getenv('LLM_REASONING', 'off')  # off or capped
+    LLM_REASONING_TOKENS = int(os.getenv('LLM_REASONING_TOKENS', 256))  # Allowance per product when capped
+    LLM_MIN_CTX = 1024  # Smallest num_ctx requested
+    LLM_MAX_CTX = int(os.getenv('LLM_MAX_CTX', 8192))
+    
     # Analysis Configuration
     CACHE_TIMEOUT = 3600  # 1 hour
-    MAX_RETRIES = 3
+    ANALYSIS_CACHE_SIZE = int(os.getenv('ANALYSIS_CACHE_SIZE', 512))  # In-process entries
+    ANALYSIS_CACHE_PATH = os.getenv('ANALYSIS_CACHE_PATH', os.path.join('instance', 'analysis_cache.db'))
+    ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', 10000))
+    LLM_BATCH_ENABLED = os.getenv('LLM_BATCH_ENABLED', 'True').lower() == 'true'
+    LLM_BATCH_MAX_WAIT = float(os.getenv('LLM_BATCH_MAX_WAIT', 0.25))  # Seconds to collect a batch
+    LLM_BATCH_MAX_SIZE = int(os.getenv('LLM_BATCH_MAX_SIZE', 4))  # Products per model call
+    MAX_RETRIES = int(os.getenv('MAX_RETRIES', 3))  # Retries for transient model server errors
     
     @classmethod
     def validate(cls):
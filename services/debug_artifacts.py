@@ -0,0 +1,73 @@
+import os
+import glob
+import time
+import queue
+import threading
+import itertools
+import logging
+import cv2
+
+logger = logging.getLogger(__name__)
+
+class DebugArtifactWriter:
+    """Writes OCR debug images off the request thread.
+
+    Only one in every sample_rate requests is captured. Images are encoded by
+    a single background thread into per-request files under directory, and
+    the directory is trimmed to the newest max_files files. When the write
+    queue is full, artifacts are dropped rather than slowing the request down.
+    """
+
+    def __init__(self, directory, sample_rate=1, max_files=200, queue_size=16):
+        self.directory = directory
+        self.sample_rate = max(1, int(sample_rate))
+        self.max_files = max_files
+        self.counter = itertools.count()
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.thread = threading.Thread(target=self._run, name='debug-artifacts', daemon=True)
+        self.thread.start()
+
+    def should_capture(self):
+        """Decide whether the current request is sampled"""
+        return next(self.counter) % self.sample_rate == 0
+
+    def submit(self, request_key, images):
+        """Queue images for writing
+
+        Parameters:
+        - request_key: Short identifier used in the file names
+        - images: Dict of name -> PIL image or numpy array
+        """
+        prefix = f"{time.strftime('%Y%m%d-%H%M%S')}_{request_key}"
+        try:
+            self.queue.put_nowait((prefix, images))
+        except queue.Full:
+            logger.debug("Debug artifact queue full, dropping artifacts")
+
+    def _run(self):
+        while True:
+            prefix, images = self.queue.get()
+            try:
+                for name, image in images.items():
+                    path = os.path.join(self.directory, f"{prefix}_{name}.png")
+                    if hasattr(image, 'save'):
+                        image.save(path)
+                    else:
+                        cv2.imwrite(path, image)
+                self._trim()
+            except Exception as e:
+                logger.error(f"Error writing debug artifacts: {str(e)}")
+            finally:
+                self.queue.task_done()
+
+    def _trim(self):
+        """Delete the oldest files beyond max_files"""
+        files = sorted(glob.glob(os.path.join(self.directory, '*.png')), key=os.path.getmtime)
+        for path in files[:max(0, len(files) - self.max_files)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,179 @@
+import os
+import json
+import sqlite3
+import threading
+import logging
+from contextlib import closing
+import numpy as np
+import cv2
+
+logger = logging.getLogger(__name__)
+
+def dhash(image, hash_size=8):
+    """64-bit difference hash of a PIL image.
+
+    The image is shrunk to (hash_size + 1) x hash_size grayscale pixels and each
+    bit records whether a pixel is brighter than its right neighbour. Re-shoots,
+    small crops and JPEG re-encodes of the same label land a few bits apart.
+    """
+    gray = np.array(image.convert('L'))
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes using Hamming distance.
+
+    A lookup only descends into children whose edge distance lies within
+    the search radius of the query, so it visits a small part of the tree
+    instead of every stored hash.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, key, value):
+        """Insert a hash. An existing identical hash gets its value replaced."""
+        if self.root is None:
+            self.root = [key, value, {}]
+            self.size = 1
+            return
+
+        node = self.root
+        while True:
+            distance = hamming(key, node[0])
+            if distance == 0:
+                node[1] = value
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, value, {}]
+                self.size += 1
+                return
+            node = child
+
+    def find(self, key, max_distance):
+        """Return the closest (distance, key, value) within max_distance, or None"""
+        if self.root is None:
+            return None
+
+        best = None
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(key, node[0])
+            if distance <= max_distance and (best is None or distance < best[0]):
+                best = (distance, node[0], node[1])
+                if distance == 0:
+                    break
+
+            low, high = distance - max_distance, distance + max_distance
+            for edge, child in node[2].items():
+                if low <= edge <= high:
+                    stack.append(child)
+
+        return best
+
+    def __len__(self):
+        return self.size
+
+class ImageIndex:
+    """Near-duplicate lookup of previously processed label images.
+
+    Each entry maps the perceptual hash of an upload to its OCR result and,
+    once the upload has been analysed, the id of the saved analysis. Entries
+    are kept in a BK-tree in memory and, when disk_path is set, persisted to
+    SQLite so the index survives restarts.
+    """
+
+    def __init__(self, max_distance=10, disk_path=None):
+        self.max_distance = max_distance
+        self.disk_path = disk_path
+        self.tree = BKTree()
+        self.lock = threading.Lock()
+
+        if self.disk_path:
+            self._load()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.disk_path, timeout=10, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _load(self):
+        directory = os.path.dirname(self.disk_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with closing(self._connect()) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS image_hashes (
+                    phash TEXT PRIMARY KEY,
+                    entry TEXT NOT NULL
+                )
+            """)
+            for phash, entry in conn.execute("SELECT phash, entry FROM image_hashes"):
+                self.tree.add(int(phash, 16), json.loads(entry))
+
+        logger.info(f"Loaded {len(self.tree)} image hashes")
+
+    def lookup(self, phash):
+        """Return the entry of the closest earlier upload, or None.
+
+        The entry carries the stored hash as 'phash' so callers can attach an
+        analysis to the matched image.
+        """
+        with self.lock:
+            match = self.tree.find(phash, self.max_distance)
+        if match is None:
+            return None
+
+        distance, key, entry = match
+        result = dict(entry)
+        result.update({'phash': key, 'distance': distance})
+        return result
+
+    def add(self, phash, ocr_result):
+        """Record the OCR result for a newly processed image"""
+        entry = {
+            'text': ocr_result['text'],
+            'config': ocr_result.get('config'),
+            'confidence': ocr_result.get('confidence', 0),
+            'analysis_id': None,
+        }
+        with self.lock:
+            self.tree.add(phash, entry)
+        self._persist(phash, entry)
+
+    def attach_analysis(self, phash, analysis_id):
+        """Link a saved analysis to an image so later near-duplicates can reuse it"""
+        with self.lock:
+            match = self.tree.find(phash, 0)
+            if match is None:
+                return
+            entry = match[2]
+            entry['analysis_id'] = str(analysis_id)
+        self._persist(phash, entry)
+
+    def _persist(self, phash, entry):
+        if not self.disk_path:
+            return
+        try:
+            with closing(self._connect()) as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO image_hashes (phash, entry) VALUES (?, ?)",
+                    (format(phash, '016x'), json.dumps(entry))
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Image index write failed: {str(e)}")
+
+    def __len__(self):
+        return len(self.tree)
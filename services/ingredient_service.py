@@ -1,17 +1,155 @@
-import os
-import json
 import requests
 from dotenv import load_dotenv
+import re
 import logging
-from functools import lru_cache
+from .streaming import read_json_stream, JSONObjectScanner
+from .batching import MicroBatcher
+from .llm_client import get_llm_client, LLMUnavailableError
+from .llm_schema import ANALYSIS_SCHEMA, CATEGORIES, AnalysisParseError, batch_schema, response_parser
+from .prompts import get_prompt
+from .token_budget import token_budget, token_meter
+from .analysis_cache import AnalysisCache
+from .single_flight import SingleFlight
+from .additives import classify_additive, contains_codes, flatten_sub_indices, TABLE_VERSION as ADDITIVES_VERSION
+from .scoring import score_analysis, category_health_score, declared_percentage, SCORING_VERSION
+from .config import Config
 
 logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
+SCORE_FIELDS = ["processing_score", "health_impact_score", "nutrient_density_score"]
+
+def canonical_name(name):
+    """Canonical form of an ingredient name used as the knowledge key.
+    
+    Lowercases, drops percentage annotations like "(12%)" and surrounding
+    punctuation, and collapses whitespace, so "Salt.", " SALT " and
+    "salt (2%)" all map to "salt".
+    """
+    name = name.lower()
+    name = re.sub(r'\(\s*[\d.]+\s*%\s*\)', '', name)
+    name = re.sub(r'\s+', ' ', name)
+    return name.strip(' .,;:*-')
+
+def split_top_level(text, delimiters=',;'):
+    """Split text on delimiters outside parentheses and brackets.
+    
+    A '.' between two digits is a decimal point, not a delimiter.
+    """
+    parts = []
+    depth = 0
+    current = ''
+    for i, char in enumerate(text):
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth = max(0, depth - 1)
+        decimal = char == '.' and 0 < i < len(text) - 1 and text[i - 1].isdigit() and text[i + 1].isdigit()
+        if char in delimiters and depth == 0 and not decimal:
+            parts.append(current)
+            current = ''
+        else:
+            current += char
+    parts.append(current)
+    return parts
+
+def split_ingredients(ingredients_text):
+    """Split an ingredient list on commas/semicolons outside parentheses"""
+    return [name.strip() for name in split_top_level(ingredients_text) if canonical_name(name)]
+
+def strip_qualifiers(ingredient):
+    """Drop parenthesised qualifiers such as "(cane)" from an ingredient.
+    
+    Additive codes like "(322)" or "(INS 150d)", declared shares like "(62%)"
+    that the scoring reads, and sub-ingredient lists of compound items like
+    "seasoning (sugar, salt, ...)" are kept.
+    """
+    kept = ''
+    group = ''
+    depth = 0
+    for char in ingredient:
+        if depth == 0 and char not in '([':
+            kept += char
+            continue
+        group += char
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+            if depth == 0:
+                inner = group[1:-1]
+                if contains_codes(inner) or declared_percentage(inner) is not None or re.search(r'[,;]', inner):
+                    kept += group
+                group = ''
+    # An unclosed group is left as it was
+    return kept + group
+
+def process_ingredients(text):
+    """Process and clean ingredients text."""
+    if not text:
+        return []
+        
+    # Remove common prefixes
+    text = re.sub(r'^ingredients:?\s*', '', text.lower(), flags=re.IGNORECASE)
+    
+    # Split ingredients by common delimiters, but not inside (nested) parentheses
+    ingredients = split_top_level(flatten_sub_indices(text), ',;.')
+    
+    # Clean and filter ingredients
+    cleaned_ingredients = []
+    for ingredient in ingredients:
+        # Clean the ingredient
+        ingredient = ingredient.strip()
+        # Remove qualifiers in parentheses, keeping codes, shares and sub-ingredient lists
+        ingredient = strip_qualifiers(ingredient)
+        ingredient = re.sub(r'\s+', ' ', ingredient).strip()  # Normalize whitespace
+        
+        # Skip if too short or empty
+        if len(ingredient) < 2:
+            continue
+            
+        # Skip if it's just numbers or symbols
+        if re.match(r'^[\d\W]+$', ingredient):
+            continue
+            
+        cleaned_ingredients.append(ingredient)
+    
+    return cleaned_ingredients
+
+def align_labels(names, known, generated=(), categories=CATEGORIES):
+    """Labelled ingredients in label order.
+    
+    Each name takes its label from known (keyed by canonical name) or from
+    the model's generated entries; names without a valid label are left out.
+    Generated entries that match no name (the model renamed them) are kept
+    at the end rather than dropped.
+    """
+    generated = {
+        canonical_name(ingredient['name']): ingredient
+        for ingredient in generated
+        if isinstance(ingredient, dict) and isinstance(ingredient.get('name'), str)
+    }
+    
+    ingredients = []
+    for name in names:
+        key = canonical_name(name)
+        entry = known.get(key) or generated.pop(key, None)
+        if not entry or entry.get('category') not in categories:
+            continue
+        ingredient = {'name': name, 'category': entry['category']}
+        ingredient.update({field: entry[field] for field in SCORE_FIELDS if field in entry})
+        ingredients.append(ingredient)
+    
+    for ingredient in generated.values():
+        if ingredient.get('category') in categories:
+            ingredients.append(ingredient)
+    
+    return ingredients
+
 class IngredientService:
-    def __init__(self):
+    def __init__(self, knowledge=None):
         self.categories = ["Natural", "Additives", "Preservatives", "Artificial Colors", "Highly Processed"]
         self.category_colors = {
             "Natural": "#4CAF50",  # Green
@@ -20,7 +158,39 @@ class IngredientService:
             "Artificial Colors": "#F44336",  # Red
             "Highly Processed": "#9C27B0"  # Purple
         }
-        self.ollama_url = "http://localhost:11434/api/generate"
+        self.llm = get_llm_client()
+        self.model = "deepseek-r1:8b"
+        self.prompt = get_prompt('analysis')
+        self.batch_prompt = get_prompt('analysis_batch')
+        
+        # Per-ingredient classifications learned from earlier model responses
+        self.knowledge = knowledge
+        
+        # Finished analyses, shared with the other workers through SQLite. The prompt, additive
+        # table and scoring versions are part of the key so changes never serve stale results
+        self.cache = AnalysisCache(
+            f"{self.model}:{self.prompt.key}:additives@{ADDITIVES_VERSION}:scoring@{SCORING_VERSION}",
+            ttl=Config.CACHE_TIMEOUT,
+            memory_size=Config.ANALYSIS_CACHE_SIZE,
+            disk_path=Config.ANALYSIS_CACHE_PATH,
+            max_entries=Config.ANALYSIS_CACHE_MAX_ENTRIES
+        )
+        
+        # Identical ingredient lists in flight at once, in any worker, share one analysis
+        self.flight = SingleFlight(
+            'analysis',
+            lock_dir=Config.SINGLE_FLIGHT_LOCK_DIR if Config.ANALYSIS_CACHE_PATH else None,
+            lock_timeout=Config.SINGLE_FLIGHT_TIMEOUT
+        )
+        
+        # Concurrent requests share one model call per batch
+        self.batcher = None
+        if Config.LLM_BATCH_ENABLED and Config.LLM_BATCH_MAX_SIZE > 1:
+            self.batcher = MicroBatcher(
+                self.generate_batch,
+                max_wait=Config.LLM_BATCH_MAX_WAIT,
+                max_size=Config.LLM_BATCH_MAX_SIZE
+            )
         
     def normalize_percentages(self, percentages):
         """Normalize percentages to ensure they sum to 100%."""
@@ -30,64 +200,253 @@ class IngredientService:
             return {k: 20 for k in self.categories}
         return {k: round((v / total) * 100, 1) for k, v in percentages.items()}
 
-    @lru_cache(maxsize=100)
-    def analyze_ingredients(self, ingredients_text):
-        """Analyze ingredients using Deepseek LLM via Ollama."""
+    def build_prompt(self, ingredients_text):
+        """Prompt asking the model for the analysis JSON."""
+        return self.prompt.render(ingredients=ingredients_text)
+
+    def build_batch_prompt(self, ingredient_texts):
+        """Prompt asking for one analysis per product, keyed "p1", "p2", ..."""
+        products = "\n".join(
+            f"p{i}: {text}" for i, text in enumerate(ingredient_texts, 1)
+        )
+        return self.batch_prompt.render(products=products)
+
+    def analyze_ingredients(self, ingredients_text, on_progress=None):
+        """Analyze ingredients using Deepseek LLM via Ollama.
+        
+        Results are cached on the normalized ingredient list, and concurrent
+        calls for the same list share one analysis; only the caller doing the
+        work receives on_progress updates. Every call returns its own copy, so
+        callers may modify it.
+        """
+        key = self.cache.key(split_ingredients(ingredients_text or ''))
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.info("Analysis cache hit")
+            return cached
+        
+        def analyze():
+            analysis = self.analyze_ingredients_stream(ingredients_text, on_progress)
+            self.cache.put(key, analysis)
+            return analysis
+        
+        return self.flight.do(key, analyze, lookup=lambda: self.cache.get(key))
+
+    def calculate_health_score(self, percentages):
+        """Calculate health score based on ingredient percentages"""
+        return category_health_score(percentages)
+
+    def analyze_ingredients_stream(self, ingredients_text, on_progress=None):
+        """Analyze ingredients, reading the model output as it is generated.
+        
+        Coded additives ("INS 621", "Colour (150d)") and additive class names
+        are classified from the built-in additive table, and ingredients already
+        in the knowledge store are resolved locally. Only the unknown remainder
+        is sent to the model, which returns per-ingredient labels; when
+        everything is known the model is skipped. Percentages and the health
+        score are always computed locally (see build_local_analysis).
+        Generation is stopped as soon as the result object is complete.
+        on_progress receives partial progress (see read_json_stream) while the
+        model is working.
+        """
         try:
             # Clean and validate input text
             if not ingredients_text or len(ingredients_text.strip()) < 3:
                 raise ValueError("No valid ingredients text provided")
 
-            # Prepare the prompt
-            prompt = f"""You are an expert in analyzing food ingredients. Analyze these ingredients: {ingredients_text}
-
-Return the analysis in this exact JSON format:
-{{
-    "health_score": <score>,
-    "ingredients": [{{"name": "<ingredient>", "category": "<category>"}}],
-    "ingredient_percentages": {{
-        "Natural": <percentage>,
-        "Additives": <percentage>,
-        "Preservatives": <percentage>,
-        "Artificial Colors": <percentage>,
-        "Highly Processed": <percentage>
-    }}
-}}
-
-Categories should be one of: Natural, Additives, Preservatives, Artificial Colors, Highly Processed.
-Health score should be between 0-10, where 10 is the healthiest.
-Make sure the percentages sum to 100%."""
-
-            try:
-                # Call Ollama API
-                response = requests.post(
-                    self.ollama_url,
-                    json={
-                        "model": "deepseek-r1:8b",
-                        "prompt": prompt,
-                        "stream": False
-                    }
-                )
-                response.raise_for_status()
-                
-                # Parse response
-                result = response.json()["response"]
-                # Extract JSON from the response text
-                json_str = result[result.find("{"):result.rfind("}")+1]
-                analysis = json.loads(json_str)
-                
-                # Normalize percentages
-                analysis['ingredient_percentages'] = self.normalize_percentages(analysis['ingredient_percentages'])
-                
-                return analysis
-                
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Error calling Ollama API: {str(e)}")
-                raise ValueError("Failed to connect to Ollama. Make sure Ollama is running and Deepseek model is installed.")
-            except json.JSONDecodeError as e:
-                logger.error(f"Error parsing LLM response: {str(e)}")
-                raise ValueError("Failed to parse the LLM response. The model might have returned an invalid format.")
+            names = split_ingredients(ingredients_text)
+            known = self.classify_additives(names)
+            remaining = [canonical_name(name) for name in names if canonical_name(name) not in known]
+            if self.knowledge is not None and remaining:
+                known.update(self.knowledge.lookup(remaining))
+            unknown = [name for name in names if canonical_name(name) not in known]
+            
+            if names and not unknown:
+                logger.info(f"All {len(names)} ingredients known, skipping the model")
+                return self.build_local_analysis(names, known)
+            
+            if known:
+                logger.info(f"{len(known)} ingredients known, sending {len(unknown)} to the model")
+                analysis = self.generate_analysis(', '.join(unknown), on_progress)
+            else:
+                analysis = self.generate_analysis(ingredients_text, on_progress)
+            
+            self.learn(analysis)
+            
+            return self.build_local_analysis(names, known, analysis.get('ingredients', []))
                     
         except Exception as e:
             logger.error(f"Error in analyze_ingredients: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+    def generate_analysis(self, ingredients_text, on_progress=None):
+        """Ask the model to label the ingredients of a list.
+        
+        With batching enabled the list waits briefly for other requests and is
+        analyzed together with them in a single model call.
+        """
+        if self.batcher is None:
+            return self.generate_single(ingredients_text, on_progress)
+        return self.batcher.submit((ingredients_text, on_progress)).result()
+
+    def generate_batch(self, items):
+        """Analyze a batch of (ingredients_text, on_progress) items in one model call.
+        
+        Returns one analysis or exception per item. Products whose section of
+        the response is missing or malformed are retried on their own; when
+        the model call itself fails every item gets that error, since retrying
+        them one by one would only repeat the failing call.
+        """
+        if len(items) == 1:
+            text, on_progress = items[0]
+            try:
+                return [self.generate_single(text, on_progress)]
+            except Exception as e:
+                return [e]
+        
+        logger.info(f"Analyzing {len(items)} products in one model call")
+        
+        def batch_progress(progress):
+            # Names seen so far belong to several products, so only report the phase
+            for _, on_progress in items:
+                if on_progress:
+                    on_progress(dict(progress, ingredients=[], batch_size=len(items)))
+        
+        texts = [text for text, _ in items]
+        try:
+            json_str = self.request_json(
+                self.batch_prompt, self.build_batch_prompt(texts), batch_schema(len(items)),
+                sum(len(split_ingredients(text)) for text in texts), len(items), batch_progress
+            )
+        except ValueError as e:
+            logger.error(f"Batch analysis failed: {str(e)}")
+            return [e] * len(items)
+        
+        sections = self.split_batch_response(json_str, len(items))
+        
+        results = []
+        for (text, on_progress), section in zip(items, sections):
+            try:
+                if section is None:
+                    logger.warning("Product missing from batch response, analyzing it separately")
+                    results.append(self.generate_single(text, on_progress))
+                else:
+                    results.append(section)
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def split_batch_response(self, json_str, count):
+        """Split a keyed batch response into per-product analyses.
+        
+        When the whole response does not validate, each product's section is
+        parsed on its own, so one malformed section does not lose the others.
+        Missing or invalid sections come back as None.
+        """
+        try:
+            parsed = response_parser.parse(json_str, batch_schema(count))
+            return [parsed[f"p{i}"] for i in range(1, count + 1)]
+        except AnalysisParseError as e:
+            logger.warning(f"Batch response invalid, parsing products separately: {str(e)}")
+        
+        sections = []
+        for i in range(1, count + 1):
+            section = None
+            match = re.search(r'"p%d"\s*:\s*\{' % i, json_str)
+            if match:
+                scanner = JSONObjectScanner()
+                scanner.feed(json_str[match.end() - 1:])
+                try:
+                    section = response_parser.parse(scanner.result(), ANALYSIS_SCHEMA)
+                except AnalysisParseError:
+                    section = None
+            sections.append(section)
+        return sections
+
+    def request_json(self, template, prompt, schema, ingredient_count, products=1, on_progress=None):
+        """Send a prompt to Ollama and return the JSON text of the response.
+        
+        The schema is passed as Ollama's `format`, which constrains generation
+        to JSON of that shape. Output and context sizes come from the token
+        budget for the template and the number of ingredients.
+        """
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "format": schema,
+            "stream": True
+        }
+        payload.update(token_budget.request_fields(template, prompt, ingredient_count, products))
+        
+        try:
+            # Call Ollama API
+            response = self.llm.generate(payload)
+            
+            # Read chunks until the JSON object is complete
+            stream_stats = {}
+            json_str = read_json_stream(response, on_progress, stats=stream_stats)
+            token_meter.record(template.key, stream_stats)
+            return json_str
+            
+        except LLMUnavailableError as e:
+            logger.error(f"Ollama unavailable: {str(e)}")
+            raise ValueError("The analysis model is currently unavailable. Please try again shortly.")
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error calling Ollama API: {str(e)}")
+            raise ValueError("Failed to connect to Ollama. Make sure Ollama is running and Deepseek model is installed.")
+
+    def generate_single(self, ingredients_text, on_progress=None):
+        """Ask the model to label one ingredient list on its own."""
+        # Prepare the prompt
+        prompt = self.build_prompt(ingredients_text)
+
+        try:
+            json_str = self.request_json(
+                self.prompt, prompt, ANALYSIS_SCHEMA, len(split_ingredients(ingredients_text)), on_progress=on_progress
+            )
+            return response_parser.parse(json_str, ANALYSIS_SCHEMA)
+            
+        except AnalysisParseError as e:
+            logger.error(f"Error parsing LLM response: {str(e)}")
+            raise ValueError("Failed to parse the LLM response. The model might have returned an invalid format.")
+
+    def classify_additives(self, names):
+        """Classify coded and class-named additives without the model"""
+        classified = {}
+        for name in names:
+            category = classify_additive(name)
+            if category:
+                classified[canonical_name(name)] = {'category': category}
+        return classified
+
+    def learn(self, analysis):
+        """Store the validated per-ingredient classifications of a model response"""
+        if self.knowledge is None:
+            return
+        
+        entries = {}
+        for ingredient in analysis.get('ingredients', []):
+            if not isinstance(ingredient, dict):
+                continue
+            name = ingredient.get('name')
+            category = ingredient.get('category')
+            if not isinstance(name, str) or not canonical_name(name) or category not in self.categories:
+                continue
+            
+            # The model labels categories only (see ANALYSIS_SCHEMA), so that is all there is to keep
+            entries[canonical_name(name)] = {'category': category}
+        
+        if entries:
+            try:
+                self.knowledge.learn(entries)
+            except Exception as e:
+                logger.error(f"Error updating ingredient knowledge: {str(e)}")
+
+    def build_local_analysis(self, names, known, generated=()):
+        """Combine known and freshly generated classifications into one analysis.
+        
+        Ingredients keep their label order. Their shares of the product are
+        estimated from that order and any declared percentages, and the
+        category percentages and health score are computed from them.
+        """
+        return score_analysis(align_labels(names, known, generated, self.categories))
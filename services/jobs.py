@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import logging
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+class JobQueue:
+    """Local job queue for analysis work, backed by SQLite.
+
+    Jobs are stored in a SQLite file so they survive restarts and every
+    gunicorn worker on the machine can pick them up. Each process runs a
+    bounded pool of worker threads that claim queued jobs one at a time.
+    A job whose worker stopped updating it for longer than the lease is
+    handed out again, so work interrupted by a restart is retried; after
+    max_attempts runs it is marked failed instead, so a job that crashes
+    or hangs its worker is not retried forever. Finished jobs are deleted
+    retention_seconds after they end; the workers check for them every
+    cleanup_interval seconds.
+
+    Job status goes queued -> running -> done | failed. While running, the
+    handler reports its current stage (e.g. 'ocr', 'analyzing') through the
+    progress callback.
+    """
+
+    def __init__(self, db_path, workers=2, lease_seconds=600, poll_interval=1.0, max_attempts=3,
+                 retention_seconds=86400, cleanup_interval=600):
+        self.db_path = db_path
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self.cleanup_interval = cleanup_interval
+        self.last_cleanup = 0
+        self.cleanup_lock = threading.Lock()
+        self.handler_func = None
+        self.threads = []
+        self.wakeup = threading.Event()
+        self.changed = threading.Condition()
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with closing(self._connect()) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    owner TEXT,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    detail TEXT,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+            columns = [row['name'] for row in conn.execute("PRAGMA table_info(jobs)")]
+            if 'detail' not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN detail TEXT")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def handler(self, func):
+        """Register the function that runs jobs and start the workers.
+
+        The handler is called as func(job_id, payload, progress) and returns a
+        JSON-serializable result. progress(stage, detail=None) records the
+        current stage and optional JSON-serializable partial progress.
+        Used as a decorator.
+        """
+        self.handler_func = func
+        self.start()
+        return func
+
+    def start(self):
+        if self.threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, payload, owner=None):
+        """Queue a job and return its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, owner, status, stage, payload, created_at, updated_at) "
+                "VALUES (?, ?, 'queued', 'queued', ?, ?, ?)",
+                (job_id, owner, json.dumps(payload), now, now)
+            )
+        self.wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        """Return the public view of a job, or None"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT id, owner, status, stage, detail, result, error, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        return {
+            'job_id': row['id'],
+            'owner': row['owner'],
+            'status': row['status'],
+            'stage': row['stage'],
+            'detail': json.loads(row['detail']) if row['detail'] else None,
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+        }
+
+    def wait_for_change(self, timeout):
+        """Block until a job in this process changes or the timeout passes"""
+        with self.changed:
+            self.changed.wait(timeout)
+
+    def _notify(self):
+        with self.changed:
+            self.changed.notify_all()
+
+    def _update(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        columns = ', '.join(f"{name} = ?" for name in fields)
+        with closing(self._connect()) as conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+        self._notify()
+
+    def _claim(self):
+        """Atomically take the oldest queued (or abandoned) job"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            abandoned = conn.execute(
+                "UPDATE jobs SET status = 'failed', stage = 'failed', error = ?, payload = '{}', updated_at = ? "
+                "WHERE status = 'running' AND updated_at < ? AND attempts >= ?",
+                (f"Gave up after {self.max_attempts} attempts", now, now - self.lease_seconds, self.max_attempts)
+            ).rowcount
+            if abandoned:
+                logger.error(f"Marked {abandoned} abandoned job(s) failed after {self.max_attempts} attempts")
+            row = conn.execute(
+                "SELECT id, payload FROM jobs "
+                "WHERE status = 'queued' OR (status = 'running' AND updated_at < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now - self.lease_seconds,)
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                if abandoned:
+                    self._notify()
+                return None
+
+            conn.execute(
+                "UPDATE jobs SET status = 'running', stage = 'started', attempts = attempts + 1, updated_at = ? "
+                "WHERE id = ?",
+                (now, row['id'])
+            )
+            conn.execute('COMMIT')
+            return row['id'], json.loads(row['payload'])
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            logger.error(f"Error claiming job: {str(e)}")
+            return None
+        finally:
+            conn.close()
+
+    def _work(self):
+        while True:
+            self._maybe_cleanup()
+            job = self._claim()
+            if job is None:
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+                continue
+
+            job_id, payload = job
+            self._notify()
+
+            def progress(stage, detail=None, job_id=job_id):
+                self._update(job_id, stage=stage, detail=json.dumps(detail) if detail is not None else None)
+
+            try:
+                result = self.handler_func(job_id, payload, progress)
+                # The payload (often a whole image) is not needed once the job is done
+                self._update(job_id, status='done', stage='done', result=json.dumps(result), payload='{}')
+            except Exception as e:
+                logger.error(f"Job {job_id} failed: {str(e)}")
+                self._update(job_id, status='failed', stage='failed', error=str(e), payload='{}')
+
+    def _maybe_cleanup(self):
+        """Run cleanup once per cleanup_interval, from whichever worker gets there first"""
+        with self.cleanup_lock:
+            if time.time() - self.last_cleanup < self.cleanup_interval:
+                return
+            self.last_cleanup = time.time()
+        try:
+            deleted = self.cleanup(self.retention_seconds)
+            if deleted:
+                logger.info(f"Deleted {deleted} finished job(s)")
+        except sqlite3.Error as e:
+            logger.error(f"Error cleaning up jobs: {str(e)}")
+
+    def cleanup(self, max_age_seconds=86400):
+        """Delete finished jobs older than max_age_seconds; returns how many were deleted"""
+        cutoff = time.time() - max_age_seconds
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,)
+            ).rowcount
@@ -0,0 +1,185 @@
+import time
+import random
+import threading
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying: Ollama returns 503 while a model is loading
+TRANSIENT_STATUS = {429, 500, 502, 503, 504}
+
+class LLMUnavailableError(Exception):
+    """Raised when the model server can't be reached or the circuit is open"""
+
+class CircuitBreaker:
+    """Fails fast after repeated model server failures.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    are rejected without touching the network. Once reset_timeout seconds
+    have passed a single trial call is let through (half open); its outcome
+    closes the circuit again or reopens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.time() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        """Return True if a call may go through"""
+        with self.lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def release_trial(self):
+        """End a half-open trial that neither succeeded nor failed, e.g. because of a bug"""
+        with self.lock:
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"Model server failed {self.failures} times, opening circuit")
+                self.opened_at = time.time()
+
+class LLMClient:
+    """Shared HTTP client for the Ollama API.
+
+    Uses one pooled keep-alive session with connect and read timeouts, so a
+    hung model server can't hold a worker forever. Connection errors,
+    timeouts and transient status codes are retried with jittered
+    exponential backoff, and a circuit breaker rejects calls immediately
+    while the server is down.
+    """
+
+    def __init__(self, base_url, connect_timeout=3.05, read_timeout=120, max_retries=3,
+                 backoff=0.5, pool_size=10, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def generate(self, payload, stream=True):
+        """POST to /api/generate and return the response.
+
+        With stream=True the caller reads (and closes) the NDJSON stream; the
+        read timeout then applies between chunks rather than to the whole
+        generation.
+        """
+        return self.request('POST', '/api/generate', json=payload, stream=stream)
+
+    def tags(self):
+        """Return the installed models"""
+        response = self.request('GET', '/api/tags')
+        return response.json().get('models', [])
+
+    def request(self, method, path, **kwargs):
+        """Send a request with timeouts, retries and the circuit breaker"""
+        if not self.breaker.allow():
+            raise LLMUnavailableError("Model server is unavailable, analysis is temporarily degraded")
+
+        try:
+            return self._send(method, path, **kwargs)
+        finally:
+            # Whatever escaped, a half-open trial must not stay claimed forever
+            self.breaker.release_trial()
+
+    def _send(self, method, path, **kwargs):
+        url = self.base_url + path
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+                if response.status_code in TRANSIENT_STATUS:
+                    response.close()
+                    raise requests.exceptions.HTTPError(
+                        f"Ollama API error: {response.status_code}", response=response
+                    )
+                response.raise_for_status()
+                self.breaker.record_success()
+                return response
+
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.HTTPError) as e:
+                status = e.response.status_code if e.response is not None else None
+                transient = status is None or status in TRANSIENT_STATUS
+                if not transient:
+                    # The server answered; a bad request is not an outage
+                    self.breaker.record_success()
+                    raise
+
+                attempt += 1
+                if attempt > self.max_retries:
+                    self.breaker.record_failure()
+                    logger.error(f"Model server request failed after {attempt} attempts: {str(e)}")
+                    raise LLMUnavailableError(f"Model server request failed: {str(e)}") from e
+
+                delay = random.uniform(0, self.backoff * (2 ** (attempt - 1)))
+                logger.warning(f"Model server request failed ({str(e)}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    def status(self):
+        """Health of the model server connection as seen by this process"""
+        state = self.breaker.state
+        return {
+            'status': 'ok' if state == 'closed' else 'degraded',
+            'circuit': state,
+            'consecutive_failures': self.breaker.failures,
+        }
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_llm_client():
+    """Return the process wide LLM client, creating it on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient(
+                Config.OLLAMA_URL,
+                connect_timeout=Config.LLM_CONNECT_TIMEOUT,
+                read_timeout=Config.LLM_READ_TIMEOUT,
+                max_retries=Config.MAX_RETRIES,
+                backoff=Config.LLM_RETRY_BACKOFF,
+                pool_size=Config.LLM_POOL_SIZE,
+                breaker=CircuitBreaker(Config.LLM_BREAKER_THRESHOLD, Config.LLM_BREAKER_RESET)
+            )
+        return _client
@@ -0,0 +1,159 @@
+import json
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ["Natural", "Additives", "Preservatives", "Artificial Colors", "Highly Processed"]
+
+SCORE = {"type": "integer", "minimum": 1, "maximum": 5}
+
+# Per-ingredient labels returned by the model for IngredientService; also sent
+# to Ollama as the `format` so generation is constrained to this shape.
+# Percentages, summaries and health scores are computed locally (see scoring).
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "ingredients": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "category": {"type": "string", "enum": CATEGORIES},
+                },
+                "required": ["name", "category"],
+            },
+        },
+    },
+    "required": ["ingredients"],
+}
+
+# Labels with per-ingredient scores, for IngredientAnalyzer
+DETAILED_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "ingredients": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "category": {"type": "string", "enum": CATEGORIES},
+                    "processing_score": SCORE,
+                    "health_impact_score": SCORE,
+                    "nutrient_density_score": SCORE,
+                },
+                "required": ["name", "category", "processing_score", "health_impact_score", "nutrient_density_score"],
+            },
+        },
+    },
+    "required": ["ingredients"],
+}
+
+def batch_schema(count, item_schema=ANALYSIS_SCHEMA):
+    """Schema for a batch response keyed "p1" .. "p<count>" """
+    keys = [f"p{i}" for i in range(1, count + 1)]
+    return {
+        "type": "object",
+        "properties": {key: item_schema for key in keys},
+        "required": keys,
+    }
+
+TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "number": (int, float),
+    "integer": int,
+    "boolean": bool,
+}
+
+def validate(value, schema, path='$'):
+    """Check a value against the subset of JSON schema used above.
+
+    Supports type, properties, required, items, enum, minimum and maximum.
+    Returns a list of error messages, empty when the value is valid.
+    """
+    expected = schema.get("type")
+    if expected:
+        # bool is an int in Python but never a number in JSON
+        if isinstance(value, bool) and expected != "boolean":
+            return [f"{path}: expected {expected}, got boolean"]
+        if not isinstance(value, TYPES[expected]):
+            return [f"{path}: expected {expected}, got {type(value).__name__}"]
+
+    errors = []
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: {value!r} is not one of {schema['enum']}")
+    if "minimum" in schema and value < schema["minimum"]:
+        errors.append(f"{path}: {value} is below {schema['minimum']}")
+    if "maximum" in schema and value > schema["maximum"]:
+        errors.append(f"{path}: {value} is above {schema['maximum']}")
+
+    if isinstance(value, dict):
+        for name in schema.get("required", []):
+            if name not in value:
+                errors.append(f"{path}: missing required field '{name}'")
+        for name, subschema in schema.get("properties", {}).items():
+            if name in value:
+                errors.extend(validate(value[name], subschema, f"{path}.{name}"))
+
+    if isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            errors.extend(validate(item, schema["items"], f"{path}[{i}]"))
+
+    return errors
+
+class AnalysisParseError(ValueError):
+    """The model response was not valid JSON or did not match the schema"""
+
+class ResponseParser:
+    """Strict parser for schema-constrained model responses.
+
+    Responses generated with Ollama's `format` are plain JSON, so parsing is a
+    single json.loads plus a schema check; there is no cleanup of fences,
+    comments or trailing commas. Successes and failures are counted so the
+    parse failure rate can be monitored.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.parsed = 0
+        self.failed = 0
+
+    def parse(self, text, schema):
+        """Return the parsed value or raise AnalysisParseError"""
+        try:
+            value = json.loads(text)
+        except (TypeError, json.JSONDecodeError) as e:
+            self._record(False)
+            raise AnalysisParseError(f"Invalid JSON: {str(e)}")
+
+        errors = validate(value, schema)
+        if errors:
+            self._record(False)
+            raise AnalysisParseError(f"Response does not match the schema: {'; '.join(errors[:5])}")
+
+        self._record(True)
+        return value
+
+    def _record(self, success):
+        with self.lock:
+            if success:
+                self.parsed += 1
+            else:
+                self.failed += 1
+                logger.warning(f"Model response failed to parse ({self.failed} of {self.parsed + self.failed})")
+
+    def stats(self):
+        with self.lock:
+            total = self.parsed + self.failed
+            return {
+                'parsed': self.parsed,
+                'failed': self.failed,
+                'failure_rate': round(self.failed / total, 4) if total else 0.0,
+            }
+
+# Shared by both analyzers so the failure rate covers every model call
+response_parser = ResponseParser()
@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from contextlib import closing
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class OCRCache:
+    """Content-addressed cache of OCR results keyed by the hash of the image bytes.
+
+    Entries hold the extracted text, the winning config and its confidence.
+    There are two tiers: an in-process LRU and an optional SQLite file shared by
+    every worker on the machine. The disk tier is evicted oldest-access first
+    once it grows past max_bytes. Every key includes the pipeline version, so
+    changing the preprocessing invalidates old entries. Triggers keep the
+    tier's total size in a one-row table, so writes don't have to sum it.
+    """
+
+    def __init__(self, version, memory_size=256, disk_path=None, max_bytes=50 * 1024 * 1024):
+        self.version = str(version)
+        self.memory_size = memory_size
+        self.disk_path = disk_path
+        self.max_bytes = max_bytes
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if self.disk_path:
+            self._init_disk()
+
+    @staticmethod
+    def hash_image(image_data):
+        """SHA-256 of the decoded image bytes"""
+        return hashlib.sha256(image_data).hexdigest()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.disk_path, timeout=10, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _init_disk(self):
+        directory = os.path.dirname(self.disk_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with closing(self._connect()) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ocr_results (
+                    image_hash TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (image_hash, version)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ocr_results_accessed ON ocr_results (accessed_at)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ocr_results_size (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    total INTEGER NOT NULL
+                )
+            """)
+            conn.execute(
+                "INSERT OR IGNORE INTO ocr_results_size (id, total) "
+                "SELECT 0, COALESCE(SUM(size), 0) FROM ocr_results"
+            )
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS ocr_results_size_insert AFTER INSERT ON ocr_results
+                BEGIN UPDATE ocr_results_size SET total = total + NEW.size WHERE id = 0; END
+            """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS ocr_results_size_update AFTER UPDATE OF size ON ocr_results
+                BEGIN UPDATE ocr_results_size SET total = total + NEW.size - OLD.size WHERE id = 0; END
+            """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS ocr_results_size_delete AFTER DELETE ON ocr_results
+                BEGIN UPDATE ocr_results_size SET total = total - OLD.size WHERE id = 0; END
+            """)
+            # Drop entries produced by an older preprocessing pipeline
+            conn.execute("DELETE FROM ocr_results WHERE version != ?", (self.version,))
+
+    def get(self, image_hash):
+        """Return the cached result for an image hash, or None"""
+        with self.lock:
+            result = self.memory.get(image_hash)
+            if result is not None:
+                self.memory.move_to_end(image_hash)
+                self.hits += 1
+                return dict(result)
+
+        result = self._disk_get(image_hash) if self.disk_path else None
+
+        with self.lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._memory_put(image_hash, result)
+        return dict(result)
+
+    def put(self, image_hash, result):
+        """Store an OCR result ({'text', 'config', 'confidence', 'phash'}) for an image hash"""
+        result = {
+            'text': result['text'],
+            'config': result.get('config'),
+            'confidence': result.get('confidence', 0),
+            'phash': result.get('phash'),
+        }
+
+        with self.lock:
+            self._memory_put(image_hash, result)
+
+        if self.disk_path:
+            self._disk_put(image_hash, result)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'version': self.version,
+                'memory_entries': len(self.memory),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def _memory_put(self, image_hash, result):
+        self.memory[image_hash] = result
+        self.memory.move_to_end(image_hash)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def _disk_get(self, image_hash):
+        try:
+            with closing(self._connect()) as conn:
+                row = conn.execute(
+                    "SELECT result FROM ocr_results WHERE image_hash = ? AND version = ?",
+                    (image_hash, self.version)
+                ).fetchone()
+                if row is None:
+                    return None
+                conn.execute(
+                    "UPDATE ocr_results SET accessed_at = ? WHERE image_hash = ? AND version = ?",
+                    (time.time(), image_hash, self.version)
+                )
+                return json.loads(row[0])
+        except sqlite3.Error as e:
+            logger.error(f"OCR cache read failed: {str(e)}")
+            return None
+
+    def _disk_put(self, image_hash, result):
+        payload = json.dumps(result)
+        try:
+            with closing(self._connect()) as conn:
+                # An upsert rather than INSERT OR REPLACE: REPLACE deletes
+                # without firing the delete trigger
+                conn.execute(
+                    "INSERT INTO ocr_results (image_hash, version, result, size, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (image_hash, version) DO UPDATE SET "
+                    "result = excluded.result, size = excluded.size, accessed_at = excluded.accessed_at",
+                    (image_hash, self.version, payload, len(payload), time.time())
+                )
+                self._evict(conn)
+        except sqlite3.Error as e:
+            logger.error(f"OCR cache write failed: {str(e)}")
+
+    def _evict(self, conn):
+        """Remove least recently used rows until the tier fits in max_bytes"""
+        row = conn.execute("SELECT total FROM ocr_results_size WHERE id = 0").fetchone()
+        total = row[0] if row else 0
+        if total <= self.max_bytes:
+            return
+
+        excess = total - self.max_bytes
+        rows = conn.execute(
+            "SELECT image_hash, version, size FROM ocr_results ORDER BY accessed_at ASC"
+        )
+        stale = []
+        for image_hash, version, size in rows:
+            if excess <= 0:
+                break
+            stale.append((image_hash, version))
+            excess -= size
+
+        conn.executemany("DELETE FROM ocr_results WHERE image_hash = ? AND version = ?", stale)
@@ -0,0 +1,77 @@
+import threading
+from collections import Counter, deque
+import logging
+
+logger = logging.getLogger(__name__)
+
+class PassScheduler:
+    """Decides which OCR configurations to run for an image and in what order.
+
+    The highest ranked configuration runs first on its own. If its average
+    confidence meets the cutoff we stop there, otherwise the remaining
+    configurations run together and the most confident pass wins. The winning
+    configuration of every image is recorded and the order is re-ranked from
+    that history, so the config that usually wins is the one tried first.
+    """
+
+    def __init__(self, configs, confidence_cutoff=85, history_size=500):
+        self.configs = list(configs)
+        self.confidence_cutoff = confidence_cutoff
+        self.history = deque(maxlen=history_size)
+        self.win_counts = Counter()
+        self.lock = threading.Lock()
+
+    def ordered_configs(self):
+        """Configs sorted by how often they won, ties keep the configured order"""
+        with self.lock:
+            counts = dict(self.win_counts)
+        return sorted(self.configs, key=lambda config: -counts.get(config, 0))
+
+    def record(self, image_key, result):
+        """Remember which config won for an image"""
+        with self.lock:
+            if len(self.history) == self.history.maxlen:
+                _, oldest = self.history[0]
+                self.win_counts[oldest] -= 1
+            self.history.append((image_key, result['config']))
+            self.win_counts[result['config']] += 1
+
+    def stats(self):
+        """Win counts per config over the recorded history"""
+        with self.lock:
+            return {
+                'cutoff': self.confidence_cutoff,
+                'images': len(self.history),
+                'wins': {config: self.win_counts.get(config, 0) for config in self.configs},
+            }
+
+    def run(self, processed_image, run_pass, run_passes, image_key=None):
+        """Run OCR passes until one is good enough and return the best result
+
+        Parameters:
+        - processed_image: Image handed to every pass
+        - run_pass: Callable(image, config) returning a single pass result
+        - run_passes: Callable(image, configs) running several passes concurrently
+        - image_key: Identifier of the image used for the win history
+        """
+        configs = self.ordered_configs()
+
+        first = run_pass(processed_image, configs[0])
+        results = [first]
+
+        if first['confidence'] >= self.confidence_cutoff and first['text'].strip():
+            logger.debug(f"Early exit on {first['config']} with confidence {first['confidence']:.1f}")
+        elif len(configs) > 1:
+            results.extend(run_passes(processed_image, configs[1:]))
+
+        best = None
+        for result in results:
+            if not result['text'].strip():
+                continue
+            if best is None or result['confidence'] > best['confidence']:
+                best = result
+
+        if best is not None:
+            self.record(image_key, best)
+
+        return best
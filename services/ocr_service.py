@@ -1,43 +1,239 @@
 import os
-import sys
 import pytesseract
-from PIL import Image, ImageEnhance, ImageFilter
-import numpy as np
+from PIL import Image
 import cv2
 import logging
 import base64
-from io import BytesIO
+import re
+import queue
+import threading
 import traceback
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from .config import Config
+from .ocr_scheduler import PassScheduler
+from .ocr_cache import OCRCache
+from .single_flight import SingleFlight
+from .image_index import ImageIndex, dhash
+from .debug_artifacts import DebugArtifactWriter
+from .preprocessing import open_image, to_gray, normalize_resolution
+from .text_regions import find_text_regions, crop_regions, find_ingredients_block, merge_region_results
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
 
 logger = logging.getLogger(__name__)
 
+def parse_tesseract_config(config):
+    """Split a tesseract command line config into psm, oem and -c variables"""
+    psm = re.search(r'--psm\s+(\d+)', config)
+    oem = re.search(r'--oem\s+(\d+)', config)
+    variables = dict(re.findall(r'-c\s+(\w+)=("[^"]*"|\S+)', config))
+    return {
+        'psm': int(psm.group(1)) if psm else 3,
+        'oem': int(oem.group(1)) if oem else 3,
+        'variables': {k: v.strip('"') for k, v in variables.items()}
+    }
+
+class PytesseractBackend:
+    """Runs the tesseract binary through pytesseract, one process per call"""
+    
+    name = 'pytesseract'
+    
+    def image_to_data(self, image, config):
+        return pytesseract.image_to_data(image, config=config, output_type=pytesseract.Output.DICT)
+
+class TesserocrBackend:
+    """Keeps a pool of warm tesseract API handles and passes images in memory.
+    
+    Each handle loads the traineddata once when the pool is created. A call
+    borrows a handle, so at most `size` recognitions run at the same time.
+    The engine mode (--oem) is fixed when a handle is initialised, so there
+    is one pool per mode: the default mode's pool is created up front and
+    any other mode a config asks for gets its own pool on first use.
+    The result has the same shape as pytesseract's image_to_data dict so the
+    rest of the pipeline does not care which backend produced it.
+    """
+    
+    name = 'tesserocr'
+    
+    def __init__(self, size, lang='eng', path=None, oem=3):
+        self.size = size
+        self.lang = lang
+        self.path = path
+        self.pools = {}
+        self.pools_lock = threading.Lock()
+        self.pool(oem)
+    
+    def pool(self, oem):
+        """The queue of handles initialised with one engine mode"""
+        with self.pools_lock:
+            if oem not in self.pools:
+                handles = queue.Queue()
+                for _ in range(self.size):
+                    kwargs = {'lang': self.lang, 'oem': oem}
+                    if self.path:
+                        kwargs['path'] = self.path
+                    handles.put(tesserocr.PyTessBaseAPI(**kwargs))
+                self.pools[oem] = handles
+            return self.pools[oem]
+    
+    @contextmanager
+    def handle(self, oem=3):
+        handles = self.pool(oem)
+        api = handles.get()
+        try:
+            yield api
+        finally:
+            handles.put(api)
+    
+    def image_to_data(self, image, config):
+        options = parse_tesseract_config(config)
+        if not isinstance(image, Image.Image):
+            image = Image.fromarray(image)
+        
+        data = {'text': [], 'conf': [], 'block_num': [], 'par_num': [], 'line_num': []}
+        
+        with self.handle(options['oem']) as api:
+            # -c variables only apply to this call
+            previous = {name: api.GetVariableAsString(name) for name in options['variables']}
+            try:
+                for name, value in options['variables'].items():
+                    api.SetVariable(name, value)
+                api.SetPageSegMode(options['psm'])
+                api.SetImage(image)
+                api.Recognize()
+                
+                block = par = line = 0
+                iterator = api.GetIterator()
+                level = tesserocr.RIL.WORD
+                for word in tesserocr.iterate_level(iterator, level):
+                    if word.IsAtBeginningOf(tesserocr.RIL.BLOCK):
+                        block, par, line = block + 1, 0, 0
+                    if word.IsAtBeginningOf(tesserocr.RIL.PARA):
+                        par, line = par + 1, 0
+                    if word.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+                        line += 1
+                    
+                    data['text'].append(word.GetUTF8Text(level) or '')
+                    data['conf'].append(word.Confidence(level))
+                    data['block_num'].append(block)
+                    data['par_num'].append(par)
+                    data['line_num'].append(line)
+            finally:
+                for name, value in previous.items():
+                    if value is not None:
+                        api.SetVariable(name, value)
+                api.Clear()
+        
+        return data
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_ocr_backend():
+    """Return the process wide OCR backend, creating it on first use.
+    
+    Config.OCR_BACKEND selects 'tesserocr', 'pytesseract' or 'auto', which
+    uses the pooled tesserocr engine when it is installed and falls back to
+    pytesseract otherwise.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            return _backend
+        
+        choice = Config.OCR_BACKEND
+        if choice in ('auto', 'tesserocr') and tesserocr is not None:
+            try:
+                _backend = TesserocrBackend(Config.OCR_MAX_WORKERS, path=Config.TESSDATA_PATH)
+                print(f"Using tesserocr OCR backend with {Config.OCR_MAX_WORKERS} engines")
+                return _backend
+            except Exception as e:
+                logger.error(f"Could not start tesserocr engines: {str(e)}")
+        elif choice == 'tesserocr':
+            logger.warning("tesserocr is not installed, falling back to pytesseract")
+        
+        _backend = PytesseractBackend()
+        return _backend
+
 class OCRService:
     def __init__(self):
-        # Set Tesseract path directly
-        self.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+        # Tesseract binary used by the pytesseract backend
+        self.tesseract_cmd = Config.TESSERACT_PATH
         pytesseract.pytesseract.tesseract_cmd = self.tesseract_cmd
         
-        if not os.path.exists(self.tesseract_cmd):
-            raise EnvironmentError(f"Tesseract not found at {self.tesseract_cmd}")
+        self.backend = get_ocr_backend()
         
-        # Test Tesseract
-        try:
-            version = pytesseract.get_tesseract_version()
-            print(f"Tesseract version: {version}")
-        except Exception as e:
-            raise EnvironmentError(f"Error testing Tesseract: {str(e)}")
+        # The binary is only needed when falling back to pytesseract
+        if self.backend.name == 'pytesseract':
+            if not os.path.exists(self.tesseract_cmd):
+                raise EnvironmentError(f"Tesseract not found at {self.tesseract_cmd}")
+            
+            # Test Tesseract
+            try:
+                version = pytesseract.get_tesseract_version()
+                print(f"Tesseract version: {version}")
+            except Exception as e:
+                raise EnvironmentError(f"Error testing Tesseract: {str(e)}")
+        
+        # Bounded pool for running OCR passes concurrently. Both backends release
+        # the GIL while recognizing, so threads are enough to use every core.
+        self.pass_executor = ThreadPoolExecutor(
+            max_workers=Config.OCR_MAX_WORKERS,
+            thread_name_prefix='ocr-pass'
+        )
+        
+        # Decides which passes to run and stops early on a confident result
+        self.pass_scheduler = PassScheduler(
+            Config.OCR_CONFIGS,
+            confidence_cutoff=Config.OCR_CONFIDENCE_CUTOFF,
+            history_size=Config.OCR_RANKING_HISTORY
+        )
+        
+        # Results of previously seen images, keyed by image hash
+        self.cache = OCRCache(
+            Config.OCR_PIPELINE_VERSION,
+            memory_size=Config.OCR_CACHE_SIZE,
+            disk_path=Config.OCR_CACHE_PATH,
+            max_bytes=Config.OCR_CACHE_MAX_BYTES
+        )
+        
+        # Identical images in flight at once are read once. Other workers only see
+        # the result through the shared cache tier, so lock across processes only with one
+        self.flight = SingleFlight(
+            'ocr',
+            lock_dir=Config.SINGLE_FLIGHT_LOCK_DIR if Config.OCR_CACHE_PATH else None,
+            lock_timeout=Config.SINGLE_FLIGHT_TIMEOUT
+        )
+        
+        # Perceptual hashes of earlier uploads for near-duplicate reuse
+        self.image_index = ImageIndex(
+            max_distance=Config.IMAGE_INDEX_MAX_DISTANCE,
+            disk_path=Config.IMAGE_INDEX_PATH
+        ) if Config.IMAGE_INDEX_ENABLED else None
+        
+        # Sampled debug images, written in the background; off by default
+        self.debug_writer = DebugArtifactWriter(
+            Config.DEBUG_ARTIFACTS_DIR,
+            sample_rate=Config.DEBUG_ARTIFACTS_SAMPLE_RATE,
+            max_files=Config.DEBUG_ARTIFACTS_MAX_FILES
+        ) if Config.DEBUG_ARTIFACTS else None
+
+    def engine_available(self):
+        """Whether the OCR engine in use can run: the pooled tesserocr engines or the tesseract binary"""
+        return self.backend.name == 'tesserocr' or os.path.exists(self.tesseract_cmd)
 
     def preprocess_image(self, image):
         """Preprocess image for better OCR results"""
-        # Convert to RGB if needed
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Convert to numpy array
-        img_array = np.array(image)
-        
         # Convert to grayscale
-        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+        gray = to_gray(image)
+        
+        # Bring the text to the size Tesseract reads best before the
+        # morphology steps, instead of running them at full photo resolution
+        gray = normalize_resolution(gray)
         
         # Apply thresholding to preprocess the image
         gray = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
@@ -51,8 +247,116 @@ class OCRService:
         
         return gray
 
+    @staticmethod
+    def text_from_data(data):
+        """Rebuild page text from an image_to_data result.
+        
+        Words are joined by spaces, lines by newlines and blocks/paragraphs by a
+        blank line, which matches the layout image_to_string produces.
+        """
+        lines = []
+        current_key = None
+        current_para = None
+        
+        for i, word in enumerate(data['text']):
+            if not word or not word.strip():
+                continue
+            
+            para = (data['block_num'][i], data['par_num'][i])
+            key = para + (data['line_num'][i],)
+            
+            if key != current_key:
+                if current_para is not None and para != current_para:
+                    lines.append('')
+                lines.append(word)
+                current_key = key
+                current_para = para
+            else:
+                lines[-1] += ' ' + word
+        
+        return '\n'.join(lines)
+
+    def run_ocr_pass(self, processed_image, config):
+        """Run a single OCR pass and return its text and average confidence.
+        
+        A pass that fails is reported with empty text instead of failing the
+        whole extraction.
+        """
+        try:
+            print(f"Trying OCR with config: {config}")
+            
+            # One tesseract call per pass: the text is rebuilt from the word data
+            data = self.backend.image_to_data(processed_image, config)
+            
+            # Calculate average confidence
+            confidences = [float(conf) for conf in data['conf'] if float(conf) >= 0]
+            if not confidences:
+                return {'config': config, 'text': '', 'confidence': 0}
+            
+            avg_confidence = sum(confidences) / len(confidences)
+            text = self.text_from_data(data)
+            
+            print(f"Confidence: {avg_confidence}")
+            print(f"Extracted text: {text[:100]}...")
+            
+            return {'config': config, 'text': text, 'confidence': avg_confidence}
+        
+        except Exception as e:
+            print(f"Error with config {config}: {str(e)}")
+            return {'config': config, 'text': '', 'confidence': 0}
+
+    def run_ocr_passes(self, processed_image, configs):
+        """Run several OCR passes concurrently on the pass executor.
+        
+        Results come back in the same order as configs.
+        """
+        futures = [
+            self.pass_executor.submit(self.run_ocr_pass, processed_image, config)
+            for config in configs
+        ]
+        return [future.result() for future in futures]
+
+    def run_region_ocr(self, processed_image, image_key=None):
+        """OCR only the text blocks of a label photo.
+        
+        The crops run concurrently with the top ranked config. The block that
+        holds the ingredient list wins outright; otherwise the blocks are joined
+        in reading order. Returns None when the image has no usable blocks or
+        the result is not confident enough, so the caller can OCR the whole image.
+        """
+        regions = find_text_regions(processed_image)
+        if not regions:
+            return None
+        
+        print(f"Running OCR on {len(regions)} text regions")
+        config = self.pass_scheduler.ordered_configs()[0]
+        crops = crop_regions(processed_image, regions)
+        futures = [self.pass_executor.submit(self.run_ocr_pass, crop, config) for crop in crops]
+        results = [future.result() for future in futures]
+        
+        best = find_ingredients_block(results)
+        if best is None:
+            best = merge_region_results(results)
+            if best is None or best['confidence'] < self.pass_scheduler.confidence_cutoff:
+                return None
+        
+        self.pass_scheduler.record(image_key, best)
+        return best
+
     def extract_text_from_base64(self, base64_data):
         """Extract text from base64 encoded image data"""
+        return self.extract_result_from_base64(base64_data)['text']
+
+    def extract_result_from_base64(self, base64_data):
+        """Extract text from base64 encoded image data.
+        
+        Returns a dict with the extracted text, the winning config, its
+        confidence, the image hash and whether the result came from the cache.
+        When the image index is enabled it also carries the perceptual hash
+        ('phash') and, for a near-duplicate of an analysed upload, the id of
+        that analysis ('analysis_id'). Concurrent calls for the same image,
+        in this or another worker, share a single OCR run.
+        """
         try:
             # Remove header if present
             if 'base64,' in base64_data:
@@ -60,66 +364,99 @@ class OCRService:
             
             # Decode base64 data
             image_data = base64.b64decode(base64_data)
-            image = Image.open(BytesIO(image_data))
-            
-            # Save original image for debugging
-            debug_original = 'debug_original.png'
-            image.save(debug_original)
-            print(f"Saved original image: {debug_original}")
-            
-            # Preprocess image
-            processed_image = self.preprocess_image(image)
             
-            # Save processed image for debugging
-            debug_processed = 'debug_processed.png'
-            cv2.imwrite(debug_processed, processed_image)
-            print(f"Saved processed image: {debug_processed}")
+            # Repeat uploads of the same image skip the whole pipeline
+            image_hash = OCRCache.hash_image(image_data)
+            cached = self.cached_result(image_hash)
+            if cached is not None:
+                return cached
             
-            # Extract text using different OCR configurations
-            configs = [
-                '--oem 3 --psm 6',  # Assume uniform block of text
-                '--oem 3 --psm 4',  # Assume single column of text
-                '--oem 3 --psm 3',  # Fully automatic page segmentation
-            ]
-            
-            best_text = ""
-            max_confidence = 0
-            
-            for config in configs:
-                try:
-                    print(f"Trying OCR with config: {config}")
-                    
-                    # Get text and confidence
-                    data = pytesseract.image_to_data(processed_image, config=config, output_type=pytesseract.Output.DICT)
-                    
-                    # Calculate average confidence
-                    confidences = [int(conf) for conf in data['conf'] if conf != '-1']
-                    if confidences:
-                        avg_confidence = sum(confidences) / len(confidences)
-                        text = pytesseract.image_to_string(processed_image, config=config)
-                        
-                        print(f"Confidence: {avg_confidence}")
-                        print(f"Extracted text: {text[:100]}...")
-                        
-                        if avg_confidence > max_confidence and text.strip():
-                            max_confidence = avg_confidence
-                            best_text = text
-                
-                except Exception as e:
-                    print(f"Error with config {config}: {str(e)}")
-                    continue
-            
-            if not best_text.strip():
-                raise ValueError("No text could be extracted from the image")
-            
-            print(f"Final extracted text: {best_text[:100]}...")
-            return best_text.strip()
+            # Concurrent uploads of the same image share one OCR run
+            return self.flight.do(
+                image_hash,
+                lambda: self.run_pipeline(image_data, image_hash),
+                lookup=lambda: self.cached_result(image_hash)
+            )
             
         except Exception as e:
             print(f"Error in extract_text_from_base64: {str(e)}")
             traceback.print_exc()
             raise
 
+    def cached_result(self, image_hash):
+        """Result for a previously read image, or None"""
+        cached = self.cache.get(image_hash)
+        if cached is None:
+            return None
+        print(f"OCR cache hit for image {image_hash[:12]}")
+        if self.image_index is not None and cached.get('phash') is not None:
+            match = self.image_index.lookup(cached['phash'])
+            if match is not None:
+                cached['analysis_id'] = match.get('analysis_id')
+        cached.update({'image_hash': image_hash, 'cached': True})
+        return cached
+
+    def run_pipeline(self, image_data, image_hash):
+        """Decode, preprocess and OCR an image that is not in the cache"""
+        # Large JPEGs are decoded at reduced size
+        image = open_image(image_data)
+        
+        # Re-shoots of an earlier label reuse its text (and analysis)
+        phash = None
+        if self.image_index is not None:
+            phash = dhash(image)
+            match = self.image_index.lookup(phash)
+            if match is not None:
+                print(f"Near-duplicate image found (distance {match['distance']})")
+                # Exact repeats of this upload then hit the cache directly; the
+                # stored phash is the matched one, so its analysis is still found
+                self.cache.put(image_hash, match)
+                match.update({'image_hash': image_hash, 'cached': True})
+                return match
+        
+        # Preprocess image
+        processed_image = self.preprocess_image(image)
+        
+        # Keep the original and processed images of sampled requests for debugging
+        if self.debug_writer is not None and self.debug_writer.should_capture():
+            self.debug_writer.submit(image_hash[:12], {
+                'original': image,
+                'processed': processed_image
+            })
+        
+        # Full-package photos: read just the text blocks, ingredients first
+        best = None
+        if Config.OCR_REGIONS_ENABLED:
+            best = self.run_region_ocr(processed_image, image_key=image_hash)
+        
+        # Run the OCR passes, stopping early once one is confident enough
+        if best is None:
+            best = self.pass_scheduler.run(
+                processed_image,
+                self.run_ocr_pass,
+                self.run_ocr_passes,
+                image_key=image_hash
+            )
+        
+        if best is None:
+            raise ValueError("No text could be extracted from the image")
+        
+        result = {
+            'text': best['text'].strip(),
+            'config': best['config'],
+            'confidence': best['confidence'],
+            'phash': phash
+        }
+        self.cache.put(image_hash, result)
+        if phash is not None:
+            self.image_index.add(phash, result)
+        
+        print(f"Winning config: {best['config']} (confidence {best['confidence']:.1f})")
+        print(f"Final extracted text: {result['text'][:100]}...")
+        
+        result.update({'image_hash': image_hash, 'cached': False})
+        return result
+
     def extract_text(self, image_path):
         """Extract text from an image file"""
         try:
@@ -0,0 +1,97 @@
+import numpy as np
+import cv2
+from PIL import Image
+from io import BytesIO
+from .config import Config
+
+def open_image(source, max_width=None):
+    """Open an image, decoding JPEGs at a reduced size when possible.
+
+    PIL's draft mode lets the JPEG decoder skip whole DCT scales, so a 12MP
+    phone photo is never materialized at full size when we are going to
+    shrink it anyway. Draft only scales by 1/2, 1/4 or 1/8 and never below
+    the requested size, so the decoded image is at least max_width wide; the
+    default matches the narrowest width normalize_resolution shrinks to.
+
+    Parameters:
+    - source: Raw image bytes, a path or a file object
+    - max_width: Narrowest image the pipeline will work on (defaults to Config.OCR_MAX_DECODE_WIDTH)
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = BytesIO(source)
+
+    image = Image.open(source)
+    max_width = max_width or Config.OCR_MAX_DECODE_WIDTH
+
+    if image.format == 'JPEG' and image.width > max_width:
+        scale = max_width / image.width
+        image.draft('RGB', (max_width, int(image.height * scale)))
+
+    return image
+
+def to_gray(image):
+    """Convert a PIL image or numpy array to a single channel array"""
+    if isinstance(image, Image.Image):
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image = np.array(image)
+
+    if len(image.shape) == 3:
+        return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    return image
+
+def estimate_text_height(gray, sample_width=1000):
+    """Estimate the height of the small body text in pixels, or None.
+
+    Works on a thumbnail: dark connected components with letter-like
+    proportions are collected and their lower quartile height is scaled back
+    to the input size. Ingredient lists are usually the smallest print on a
+    pack, so the quartile follows them rather than the branding.
+    """
+    scale = 1.0
+    if gray.shape[1] > sample_width:
+        scale = sample_width / gray.shape[1]
+        gray = cv2.resize(gray, (sample_width, int(gray.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+
+    binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+    count, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+
+    heights = stats[1:count, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:count, cv2.CC_STAT_WIDTH]
+    max_height = gray.shape[0] / 5
+    letters = heights[(heights >= 4) & (heights <= max_height) & (widths <= heights * 2)]
+
+    # Too few candidates to say anything about the text size
+    if len(letters) < 20:
+        return None
+
+    return float(np.percentile(letters, 25)) / scale
+
+def normalize_resolution(gray, target_text_height=None, target_width=None):
+    """Rescale a grayscale image so text lands at the size Tesseract reads best.
+
+    The image is scaled so the estimated character height matches
+    target_text_height. When no text size can be estimated it falls back to
+    scaling the width to target_width. Downscaling stops at
+    Config.OCR_MIN_WIDTH, since the estimate can follow larger text than the
+    ingredient list, and upscaling is limited to Config.OCR_MAX_UPSCALE.
+    """
+    target_text_height = target_text_height or Config.OCR_TARGET_TEXT_HEIGHT
+    target_width = target_width or Config.OCR_TARGET_WIDTH
+
+    text_height = estimate_text_height(gray)
+    if text_height:
+        scale = target_text_height / text_height
+    else:
+        scale = target_width / gray.shape[1]
+
+    # Never shrink below the minimum width, never blow up small photos too far
+    scale = max(scale, min(1.0, Config.OCR_MIN_WIDTH / gray.shape[1]))
+    scale = min(scale, Config.OCR_MAX_UPSCALE)
+    if abs(scale - 1.0) < 0.05:
+        return gray
+
+    width = max(1, int(gray.shape[1] * scale))
+    height = max(1, int(gray.shape[0] * scale))
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+    return cv2.resize(gray, (width, height), interpolation=interpolation)
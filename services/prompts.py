@@ -0,0 +1,99 @@
+class PromptTemplate:
+    """A versioned prompt with its expected output size.
+
+    Parameters:
+    - name: Template name, e.g. 'analysis'
+    - version: Bumped whenever the text changes; part of cache keys
+    - template: str.format template for the prompt text
+    - base_tokens: Output tokens needed per product regardless of its length
+    - tokens_per_ingredient: Additional output tokens per ingredient
+    """
+
+    def __init__(self, name, version, template, base_tokens, tokens_per_ingredient):
+        self.name = name
+        self.version = str(version)
+        self.template = template
+        self.base_tokens = base_tokens
+        self.tokens_per_ingredient = tokens_per_ingredient
+
+    @property
+    def key(self):
+        return f"{self.name}@{self.version}"
+
+    def render(self, **fields):
+        return self.template.format(**fields)
+
+PROMPTS = {}
+
+def register(template):
+    PROMPTS.setdefault(template.name, {})[template.version] = template
+    return template
+
+def get_prompt(name, version=None):
+    """Return a template by name, the latest version unless one is given"""
+    versions = PROMPTS[name]
+    if version is None:
+        version = max(versions, key=int)
+    return versions[str(version)]
+
+# Version 1 prompts spelled out the JSON layout. Since generation is
+# constrained by a JSON schema (see llm_schema), later versions only describe
+# the task, which saves prompt evaluation on every call.
+
+register(PromptTemplate('analysis', 1, """You are an expert in analyzing food ingredients. Analyze these ingredients: {ingredients}
+
+Return the analysis in this exact JSON format:
+{{
+    "health_score": <score>,
+    "ingredients": [{{"name": "<ingredient>", "category": "<category>"}}],
+    "ingredient_percentages": {{
+        "Natural": <percentage>,
+        "Additives": <percentage>,
+        "Preservatives": <percentage>,
+        "Artificial Colors": <percentage>,
+        "Highly Processed": <percentage>
+    }}
+}}
+
+Categories should be one of: Natural, Additives, Preservatives, Artificial Colors, Highly Processed.
+Health score should be between 0-10, where 10 is the healthiest.
+Make sure the percentages sum to 100%.""", base_tokens=96, tokens_per_ingredient=20))
+
+register(PromptTemplate('analysis', 2, """Classify each food ingredient as Natural, Additives, Preservatives, Artificial Colors or Highly Processed. Give the category percentages (summing to 100) and a health_score from 0 to 10 (10 = healthiest). Reply with JSON only.
+Ingredients: {ingredients}""", base_tokens=96, tokens_per_ingredient=20))
+
+register(PromptTemplate('analysis_batch', 1, """Classify the ingredients of each product below separately. For every product, classify each ingredient as Natural, Additives, Preservatives, Artificial Colors or Highly Processed, give the category percentages (summing to 100) and a health_score from 0 to 10 (10 = healthiest). Reply with JSON only, one object per product keyed by its id.
+{products}""", base_tokens=104, tokens_per_ingredient=20))
+
+register(PromptTemplate('detailed_analysis', 1, """Return a JSON object analyzing the ingredients. Format:
+{{
+  "ingredients": [{{"name": "string", "category": "string", "processing_score": 1-5, "health_impact_score": 1-5, "nutrient_density_score": 1-5}}],
+  "classification_summary": {{"Natural": [], "Additives": [], "Preservatives": [], "Artificial Colors": [], "Highly Processed": []}},
+  "ingredient_percentages": {{"category": 0-100}},
+  "health_score": 0-10
+}}
+
+Categories: Natural (whole foods), Additives (flavor/texture), Preservatives, Artificial Colors, Highly Processed
+Scores: Processing (1=least), Health (1=best), Nutrient (1=least), Overall (0-10, higher=better)
+
+Return ONLY valid JSON.
+
+Ingredients to analyze:
+{ingredients}
+
+Response (JSON only):""", base_tokens=160, tokens_per_ingredient=48))
+
+register(PromptTemplate('detailed_analysis', 2, """Classify each food ingredient: category (Natural, Additives, Preservatives, Artificial Colors, Highly Processed), processing_score 1-5 (1 = least processed), health_impact_score 1-5 (1 = best), nutrient_density_score 1-5 (1 = least nutritious). List the names per category in classification_summary, give the category percentages (summing to 100) and an overall health_score from 0 to 100 (higher = better). Reply with JSON only.
+Ingredients: {ingredients}""", base_tokens=160, tokens_per_ingredient=48))
+
+# Version 3 prompts ask only for per-ingredient labels; percentages, the
+# classification summary and the health score are computed locally.
+
+register(PromptTemplate('analysis', 3, """Classify each food ingredient as Natural, Additives, Preservatives, Artificial Colors or Highly Processed. Keep the label order. Reply with JSON only.
+Ingredients: {ingredients}""", base_tokens=16, tokens_per_ingredient=20))
+
+register(PromptTemplate('analysis_batch', 2, """Classify the ingredients of each product below separately, each as Natural, Additives, Preservatives, Artificial Colors or Highly Processed. Keep the label order. Reply with JSON only, one object per product keyed by its id.
+{products}""", base_tokens=20, tokens_per_ingredient=20))
+
+register(PromptTemplate('detailed_analysis', 3, """For each food ingredient give its category (Natural, Additives, Preservatives, Artificial Colors, Highly Processed), processing_score 1-5 (1 = least processed), health_impact_score 1-5 (1 = best) and nutrient_density_score 1-5 (1 = least nutritious). Keep the label order. Reply with JSON only.
+Ingredients: {ingredients}""", base_tokens=16, tokens_per_ingredient=40))
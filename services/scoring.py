@@ -0,0 +1,152 @@
+import re
+import numpy as np
+from .llm_schema import CATEGORIES
+
+# Bump whenever the weights or formulas below change, then run
+# scripts/rescore_analyses.py to bring stored analyses up to date
+SCORING_VERSION = '1'
+
+PERCENT_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*%')
+
+# Weights of each category's share in the overall health score
+CATEGORY_WEIGHTS = {
+    'Natural': 1.0,
+    'Additives': -0.3,
+    'Preservatives': -0.3,
+    'Artificial Colors': -0.2,
+    'Highly Processed': -0.4
+}
+
+# Weights of the per-ingredient scores in the overall health score
+SCORE_WEIGHTS = {
+    'processing_score': 0.5,
+    'health_impact_score': 0.3,
+    'nutrient_density_score': 0.2
+}
+
+def declared_percentage(name):
+    """The percentage printed next to an ingredient, e.g. "Wheat Flour (62%)" -> 62.0"""
+    match = PERCENT_PATTERN.search(name)
+    return float(match.group(1)) if match else None
+
+def estimate_proportions(names):
+    """Estimate each ingredient's share of the product, in percent.
+
+    Labels list ingredients in descending order of weight. Declared
+    percentages are used as printed; the rest of the product is spread over
+    the other ingredients with weights falling off by position (1, 1/2, 1/3,
+    ...). No ingredient gets more than the nearest declared percentage above
+    it on the label. The result sums to 100.
+    """
+    if not names:
+        return []
+
+    declared = [declared_percentage(name) for name in names]
+    declared_total = sum(value for value in declared if value is not None)
+    if declared_total > 100:
+        declared = [value * 100 / declared_total if value is not None else None for value in declared]
+        declared_total = 100
+
+    # Nearest declared share above each position
+    caps = []
+    cap = 100.0
+    for value in declared:
+        if value is not None:
+            cap = value
+        caps.append(cap)
+
+    shares = list(declared)
+    free = [i for i, value in enumerate(declared) if value is None]
+    budget = 100 - declared_total
+    while free:
+        total_weight = sum(1 / (i + 1) for i in free)
+        capped = [i for i in free if budget * (1 / (i + 1)) / total_weight > caps[i]]
+        if not capped:
+            for i in free:
+                shares[i] = budget * (1 / (i + 1)) / total_weight
+            break
+        for i in capped:
+            shares[i] = caps[i]
+            budget -= caps[i]
+            free.remove(i)
+
+    total = sum(shares)
+    if total <= 0:
+        return [round(100 / len(names), 2)] * len(names)
+    return [round(share * 100 / total, 2) for share in shares]
+
+def score_ingredients(ingredients):
+    """Copies of the ingredients, in label order, with an estimated 'percentage'"""
+    proportions = estimate_proportions([ingredient['name'] for ingredient in ingredients])
+    return [dict(ingredient, percentage=share) for ingredient, share in zip(ingredients, proportions)]
+
+def category_percentages(ingredients):
+    """Share of the product in each category, from the ingredient percentages"""
+    percentages = {category: 0.0 for category in CATEGORIES}
+    for ingredient in ingredients:
+        if ingredient.get('category') in percentages:
+            percentages[ingredient['category']] += ingredient.get('percentage', 0)
+    return {category: round(value, 1) for category, value in percentages.items()}
+
+def classification_summary(ingredients):
+    """Ingredient names grouped by category"""
+    summary = {category: [] for category in CATEGORIES}
+    for ingredient in ingredients:
+        if ingredient.get('category') in summary:
+            summary[ingredient['category']].append(ingredient['name'])
+    return summary
+
+def category_health_score(percentages):
+    """Health score (0-10) from the category percentages"""
+    score = sum(percentages.get(category, 0) * weight for category, weight in CATEGORY_WEIGHTS.items())
+    # Normalize to 0-10 range
+    normalized_score = min(max(5 + score / 20, 0), 10)
+    return round(normalized_score, 1)
+
+def category_health_scores(percentages):
+    """Vectorized category_health_score.
+
+    percentages is an (N, len(CATEGORIES)) array with columns in CATEGORIES
+    order; returns the N health scores.
+    """
+    weights = np.array([CATEGORY_WEIGHTS[category] for category in CATEGORIES])
+    scores = np.clip(5 + (percentages @ weights) / 20, 0, 10)
+    return np.round(scores, 1)
+
+def ingredient_health_score(ingredients):
+    """Health score (0-10) from the per-ingredient 1-5 scores, weighted by percentage.
+
+    A score of 1 is best for processing and health impact, while 5 is best
+    for nutrient density. Ingredients without all three scores are skipped;
+    when none have them the category score is used instead, which is a
+    neutral 5 for a list with no labelled ingredients.
+    """
+    total = 0
+    total_percentage = 0
+    for ingredient in ingredients:
+        if not all(isinstance(ingredient.get(field), (int, float)) for field in SCORE_WEIGHTS):
+            continue
+        penalty = (
+            (ingredient['processing_score'] - 1) * SCORE_WEIGHTS['processing_score'] +
+            (ingredient['health_impact_score'] - 1) * SCORE_WEIGHTS['health_impact_score'] +
+            (5 - ingredient['nutrient_density_score']) * SCORE_WEIGHTS['nutrient_density_score']
+        )
+        percentage = ingredient.get('percentage', 0)
+        total += penalty * percentage
+        total_percentage += percentage
+
+    if not total_percentage:
+        return category_health_score(category_percentages(ingredients))
+    # The weighted penalty runs from 0 (best) to 4 (worst)
+    return round(10 - (total / total_percentage) * 2.5, 1)
+
+def score_analysis(ingredients):
+    """Full analysis from labelled ingredients in label order"""
+    ingredients = score_ingredients(ingredients)
+    percentages = category_percentages(ingredients)
+    return {
+        'health_score': category_health_score(percentages),
+        'ingredients': ingredients,
+        'ingredient_percentages': percentages,
+        'scoring_version': SCORING_VERSION
+    }
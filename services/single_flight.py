@@ -0,0 +1,162 @@
+import os
+import copy
+import time
+import hashlib
+import threading
+import logging
+from concurrent.futures import Future
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+class FileLock:
+    """Exclusive advisory lock on a file, shared by every process on the machine.
+
+    Uses flock (or msvcrt.locking on Windows), so the lock is released by the
+    OS if the holding process dies.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def acquire(self, timeout, poll_interval=0.05):
+        """Wait up to timeout seconds for the lock; returns whether it was acquired"""
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = time.time() + timeout
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    msvcrt.locking(self.fd, msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if time.time() >= deadline:
+                    os.close(self.fd)
+                    self.fd = None
+                    return False
+                time.sleep(poll_interval)
+
+    def release(self):
+        if self.fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self.fd)
+            self.fd = None
+
+class SingleFlight:
+    """Runs one computation per key at a time and shares its result.
+
+    Within a process, callers that arrive while a computation for the same
+    key is in flight wait for it instead of starting their own. Every
+    caller receives its own deep copy of the result (or the exception). Across processes, the
+    caller that does the work first takes a lock file for the key and then
+    calls lookup() before computing, so a worker that waited on another
+    process picks up the result it just stored in the shared cache.
+    Cross-process coalescing therefore needs a shared store behind lookup;
+    without lock_dir only in-process callers are coalesced.
+
+    Lock files are striped over a fixed number of files named by a hash of
+    the key, so the directory never grows. If the lock cannot be taken within
+    lock_timeout the caller computes anyway rather than failing.
+    """
+
+    def __init__(self, name, lock_dir=None, lock_timeout=120, stripes=256):
+        self.name = name
+        self.lock_dir = lock_dir
+        self.lock_timeout = lock_timeout
+        self.stripes = stripes
+        self.flights = {}
+        self.lock = threading.Lock()
+        self.computed = 0
+        self.coalesced = 0
+        self.shared = 0
+
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    def lock_path(self, key):
+        stripe = int(hashlib.sha256(key.encode('utf-8')).hexdigest(), 16) % self.stripes
+        return os.path.join(self.lock_dir, f"{self.name}-{stripe}.lock")
+
+    def do(self, key, compute, lookup=None):
+        """Return compute(), coalescing concurrent calls for the same key.
+
+        lookup is an optional callable returning an already stored result
+        or None; the caller that does the work checks it first, after
+        taking the lock file.
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = Future()
+                self.flights[key] = flight
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            logger.info(f"Waiting on in-flight {self.name} for {key[:12]}")
+            return copy.deepcopy(flight.result())
+
+        try:
+            result = self._run(key, compute, lookup)
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        else:
+            # Waiters copy the stored result, so the caller gets its own copy too
+            flight.set_result(result)
+            return copy.deepcopy(result)
+        finally:
+            with self.lock:
+                del self.flights[key]
+
+    def _run(self, key, compute, lookup):
+        if not self.lock_dir:
+            return self._lookup_or_compute(compute, lookup)
+
+        file_lock = FileLock(self.lock_path(key))
+        if not file_lock.acquire(self.lock_timeout):
+            logger.warning(f"Timed out waiting for the {self.name} lock for {key[:12]}, computing anyway")
+            return self._compute(compute)
+        try:
+            return self._lookup_or_compute(compute, lookup)
+        finally:
+            file_lock.release()
+
+    def _lookup_or_compute(self, compute, lookup):
+        # Another caller may have finished the same key since ours checked the store
+        if lookup is not None:
+            result = lookup()
+            if result is not None:
+                with self.lock:
+                    self.shared += 1
+                return result
+        return self._compute(compute)
+
+    def _compute(self, compute):
+        with self.lock:
+            self.computed += 1
+        return compute()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'in_flight': len(self.flights),
+                'computed': self.computed,
+                'coalesced': self.coalesced,
+                'found_in_store': self.shared,
+            }
@@ -0,0 +1,160 @@
+import re
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+NAME_PATTERN = re.compile(r'"name"\s*:\s*"([^"]+)"')
+
+class JSONObjectScanner:
+    """Finds the first complete top-level JSON object in streamed model output.
+
+    Text is fed in chunks as it arrives. A leading <think>...</think> block
+    (deepseek-r1 reasoning) is skipped, braces inside JSON strings are
+    ignored, and the scanner reports completion as soon as the brace that
+    closes the first object arrives, so generation can be stopped there.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.position = 0
+        self.thinking = None  # Unknown until we see the first characters
+        self.start = None
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.end = None
+
+    def feed(self, chunk):
+        """Add text and return True once the object is complete"""
+        self.buffer += chunk
+        if self.end is not None:
+            return True
+
+        if self.thinking is None:
+            stripped = self.buffer.lstrip()
+            if len(stripped) < len('<think>') and '{' not in stripped:
+                return False
+            self.thinking = stripped.startswith('<think>')
+
+        if self.thinking:
+            close = self.buffer.find('</think>', self.position)
+            if close == -1:
+                # Keep the tail in case the closing tag is split across chunks
+                self.position = max(self.position, len(self.buffer) - len('</think>'))
+                return False
+            self.thinking = False
+            self.position = close + len('</think>')
+
+        while self.position < len(self.buffer):
+            char = self.buffer[self.position]
+            self.position += 1
+
+            if self.start is None:
+                if char == '{':
+                    self.start = self.position - 1
+                    self.depth = 1
+                continue
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == '\\':
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                continue
+
+            if char == '"':
+                self.in_string = True
+            elif char == '{':
+                self.depth += 1
+            elif char == '}':
+                self.depth -= 1
+                if self.depth == 0:
+                    self.end = self.position
+                    return True
+
+        return False
+
+    @property
+    def is_thinking(self):
+        return bool(self.thinking)
+
+    def partial(self):
+        """JSON text received so far (may be incomplete)"""
+        if self.start is None:
+            return ''
+        return self.buffer[self.start:self.end or len(self.buffer)]
+
+    def result(self):
+        """The complete object text, or None if it never closed"""
+        if self.end is None:
+            return None
+        return self.buffer[self.start:self.end]
+
+def read_json_stream(response, on_progress=None, progress_every=20, stats=None, tail_chunks=8):
+    """Read an Ollama NDJSON stream until the first JSON object is complete.
+
+    The response is closed shortly after the object's closing brace arrives,
+    which makes Ollama stop generating. Up to tail_chunks further messages are
+    read first, since a schema-constrained generation ends right there and
+    its final message carries the token counts. on_progress, when given, is
+    called every progress_every chunks with a dict holding the phase
+    ('thinking' or 'generating'), the number of chunks received and the
+    ingredient names seen so far.
+
+    stats, when given, is filled with the number of chunks and, if the final
+    message arrived, Ollama's prompt_eval_count and eval_count.
+
+    Returns the JSON object text. Falls back to the whole response text if
+    the stream ends without a complete object, so callers can still try
+    their own cleanup.
+    """
+    scanner = JSONObjectScanner()
+    chunks = 0
+    tail = None
+
+    try:
+        for line in response.iter_lines():
+            if not line:
+                continue
+
+            message = json.loads(line)
+            chunks += 1
+
+            if message.get('done'):
+                if stats is not None:
+                    for field in ('prompt_eval_count', 'eval_count'):
+                        if field in message:
+                            stats[field] = message[field]
+                break
+
+            if tail is not None:
+                tail -= 1
+                if tail <= 0:
+                    break
+                continue
+
+            complete = scanner.feed(message.get('response', ''))
+            # With reasoning enabled Ollama streams it in a separate field
+            thinking = scanner.is_thinking or (bool(message.get('thinking')) and scanner.start is None)
+
+            if on_progress and (complete or chunks % progress_every == 0):
+                on_progress({
+                    'phase': 'thinking' if thinking else 'generating',
+                    'chunks': chunks,
+                    'ingredients': NAME_PATTERN.findall(scanner.partial()),
+                })
+
+            if complete:
+                logger.debug(f"JSON object complete after {chunks} chunks, stopping generation")
+                tail = tail_chunks
+                if tail <= 0:
+                    break
+    finally:
+        response.close()
+        if stats is not None:
+            stats['chunks'] = chunks
+
+    return scanner.result() or scanner.buffer
@@ -0,0 +1,95 @@
+import re
+import cv2
+from .config import Config
+
+INGREDIENTS_PATTERN = re.compile(r'ingred\w*', re.IGNORECASE)
+
+def find_text_regions(image, max_regions=None, min_area_ratio=0.002, max_coverage=0.85):
+    """Find blocks of text in a preprocessed label image.
+
+    Uses the edge and contour approach from enhance_text_regions in
+    tests/test_ocr.py: Canny edges are dilated with a wide kernel so letters
+    merge into lines and neighbouring lines into paragraphs, and the bounding
+    boxes of the resulting contours are the candidate blocks.
+
+    Returns (x, y, w, h) boxes in reading order. An empty list means cropping
+    is not worthwhile (no blocks, or the blocks cover most of the image).
+    """
+    max_regions = max_regions or Config.OCR_MAX_REGIONS
+    height, width = image.shape[:2]
+    image_area = float(height * width)
+
+    edges = cv2.Canny(image, 100, 200)
+
+    # Sized for text normalized to OCR_TARGET_TEXT_HEIGHT
+    text_height = Config.OCR_TARGET_TEXT_HEIGHT
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (text_height, max(3, text_height // 2)))
+    dilated = cv2.dilate(edges, kernel, iterations=2)
+
+    contours, _ = cv2.findContours(dilated, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    boxes = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if w * h < image_area * min_area_ratio or h < text_height // 2:
+            continue
+        # Text blocks are wider than they are tall; skips barcodes and pictures
+        if w < h * 1.5 and w * h < image_area * 0.05:
+            continue
+        boxes.append((x, y, w, h))
+
+    if not boxes:
+        return []
+
+    boxes.sort(key=lambda box: box[2] * box[3], reverse=True)
+    boxes = boxes[:max_regions]
+
+    if sum(w * h for _, _, w, h in boxes) > image_area * max_coverage:
+        return []
+
+    padding = text_height // 2
+    padded = []
+    for x, y, w, h in boxes:
+        x0, y0 = max(0, x - padding), max(0, y - padding)
+        x1, y1 = min(width, x + w + padding), min(height, y + h + padding)
+        padded.append((x0, y0, x1 - x0, y1 - y0))
+
+    # Reading order: top to bottom, then left to right
+    padded.sort(key=lambda box: (box[1] // text_height, box[0]))
+    return padded
+
+def crop_regions(image, regions):
+    """Cut the regions out of an image, with a white border for Tesseract"""
+    crops = []
+    for x, y, w, h in regions:
+        crop = image[y:y + h, x:x + w]
+        crops.append(cv2.copyMakeBorder(crop, 10, 10, 10, 10, cv2.BORDER_CONSTANT, value=255))
+    return crops
+
+def find_ingredients_block(results):
+    """Return the region result that holds the ingredient list, or None.
+
+    The text is cut to start at the "Ingredients" heading, the same way
+    IngredientAnalyzer.extract_text_from_image slices its output.
+    """
+    for result in results:
+        match = INGREDIENTS_PATTERN.search(result['text'])
+        if match:
+            trimmed = dict(result)
+            trimmed['text'] = result['text'][match.start():]
+            return trimmed
+    return None
+
+def merge_region_results(results):
+    """Join region results in reading order, weighting confidence by text length"""
+    texts = [result for result in results if result['text'].strip()]
+    if not texts:
+        return None
+
+    total = sum(len(result['text']) for result in texts)
+    confidence = sum(result['confidence'] * len(result['text']) for result in texts) / total
+    return {
+        'config': texts[0]['config'],
+        'text': '\n\n'.join(result['text'].strip() for result in texts),
+        'confidence': confidence,
+    }
@@ -0,0 +1,96 @@
+import threading
+import logging
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+class TokenBudget:
+    """Per-request generation limits for Ollama.
+
+    num_predict is sized from the template's expected output per product and
+    per ingredient, so a runaway generation is cut off instead of running to
+    the model's default limit. num_ctx is the smallest power of two that
+    holds the prompt and the output, which keeps the KV cache small for short
+    labels. Reasoning is either switched off ('off') or allowed with a fixed
+    token allowance on top of the output budget ('capped').
+    """
+
+    def __init__(self, reasoning='off', reasoning_tokens=256, min_ctx=1024, max_ctx=8192):
+        self.reasoning = reasoning
+        self.reasoning_tokens = reasoning_tokens
+        self.min_ctx = min_ctx
+        self.max_ctx = max_ctx
+
+    @staticmethod
+    def estimate_tokens(text):
+        """Rough token count, erring high (about 3 characters per token)"""
+        return len(text) // 3 + 1
+
+    def request_fields(self, template, prompt, ingredient_count, products=1):
+        """Fields to merge into an /api/generate payload"""
+        num_predict = template.base_tokens * products + template.tokens_per_ingredient * ingredient_count
+        if self.reasoning == 'capped':
+            num_predict += self.reasoning_tokens * products
+
+        needed = self.estimate_tokens(prompt) + num_predict
+        num_ctx = self.min_ctx
+        while num_ctx < needed and num_ctx < self.max_ctx:
+            num_ctx *= 2
+
+        return {
+            "think": self.reasoning != 'off',
+            "options": {"num_predict": num_predict, "num_ctx": num_ctx},
+        }
+
+class TokenMeter:
+    """Running prompt/output token totals per prompt template.
+
+    Counts come from the prompt_eval_count and eval_count of Ollama's final
+    stream message. When generation was stopped before that message, the
+    number of streamed chunks (one token each) stands in for eval_count and
+    the call is counted as estimated.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}
+
+    def record(self, template_key, stream_stats):
+        prompt_tokens = stream_stats.get('prompt_eval_count')
+        output_tokens = stream_stats.get('eval_count')
+        estimated = output_tokens is None
+        if estimated:
+            output_tokens = stream_stats.get('chunks', 0)
+
+        logger.info(f"Tokens for {template_key}: prompt={prompt_tokens}, output={output_tokens}"
+                    f"{' (estimated)' if estimated else ''}")
+
+        with self.lock:
+            totals = self.totals.setdefault(template_key, {
+                'calls': 0, 'estimated_calls': 0, 'prompt_tokens': 0, 'output_tokens': 0
+            })
+            totals['calls'] += 1
+            totals['estimated_calls'] += int(estimated)
+            totals['prompt_tokens'] += prompt_tokens or 0
+            totals['output_tokens'] += output_tokens
+
+    def stats(self):
+        with self.lock:
+            return {
+                key: dict(
+                    totals,
+                    avg_prompt_tokens=round(totals['prompt_tokens'] / totals['calls'], 1),
+                    avg_output_tokens=round(totals['output_tokens'] / totals['calls'], 1),
+                )
+                for key, totals in self.totals.items()
+            }
+
+token_budget = TokenBudget(
+    reasoning=Config.LLM_REASONING,
+    reasoning_tokens=Config.LLM_REASONING_TOKENS,
+    min_ctx=Config.LLM_MIN_CTX,
+    max_ctx=Config.LLM_MAX_CTX
+)
+
+# Shared by both analyzers
+token_meter = TokenMeter()
@@ -0,0 +1,62 @@
+import os
+import sys
+import pytest
+
+# Add parent directory to path to import the services
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from services.additives import classify_additive, find_codes, contains_codes, is_compound
+
+@pytest.mark.parametrize("ingredient, category", [
+    ("INS 621", "Additives"),
+    ("E211", "Preservatives"),
+    ("Acidity Regulator (330)", "Additives"),
+    ("Colour (160a(i))", "Natural"),
+    ("Colour (150d)", "Artificial Colors"),
+    ("Stabilizers (466, 440)", "Highly Processed"),
+    ("Raising Agents (500(ii), 503(ii))", "Additives"),
+    ("Emulsifier (472e)", "Highly Processed"),
+    ("Preservative", "Preservatives"),
+    ("Nature Identical Flavouring Substances", "Additives"),
+])
+def test_classify_additive(ingredient, category):
+    assert classify_additive(ingredient) == category
+
+@pytest.mark.parametrize("ingredient", ["Corn (2020)", "Sugar (500g)", "Wheat Flour (62%)", "Salt", "2020"])
+def test_numbers_that_are_not_codes(ingredient):
+    """Years, weights and percentages are not read as additive codes"""
+    assert find_codes(ingredient) == []
+    assert classify_additive(ingredient) is None
+
+def test_prefixed_codes_are_taken_as_printed():
+    assert find_codes("E2020") == ["2020"]
+
+def test_contains_codes():
+    assert contains_codes("322, 471")
+    assert contains_codes("INS 330")
+    assert not contains_codes("2020")
+    assert not contains_codes("sunflower, palm")
+
+@pytest.mark.parametrize("ingredient", [
+    "Seasoning (Sugar, Salt, Spices, Flavour Enhancer (INS 627))",
+    "Spice Mix [Chilli, E621]",
+    "Emulsifier (Soy Lecithin, 471)",
+])
+def test_compound_items_are_left_to_the_model(ingredient):
+    """A code in a sub-ingredient list does not make the whole item an additive"""
+    assert is_compound(ingredient)
+    assert classify_additive(ingredient) is None
+
+@pytest.mark.parametrize("ingredient, category", [
+    ("Flavour Enhancer (INS 627)", "Additives"),
+    ("Emulsifiers [322, 471]", "Highly Processed"),
+    ("Colour (150d) (0.5%)", "Artificial Colors"),
+    ("Preservative (Sodium Benzoate)", "Preservatives"),
+])
+def test_named_additives_are_not_compound(ingredient, category):
+    assert not is_compound(ingredient)
+    assert classify_additive(ingredient) == category
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,75 @@
+import os
+import sys
+import threading
+import pytest
+
+# Add parent directory to path to import the services
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from services.batching import MicroBatcher
+
+class Recorder:
+    """run_batch that records each batch and upper-cases the items"""
+
+    def __init__(self):
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def __call__(self, items):
+        with self.lock:
+            self.batches.append(list(items))
+        return [ValueError(item) if item == 'bad' else item.upper() for item in items]
+
+def test_concurrent_items_share_a_batch():
+    recorder = Recorder()
+    batcher = MicroBatcher(recorder, max_wait=1, max_size=3)
+    futures = [batcher.submit(item) for item in ('sugar', 'salt', 'oil')]
+    assert [future.result(5) for future in futures] == ['SUGAR', 'SALT', 'OIL']
+    assert recorder.batches == [['sugar', 'salt', 'oil']]
+
+def test_batches_are_capped_at_max_size():
+    recorder = Recorder()
+    batcher = MicroBatcher(recorder, max_wait=0.2, max_size=2)
+    futures = [batcher.submit(item) for item in ('a', 'b', 'c', 'd', 'e')]
+    assert [future.result(5) for future in futures] == ['A', 'B', 'C', 'D', 'E']
+    assert all(len(batch) <= 2 for batch in recorder.batches)
+    assert [item for batch in recorder.batches for item in batch] == ['a', 'b', 'c', 'd', 'e']
+
+def test_lone_item_runs_after_max_wait():
+    recorder = Recorder()
+    batcher = MicroBatcher(recorder, max_wait=0.05, max_size=4)
+    assert batcher.submit('water').result(5) == 'WATER'
+    assert recorder.batches == [['water']]
+
+def test_failed_item_only_fails_its_caller():
+    batcher = MicroBatcher(Recorder(), max_wait=1, max_size=2)
+    good, bad = batcher.submit('salt'), batcher.submit('bad')
+    assert good.result(5) == 'SALT'
+    with pytest.raises(ValueError):
+        bad.result(5)
+
+def test_batch_error_fails_every_caller():
+    def run_batch(items):
+        raise RuntimeError("model server down")
+
+    batcher = MicroBatcher(run_batch, max_wait=0.2, max_size=2)
+    futures = [batcher.submit('sugar'), batcher.submit('salt')]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(5)
+
+    # The collector keeps running after a failed batch
+    batcher.run_batch = Recorder()
+    assert batcher.submit('oil').result(5) == 'OIL'
+
+def test_short_results_fail_the_unmatched_callers():
+    """Callers left without a result get an error instead of blocking forever"""
+    batcher = MicroBatcher(lambda items: [item.upper() for item in items[:1]], max_wait=1, max_size=2)
+    first, second = batcher.submit('sugar'), batcher.submit('salt')
+    assert first.result(5) == 'SUGAR'
+    with pytest.raises(RuntimeError):
+        second.result(5)
+
+if __name__ == "__main__":
+    pytest.main([__file__])
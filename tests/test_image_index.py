@@ -0,0 +1,129 @@
+import os
+import sys
+import io
+import random
+import sqlite3
+import pytest
+from PIL import Image, ImageDraw
+
+# Add parent directory to path to import the services
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from services.config import Config
+from services.image_index import BKTree, ImageIndex, dhash, hamming
+
+TESTING_IMAGES = os.path.join(parent_dir, 'testing_images')
+
+def label_image(text="INGREDIENTS: Sugar, Salt", size=(400, 200)):
+    image = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([20, 20, size[0] // 2, size[1] - 20], fill='black')
+    draw.text((size[0] // 2 + 10, size[1] // 2), text, fill='black')
+    return image
+
+def test_hamming():
+    assert hamming(0b1011, 0b1011) == 0
+    assert hamming(0b1011, 0b0001) == 2
+
+def test_bktree_matches_linear_scan():
+    """find() returns the same closest hash as checking every entry"""
+    rng = random.Random(0)
+    keys = [rng.getrandbits(64) for _ in range(500)]
+    tree = BKTree()
+    for key in keys:
+        tree.add(key, key)
+    assert len(tree) == len(set(keys))
+
+    for _ in range(50):
+        query = rng.choice(keys) ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64))
+        distance, key, value = tree.find(query, 4)
+        assert distance == min(hamming(query, k) for k in keys)
+        assert hamming(query, key) == distance
+        assert value == key
+
+def test_bktree_respects_max_distance():
+    tree = BKTree()
+    tree.add(0, 'zero')
+    assert tree.find(0b111, 2) is None
+    assert tree.find(0b11, 2) == (2, 0, 'zero')
+    assert BKTree().find(0, 10) is None
+
+def test_bktree_replaces_identical_hash():
+    tree = BKTree()
+    tree.add(5, 'old')
+    tree.add(5, 'new')
+    assert len(tree) == 1
+    assert tree.find(5, 0) == (0, 5, 'new')
+
+def test_dhash_is_stable_under_resize_and_reencode(tmp_path):
+    image = label_image()
+    path = tmp_path / 'label.jpg'
+    image.save(path, quality=60)
+    reencoded = Image.open(path)
+    resized = image.resize((800, 400))
+
+    assert dhash(image) == dhash(image.copy())
+    assert hamming(dhash(image), dhash(reencoded)) <= 4
+    assert hamming(dhash(image), dhash(resized)) <= 4
+    assert hamming(dhash(image), dhash(image.transpose(Image.FLIP_LEFT_RIGHT))) > 10
+
+def test_index_persists_and_attaches_analysis(tmp_path):
+    disk_path = str(tmp_path / 'index.db')
+    index = ImageIndex(max_distance=4, disk_path=disk_path)
+    phash = dhash(label_image())
+    index.add(phash, {'text': 'Sugar, Salt', 'config': 'psm6', 'confidence': 90})
+    index.attach_analysis(phash, 'abc123')
+
+    reloaded = ImageIndex(max_distance=4, disk_path=disk_path)
+    match = reloaded.lookup(phash ^ 1)
+    assert match['text'] == 'Sugar, Salt'
+    assert match['analysis_id'] == 'abc123'
+    assert match['phash'] == phash
+    assert match['distance'] == 1
+
+def product_photos():
+    names = sorted(name for name in os.listdir(TESTING_IMAGES)
+                   if name.lower().endswith(('.jpg', '.jpeg')) and not name.endswith(('_binary.jpg', '_otsu.jpg')))
+    photos = {}
+    for name in names:
+        image = Image.open(os.path.join(TESTING_IMAGES, name))
+        image.draft('RGB', (800, 800))
+        photos[name] = image.convert('RGB')
+    return photos
+
+def test_distinct_products_do_not_match():
+    """At the default radius a re-encoded photo finds itself and never another product"""
+    photos = product_photos()
+    assert len(photos) >= 2
+    index = ImageIndex(max_distance=Config.IMAGE_INDEX_MAX_DISTANCE)
+    for name, image in photos.items():
+        index.add(dhash(image), {'text': name})
+
+    for name, image in photos.items():
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=85)
+        match = index.lookup(dhash(Image.open(buffer)))
+        assert match is not None and match['text'] == name
+
+    # Photos of other products sit well outside the radius
+    for name, image in photos.items():
+        others = [dhash(other) for other_name, other in photos.items() if other_name != name]
+        assert min(hamming(dhash(image), other) for other in others) > Config.IMAGE_INDEX_MAX_DISTANCE
+
+def test_index_closes_its_connections(tmp_path):
+    index = ImageIndex(disk_path=str(tmp_path / 'index.db'))
+    opened = []
+    connect = index._connect
+    index._connect = lambda: opened.append(connect()) or opened[-1]
+
+    phash = dhash(label_image())
+    index.add(phash, {'text': 'Sugar, Salt'})
+    index.attach_analysis(phash, 'abc123')
+    assert len(opened) == 2
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+
+if __name__ == "__main__":
+    pytest.main([__file__])
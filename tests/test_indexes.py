@@ -0,0 +1,142 @@
+import os
+import sys
+import pytest
+from pymongo import MongoClient, monitoring
+from pymongo.errors import PyMongoError
+
+# Add parent directory to path to import the models
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from models import User, IngredientAnalysis, IngredientKnowledge, GlobalStats, ensure_indexes
+
+MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/')
+TEST_DB = 'ingredient_analyzer_index_test'
+
+# Plan stages that mean a query reads the whole collection or sorts in memory
+BAD_STAGES = ('COLLSCAN', 'SORT')
+
+# Fields added by the driver that explain does not accept
+DRIVER_FIELDS = ('lsid', '$db', '$clusterTime', '$readPreference', 'txnNumber', 'cursor')
+
+class QueryRecorder(monitoring.CommandListener):
+    """Records every find and aggregate sent to the test database"""
+
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        if event.database_name == TEST_DB and event.command_name in ('find', 'aggregate'):
+            self.commands.append(dict(event.command))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+def bad_stages(plan):
+    """Names of COLLSCAN/SORT stages anywhere in a winning plan"""
+    found = []
+    if isinstance(plan, dict):
+        if plan.get('stage') in BAD_STAGES:
+            found.append(plan['stage'])
+        for value in plan.values():
+            found.extend(bad_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            found.extend(bad_stages(value))
+    return found
+
+def winning_plans(explain):
+    """Every winningPlan in an explain result, including each aggregation cursor stage"""
+    plans = []
+    if isinstance(explain, dict):
+        for key, value in explain.items():
+            if key == 'winningPlan':
+                plans.append(value)
+            elif key != 'rejectedPlans':
+                plans.extend(winning_plans(value))
+    elif isinstance(explain, list):
+        for value in explain:
+            plans.extend(winning_plans(value))
+    return plans
+
+def explain_problems(db, command):
+    """COLLSCAN/SORT stages, or an in-memory $sort, in the plan of a recorded command"""
+    command = {key: value for key, value in command.items() if key not in DRIVER_FIELDS}
+    if 'pipeline' in command:
+        command['cursor'] = {}
+    explain = db.command('explain', command, verbosity='queryPlanner')
+
+    problems = []
+    for plan in winning_plans(explain):
+        problems.extend(bad_stages(plan))
+    # A $sort that could not be pushed into the query runs in memory
+    for stage in explain.get('stages', []):
+        if '$sort' in stage:
+            problems.append('$sort')
+    return problems
+
+def seed(db):
+    users = User(db)
+    analyses = IngredientAnalysis(db)
+    user_ids = [users.create_user(f"user{i}", f"user{i}@example.com", "password") for i in range(3)]
+    for user_id in user_ids:
+        for i in range(5):
+            analyses.save_analysis(user_id, "Water, Sugar, Salt", {
+                "ingredients": [
+                    {"name": "Water", "category": "Natural"},
+                    {"name": "Sugar", "category": "Highly Processed"}
+                ],
+                "ingredient_percentages": {"Natural": 50, "Highly Processed": 50},
+                "health_score": 5 + i,
+                "product_name": f"Product {i}"
+            })
+    return user_ids
+
+def test_model_queries_use_indexes():
+    """Every query the models send for the app's pages is answered from an index"""
+    recorder = QueryRecorder()
+    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=2000, event_listeners=[recorder])
+    try:
+        client.admin.command('ping')
+    except PyMongoError as e:
+        pytest.skip(f"MongoDB is not available: {str(e)}")
+
+    client.drop_database(TEST_DB)
+    db = client[TEST_DB]
+    try:
+        ensure_indexes(db)
+        # Running it again must be a no-op
+        ensure_indexes(db)
+        user_ids = seed(db)
+
+        recorder.commands = []
+        users = User(db)
+        analyses = IngredientAnalysis(db)
+        users.verify_user("user1", "password")
+        users.get_users_overview(skip=0, limit=2)
+        history, next_cursor = analyses.get_user_analyses(user_ids[0], limit=2)
+        analyses.get_user_analyses(user_ids[0], limit=2, cursor=next_cursor)
+        analyses.get_analysis_by_id(history[0]['_id'])
+        analyses.get_user_analysis_stats(user_ids[0])
+        analyses.list_recent_analyses(skip=0, limit=5)
+        analyses.list_user_analyses(user_ids[0], limit=2)
+        IngredientKnowledge(db).lookup(["water", "sugar"])
+        GlobalStats(db).get_daily(days=7)
+
+        assert recorder.commands, "No queries were recorded"
+        failures = []
+        for command in recorder.commands:
+            problems = explain_problems(db, command)
+            if problems:
+                failures.append(f"{command.get('find') or command.get('aggregate')}: {problems} in {command}")
+        assert not failures, "Queries without a supporting index:\n" + "\n".join(failures)
+    finally:
+        client.drop_database(TEST_DB)
+        client.close()
+
+if __name__ == "__main__":
+    test_model_queries_use_indexes()
+    print("All model queries use indexes")
@@ -0,0 +1,96 @@
+import os
+import sys
+import pytest
+
+# Add parent directory to path to import the services
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from services.config import Config
+from services.ingredient_service import IngredientService, process_ingredients
+
+LABELS = {
+    "wheat flour": "Natural",
+    "sugar": "Highly Processed",
+    "palm oil": "Highly Processed",
+    "salt": "Natural",
+}
+
+@pytest.fixture
+def service(monkeypatch):
+    """An IngredientService with in-memory caches whose model labels from LABELS"""
+    monkeypatch.setattr(Config, 'ANALYSIS_CACHE_PATH', None)
+    monkeypatch.setattr(Config, 'LLM_BATCH_ENABLED', False)
+    service = IngredientService()
+    sent = []
+
+    def generate_analysis(ingredients_text, on_progress=None):
+        sent.append(ingredients_text)
+        names = [name.strip() for name in ingredients_text.split(',')]
+        return {"ingredients": [
+            {"name": name, "category": LABELS.get(name.split(' (')[0], "Additives")} for name in names
+        ]}
+
+    monkeypatch.setattr(service, 'generate_analysis', generate_analysis)
+    service.sent = sent
+    return service
+
+def test_process_ingredients_keeps_codes_and_percentages():
+    names = process_ingredients("Ingredients: Wheat Flour (62%), Sugar (Cane), Emulsifier (322), Salt (1.5%).")
+    assert names == ["wheat flour (62%)", "sugar", "emulsifier (322)", "salt (1.5%)"]
+
+def test_declared_percentage_reaches_the_scoring(service):
+    """A share printed on the label survives cleaning and is used as is"""
+    text = "Ingredients: Wheat Flour (62%), Sugar, Palm Oil, Salt (1%)"
+    analysis = service.analyze_ingredients(', '.join(process_ingredients(text)))
+    shares = {ingredient["name"]: ingredient["percentage"] for ingredient in analysis["ingredients"]}
+    assert shares["wheat flour (62%)"] == 62.0
+    assert shares["salt (1%)"] == 1.0
+    assert analysis["ingredient_percentages"]["Natural"] == 63.0
+
+def test_process_ingredients_keeps_sub_ingredient_lists():
+    names = process_ingredients("Potato, Seasoning (Sugar, Salt, Flavour Enhancer (INS 627)), Salt (1.5%).")
+    assert names == ["potato", "seasoning (sugar, salt, flavour enhancer (ins 627))", "salt (1.5%)"]
+
+def test_compound_item_is_sent_to_the_model(service):
+    """Only a coded additive on its own is classified locally"""
+    text = ', '.join(process_ingredients("Flavour Enhancer (INS 627), Seasoning (Sugar, Salt, Flavour Enhancer (INS 627))"))
+    service.analyze_ingredients(text)
+    assert len(service.sent) == 1
+    assert "seasoning (sugar, salt" in service.sent[0]
+    assert not service.sent[0].startswith("flavour enhancer")
+
+@pytest.fixture
+def batch_service(monkeypatch):
+    """An IngredientService whose single-product calls are recorded"""
+    monkeypatch.setattr(Config, 'ANALYSIS_CACHE_PATH', None)
+    monkeypatch.setattr(Config, 'LLM_BATCH_ENABLED', False)
+    service = IngredientService()
+    service.singles = []
+
+    def generate_single(ingredients_text, on_progress=None):
+        service.singles.append(ingredients_text)
+        return {"ingredients": [{"name": ingredients_text, "category": "Natural"}]}
+
+    monkeypatch.setattr(service, 'generate_single', generate_single)
+    return service
+
+def test_unavailable_model_is_not_retried_per_product(batch_service, monkeypatch):
+    def request_json(*args, **kwargs):
+        raise ValueError("The analysis model is currently unavailable. Please try again shortly.")
+
+    monkeypatch.setattr(batch_service, 'request_json', request_json)
+    results = batch_service.generate_batch([("sugar", None), ("salt", None)])
+    assert all(isinstance(result, ValueError) for result in results)
+    assert batch_service.singles == []
+
+def test_malformed_section_is_retried_on_its_own(batch_service, monkeypatch):
+    response = '{"p1": {"ingredients": [{"name": "sugar", "category": "Highly Processed"}]}, "p2": {"oops": 1}}'
+    monkeypatch.setattr(batch_service, 'request_json', lambda *args, **kwargs: response)
+    results = batch_service.generate_batch([("sugar", None), ("salt", None)])
+    assert results[0] == {"ingredients": [{"name": "sugar", "category": "Highly Processed"}]}
+    assert results[1] == {"ingredients": [{"name": "salt", "category": "Natural"}]}
+    assert batch_service.singles == ["salt"]
+
+if __name__ == "__main__":
+    pytest.main([__file__])
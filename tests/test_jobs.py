@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+import sqlite3
+import pytest
+
+# Add parent directory to path to import the services
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from services.jobs import JobQueue
+
+def wait_for_status(queue, job_id, statuses=('done', 'failed'), timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in statuses:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+def stored_payload(queue, job_id):
+    with sqlite3.connect(queue.db_path) as conn:
+        return conn.execute("SELECT payload FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+
+def test_finished_jobs_drop_their_payload(tmp_path):
+    """Neither a done nor a failed job keeps the uploaded image"""
+    queue = JobQueue(str(tmp_path / 'jobs.db'), workers=1, poll_interval=0.05)
+
+    @queue.handler
+    def run(job_id, payload, progress):
+        progress('analyzing')
+        if payload['fail']:
+            raise ValueError("Image processing failed")
+        return {'success': True}
+
+    done = queue.submit({'fail': False, 'image': 'x' * 1000})
+    failed = queue.submit({'fail': True, 'image': 'x' * 1000})
+
+    assert wait_for_status(queue, done)['result'] == {'success': True}
+    job = wait_for_status(queue, failed)
+    assert job['status'] == 'failed'
+    assert job['error'] == "Image processing failed"
+    assert stored_payload(queue, done) == '{}'
+    assert stored_payload(queue, failed) == '{}'
+
+def test_cleanup_deletes_only_old_finished_jobs(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'))
+    old, recent, queued = queue.submit({}), queue.submit({}), queue.submit({})
+    with sqlite3.connect(queue.db_path) as conn:
+        conn.execute("UPDATE jobs SET status = 'done' WHERE id = ?", (old,))
+        conn.execute("UPDATE jobs SET status = 'failed' WHERE id = ?", (recent,))
+        conn.execute("UPDATE jobs SET updated_at = ? WHERE id IN (?, ?)", (time.time() - 7200, old, queued))
+
+    assert queue.cleanup(max_age_seconds=3600) == 1
+    assert queue.get(old) is None
+    assert queue.get(recent) is not None
+    assert queue.get(queued) is not None
+
+def test_workers_run_cleanup(tmp_path):
+    """The worker loop removes expired jobs without anyone calling cleanup"""
+    queue = JobQueue(str(tmp_path / 'jobs.db'), workers=1, poll_interval=0.05,
+                     retention_seconds=0, cleanup_interval=0)
+    queue.handler(lambda job_id, payload, progress: {'success': True})
+    job_id = queue.submit({})
+
+    deadline = time.time() + 5
+    while queue.get(job_id) is not None and time.time() < deadline:
+        time.sleep(0.05)
+    assert queue.get(job_id) is None
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,57 @@
+import os
+import sys
+import pytest
+
+# Add parent directory to path to import the services
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from services.llm_client import CircuitBreaker, LLMClient
+
+def open_breaker(reset_timeout=0):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=reset_timeout)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+def test_half_open_lets_one_trial_through():
+    breaker = open_breaker()
+    assert breaker.state == 'half_open'
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.allow()
+
+def test_failed_trial_reopens():
+    breaker = open_breaker(reset_timeout=60)
+    breaker.opened_at -= 60
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+class BrokenSession:
+    """Session whose requests fail with something other than a requests exception"""
+
+    def request(self, *args, **kwargs):
+        raise ValueError("unexpected")
+
+def test_unexpected_error_releases_the_trial():
+    """A bug during the half-open trial does not leave the breaker stuck"""
+    client = LLMClient('http://localhost:11434', breaker=open_breaker())
+    client.session = BrokenSession()
+    with pytest.raises(ValueError):
+        client.tags()
+    assert not client.breaker.trial_running
+    assert client.breaker.allow()
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,66 @@
+import os
+import sys
+import json
+import pytest
+
+# Add parent directory to path to import the services
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from services.llm_schema import (
+    ANALYSIS_SCHEMA, DETAILED_ANALYSIS_SCHEMA, AnalysisParseError, ResponseParser, batch_schema, validate
+)
+
+SUGAR = {"name": "Sugar", "category": "Highly Processed"}
+SCORED_SUGAR = dict(SUGAR, processing_score=4, health_impact_score=4, nutrient_density_score=1)
+
+def test_valid_analysis():
+    assert validate({"ingredients": [SUGAR]}, ANALYSIS_SCHEMA) == []
+    assert validate({"ingredients": [SCORED_SUGAR]}, DETAILED_ANALYSIS_SCHEMA) == []
+
+@pytest.mark.parametrize("value, message", [
+    ([], "$: expected object"),
+    ({}, "missing required field 'ingredients'"),
+    ({"ingredients": [{"name": "Sugar"}]}, "$.ingredients[0]: missing required field 'category'"),
+    ({"ingredients": [dict(SUGAR, category="Sweet")]}, "'Sweet' is not one of"),
+    ({"ingredients": [dict(SUGAR, name=5)]}, "$.ingredients[0].name: expected string, got int"),
+])
+def test_validate_errors(value, message):
+    errors = validate(value, ANALYSIS_SCHEMA)
+    assert any(message in error for error in errors), errors
+
+def test_score_range_and_type():
+    out_of_range = {"ingredients": [dict(SCORED_SUGAR, processing_score=6)]}
+    assert validate(out_of_range, DETAILED_ANALYSIS_SCHEMA) == ["$.ingredients[0].processing_score: 6 is above 5"]
+    boolean = {"ingredients": [dict(SCORED_SUGAR, health_impact_score=True)]}
+    assert validate(boolean, DETAILED_ANALYSIS_SCHEMA) == [
+        "$.ingredients[0].health_impact_score: expected integer, got boolean"
+    ]
+
+def test_batch_schema():
+    schema = batch_schema(2)
+    assert schema["required"] == ["p1", "p2"]
+    assert validate({"p1": {"ingredients": [SUGAR]}, "p2": {"ingredients": []}}, schema) == []
+    assert validate({"p1": {"ingredients": []}}, schema) == ["$: missing required field 'p2'"]
+
+def test_parser_returns_value_and_counts():
+    parser = ResponseParser()
+    text = json.dumps({"ingredients": [SUGAR]})
+    assert parser.parse(text, ANALYSIS_SCHEMA) == {"ingredients": [SUGAR]}
+
+    with pytest.raises(AnalysisParseError, match="Invalid JSON"):
+        parser.parse('```json\n{"ingredients": []}\n```', ANALYSIS_SCHEMA)
+    with pytest.raises(AnalysisParseError, match="does not match the schema"):
+        parser.parse('{"ingredients": [{"name": "Sugar"}]}', ANALYSIS_SCHEMA)
+    with pytest.raises(AnalysisParseError):
+        parser.parse(None, ANALYSIS_SCHEMA)
+
+    assert parser.stats() == {'parsed': 1, 'failed': 3, 'failure_rate': 0.75}
+
+def test_parse_error_is_a_value_error():
+    """Callers that catch ValueError keep handling parse failures"""
+    assert issubclass(AnalysisParseError, ValueError)
+    assert ResponseParser().stats()['failure_rate'] == 0.0
+
+if __name__ == "__main__":
+    pytest.main([__file__])
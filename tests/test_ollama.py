@@ -3,17 +3,21 @@ import sys
 import json
 import requests
 
+# Add parent directory to path to import the shared LLM client
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from services.llm_client import get_llm_client
+
 def test_ollama_connection():
     """Test if Ollama is running and accessible"""
     try:
-        response = requests.get("http://localhost:11434/api/tags")
-        if response.status_code == 200:
-            models = response.json().get('models', [])
-            return {
-                'success': True,
-                'models': models,
-                'error': None
-            }
+        models = get_llm_client().tags()
+        return {
+            'success': True,
+            'models': models,
+            'error': None
+        }
     except Exception as e:
         return {
             'success': False,
@@ -89,13 +93,13 @@ Remember: ONLY return the JSON object, no other text."""
         }
         
         print("Sending request to Ollama...")
-        response = requests.post("http://localhost:11434/api/generate", json=payload)
-        
-        if response.status_code != 200:
+        try:
+            response = get_llm_client().generate(payload, stream=False)
+        except requests.exceptions.HTTPError as e:
             return {
                 'success': False,
                 'result': None,
-                'error': f"Ollama API error: {response.status_code}"
+                'error': f"Ollama API error: {e.response.status_code}"
             }
         
         result = response.json()
@@ -0,0 +1,68 @@
+import os
+import sys
+import datetime
+import pytest
+from bson import ObjectId
+
+# Add parent directory to path to import the models
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from models import encode_cursor, decode_cursor, cursor_filter, admin_analysis_row
+
+def test_cursor_round_trip():
+    """A date cursor decodes to the same created_at and _id"""
+    analysis = {"_id": ObjectId(), "created_at": datetime.datetime(2024, 12, 25, 10, 30, 15, 123000)}
+    created_at, last_id = decode_cursor(encode_cursor(analysis))
+    assert created_at == analysis["created_at"]
+    assert last_id == analysis["_id"]
+
+def test_cursor_for_legacy_analyses():
+    """String and missing created_at values encode without error and keep their position"""
+    legacy = {"_id": ObjectId(), "created_at": "2024-01-05 08:00:00"}
+    assert decode_cursor(encode_cursor(legacy)) == ("2024-01-05 08:00:00", legacy["_id"])
+
+    undated = {"_id": ObjectId()}
+    assert decode_cursor(encode_cursor(undated)) == (None, undated["_id"])
+
+def test_cursor_filter_reaches_later_types():
+    """Rows that sort after the cursor's type stay reachable"""
+    last_id = ObjectId()
+    after_date = cursor_filter(datetime.datetime(2024, 1, 1), last_id)
+    assert {"created_at": {"$not": {"$type": "date"}}} in after_date["$or"]
+
+    after_string = cursor_filter("2024-01-05 08:00:00", last_id)
+    assert {"created_at": {"$not": {"$type": ["date", "string"]}}} in after_string["$or"]
+
+    after_missing = cursor_filter(None, last_id)
+    assert after_missing["_id"] == {"$lt": last_id}
+
+@pytest.mark.parametrize("token", ["", "not-a-cursor", "e30", "eyJpZCI6ICJ4In0"])
+def test_malformed_cursor(token):
+    """Garbage, empty payloads and bad ids raise ValueError"""
+    with pytest.raises(ValueError):
+        decode_cursor(token)
+
+@pytest.mark.parametrize("created_at, expected", [
+    (datetime.datetime(2024, 12, 25, 10, 30), "2024-12-25T10:30:00"),
+    ("2024-01-05 08:00:00", "2024-01-05T08:00:00"),
+    ("yesterday", None),
+    (None, None),
+])
+def test_admin_row_for_legacy_analyses(created_at, expected):
+    """The admin listing serializes the same legacy rows the cursors page over"""
+    analysis = {"_id": ObjectId(), "ingredients": [{"is_harmful": True}, {}]}
+    if created_at is not None:
+        analysis["created_at"] = created_at
+    row = admin_analysis_row(analysis)
+    assert row["created_at"] == expected
+    assert row["product_name"] == "Unnamed Product"
+    assert row["health_score"] == 0
+    assert row["ingredients_count"] == 2
+    assert row["harmful_ingredients"] == 1
+
+if __name__ == "__main__":
+    test_cursor_round_trip()
+    test_cursor_for_legacy_analyses()
+    test_cursor_filter_reaches_later_types()
+    print("Pagination cursor tests passed")
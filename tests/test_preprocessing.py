@@ -0,0 +1,45 @@
+import os
+import sys
+import numpy as np
+import pytest
+from io import BytesIO
+from PIL import Image
+
+# Add parent directory to path to import the services
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from services.config import Config
+from services.preprocessing import open_image, to_gray, normalize_resolution
+
+def jpeg_bytes(width, height):
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, 'JPEG', quality=80)
+    return buffer.getvalue()
+
+def test_phone_photo_is_decoded_at_half_size():
+    """A 4032x3024 12MP photo is decoded at 2016x1512, still wide enough for the pipeline"""
+    image = open_image(jpeg_bytes(4032, 3024))
+    assert image.size == (2016, 1512)
+    assert image.width >= Config.OCR_MIN_WIDTH
+
+    # normalize_resolution never needs more than the decoded width
+    gray = normalize_resolution(to_gray(image.convert('RGB')))
+    assert gray.shape[1] >= Config.OCR_MIN_WIDTH
+
+def test_narrow_jpeg_is_decoded_at_full_size():
+    """Half of 3000 px is below the working width, so the photo is left alone"""
+    assert open_image(jpeg_bytes(3000, 2000)).size == (3000, 2000)
+
+def test_explicit_width():
+    assert open_image(jpeg_bytes(4032, 3024), max_width=1000).size == (1008, 756)
+
+def test_png_is_not_drafted():
+    buffer = BytesIO()
+    Image.new('RGB', (4032, 3024), 'white').save(buffer, 'PNG')
+    assert open_image(buffer.getvalue()).size == (4032, 3024)
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,65 @@
+import os
+import sys
+import pytest
+
+# Add parent directory to path to import the services
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from services.scoring import estimate_proportions, score_analysis, ingredient_health_score, SCORING_VERSION
+from services.llm_schema import CATEGORIES
+
+def test_proportions_follow_label_order():
+    """Undeclared shares fall off by position and sum to 100"""
+    shares = estimate_proportions(["Potatoes", "Sunflower Oil", "Salt"])
+    assert shares == sorted(shares, reverse=True)
+    assert sum(shares) == pytest.approx(100, abs=0.05)
+
+def test_declared_percentages_are_kept_and_cap_later_ingredients():
+    """Printed percentages are used as is, and nothing after one gets more than it"""
+    shares = estimate_proportions(["Wheat Flour (62%)", "Sugar", "Palm Oil", "Salt (1%)", "Spices"])
+    assert shares[0] == 62.0
+    assert shares[3] == 1.0
+    assert shares[4] <= 1.0
+    assert sum(shares) == pytest.approx(100, abs=0.05)
+
+def test_declared_percentages_over_100_are_scaled():
+    assert estimate_proportions(["Milk (80%)", "Cocoa (40%)"]) == [66.67, 33.33]
+
+def test_no_ingredients():
+    assert estimate_proportions([]) == []
+
+def test_score_analysis():
+    """Percentages and the category score are computed from the labels alone"""
+    analysis = score_analysis([
+        {"name": "Water", "category": "Natural"},
+        {"name": "Sugar", "category": "Highly Processed"}
+    ])
+    assert set(analysis["ingredient_percentages"]) == set(CATEGORIES)
+    assert analysis["ingredient_percentages"]["Natural"] == 66.7
+    assert analysis["ingredient_percentages"]["Highly Processed"] == 33.3
+    assert [ingredient["percentage"] for ingredient in analysis["ingredients"]] == [66.67, 33.33]
+    assert 0 <= analysis["health_score"] <= 10
+    assert analysis["scoring_version"] == SCORING_VERSION
+
+def test_ingredient_health_score():
+    """Best scores give 10, worst give 0"""
+    best = {"name": "Oats", "category": "Natural", "percentage": 100,
+            "processing_score": 1, "health_impact_score": 1, "nutrient_density_score": 5}
+    worst = dict(best, processing_score=5, health_impact_score=5, nutrient_density_score=1)
+    assert ingredient_health_score([best]) == 10.0
+    assert ingredient_health_score([worst]) == 0.0
+
+def test_ingredient_health_score_without_scores_is_a_number():
+    """Ingredients without 1-5 scores fall back to the category score, 5 when nothing is labelled"""
+    assert ingredient_health_score([]) == 5.0
+    assert isinstance(ingredient_health_score([{"name": "Salt", "category": "Natural", "percentage": 100}]), float)
+
+if __name__ == "__main__":
+    test_proportions_follow_label_order()
+    test_declared_percentages_are_kept_and_cap_later_ingredients()
+    test_declared_percentages_over_100_are_scaled()
+    test_score_analysis()
+    test_ingredient_health_score()
+    test_ingredient_health_score_without_scores_is_a_number()
+    print("Scoring tests passed")
@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+import threading
+import pytest
+
+# Add parent directory to path to import the services
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from services.single_flight import SingleFlight
+
+def run_concurrently(flight, compute, callers=5, lookup=None):
+    """Start callers for the same key while compute is blocked; returns results and errors"""
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(flight.do('key', compute, lookup=lookup))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+def wait_for_waiters(flight, count, timeout=5):
+    """Wait until count callers have joined the flight in progress"""
+    deadline = time.time() + timeout
+    while flight.stats()['coalesced'] < count and time.time() < deadline:
+        time.sleep(0.01)
+
+def test_concurrent_callers_share_one_computation():
+    flight = SingleFlight('test')
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {'text': 'Sugar, Salt'}
+
+    threads, results, errors = run_concurrently(flight, compute)
+    started.wait(5)
+    # Let the other callers join the flight before it finishes
+    wait_for_waiters(flight, len(threads) - 1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert not errors
+    assert results == [{'text': 'Sugar, Salt'}] * len(threads)
+    assert flight.stats()['in_flight'] == 0
+
+def test_every_caller_gets_its_own_copy():
+    flight = SingleFlight('test')
+    shared = {'ingredients': ['Sugar']}
+    first = flight.do('key', lambda: shared)
+    first['ingredients'].append('Salt')
+    assert shared == {'ingredients': ['Sugar']}
+
+def test_exception_reaches_every_caller():
+    flight = SingleFlight('test')
+    started = threading.Event()
+    release = threading.Event()
+
+    def compute():
+        started.set()
+        release.wait(5)
+        raise ValueError("No text could be extracted from the image")
+
+    threads, results, errors = run_concurrently(flight, compute, callers=3)
+    started.wait(5)
+    wait_for_waiters(flight, len(threads) - 1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert not results
+    assert len(errors) == 3
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert flight.stats()['in_flight'] == 0
+
+def test_lookup_result_skips_compute(tmp_path):
+    """A result stored by another worker is used instead of computing again"""
+    flight = SingleFlight('test', lock_dir=str(tmp_path))
+
+    def compute():
+        raise AssertionError("compute should not run")
+
+    assert flight.do('key', compute, lookup=lambda: {'text': 'stored'}) == {'text': 'stored'}
+    assert flight.stats()['found_in_store'] == 1
+
+def test_empty_lookup_computes(tmp_path):
+    flight = SingleFlight('test', lock_dir=str(tmp_path))
+    assert flight.do('key', lambda: 'computed', lookup=lambda: None) == 'computed'
+    assert flight.stats()['computed'] == 1
+
+if __name__ == "__main__":
+    pytest.main([__file__])
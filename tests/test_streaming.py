@@ -0,0 +1,82 @@
+import os
+import sys
+import json
+import pytest
+
+# Add parent directory to path to import the services
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from services.streaming import JSONObjectScanner, read_json_stream
+
+def feed_all(chunks):
+    scanner = JSONObjectScanner()
+    completed_at = None
+    for i, chunk in enumerate(chunks):
+        if scanner.feed(chunk) and completed_at is None:
+            completed_at = i
+    return scanner, completed_at
+
+def test_completes_on_closing_brace():
+    scanner, completed_at = feed_all(['{"ingredients": [', '{"name": "Sugar"}', ']}', ' trailing'])
+    assert completed_at == 2
+    assert json.loads(scanner.result()) == {"ingredients": [{"name": "Sugar"}]}
+
+def test_braces_and_escaped_quotes_inside_strings_are_ignored():
+    text = '{"name": "Sugar {refined}", "note": "a \\"}\\" quote"}'
+    scanner, completed_at = feed_all([text[:10], text[10:25], text[25:]])
+    assert completed_at == 2
+    assert json.loads(scanner.result())["note"] == 'a "}" quote'
+
+def test_think_block_is_skipped_even_when_split():
+    chunks = ['  <thi', 'nk>draft {"name": "x"} </th', 'ink>', 'Answer: {"a": 1}']
+    scanner, completed_at = feed_all(chunks)
+    assert completed_at == 3
+    assert scanner.result() == '{"a": 1}'
+
+def test_partial_and_incomplete_result():
+    scanner, completed_at = feed_all(['Here you go: {"ingredients": [{"name": "Salt"'])
+    assert completed_at is None
+    assert scanner.result() is None
+    assert scanner.partial() == '{"ingredients": [{"name": "Salt"'
+
+class FakeResponse:
+    def __init__(self, messages):
+        self.lines = [json.dumps(message).encode() for message in messages]
+        self.read = 0
+        self.closed = False
+
+    def iter_lines(self):
+        for line in self.lines:
+            self.read += 1
+            yield line
+
+    def close(self):
+        self.closed = True
+
+def test_read_json_stream_stops_after_the_object():
+    messages = [{'response': '{"a": '}, {'response': '1}'}] + [{'response': ' more'}] * 50
+    response = FakeResponse(messages)
+    stats = {}
+    assert read_json_stream(response, stats=stats, tail_chunks=2) == '{"a": 1}'
+    assert response.closed
+    assert response.read < len(messages)
+    assert 'eval_count' not in stats
+
+def test_read_json_stream_collects_token_counts_and_progress():
+    messages = [{'response': '{"ingredients": [{"name": "Sugar"}'}, {'response': ']}'},
+                {'done': True, 'prompt_eval_count': 12, 'eval_count': 7}]
+    updates = []
+    stats = {}
+    result = read_json_stream(FakeResponse(messages), on_progress=updates.append, stats=stats)
+    assert json.loads(result) == {"ingredients": [{"name": "Sugar"}]}
+    assert stats == {'prompt_eval_count': 12, 'eval_count': 7, 'chunks': 3}
+    assert updates[-1]['ingredients'] == ['Sugar']
+    assert updates[-1]['phase'] == 'generating'
+
+def test_read_json_stream_falls_back_to_raw_text():
+    messages = [{'response': 'not json'}, {'done': True}]
+    assert read_json_stream(FakeResponse(messages)) == 'not json'
+
+if __name__ == "__main__":
+    pytest.main([__file__])